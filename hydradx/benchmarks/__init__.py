@@ -0,0 +1,84 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+from .workloads import benchmarks, benchmark
+
+
+def _commit() -> str or None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names: list[str] = None, repeats: int = 5, silent: bool = True) -> dict:
+    """
+    Time each benchmark (all of them by default) repeats times, each on a freshly set up workload.
+    Returns the results along with the commit and Python version they were measured on.
+    """
+    names = names or list(benchmarks)
+    unknown = [name for name in names if name not in benchmarks]
+    if unknown:
+        raise ValueError(f'Unknown benchmarks: {unknown}')
+    results = {}
+    for name in names:
+        times = []
+        for _ in range(repeats):
+            work, ops = benchmarks[name]()
+            start = time.perf_counter()
+            work()
+            times.append(time.perf_counter() - start)
+        results[name] = {
+            'times': times,
+            'min': min(times),
+            'median': statistics.median(times),
+            'mean': statistics.mean(times),
+            'ops': ops,
+            'per_op': min(times) / ops,
+        }
+        if not silent:
+            print(f'{name}: {round(results[name]["min"], 4)} s ({results[name]["per_op"] * 1e6:.1f} us / op)')
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'repeats': repeats,
+        'benchmarks': results,
+    }
+
+
+def save_results(results: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base: dict, new: dict, threshold: float = 0.1) -> dict:
+    """
+    Compare the minimum time of every benchmark present in both results.
+    A benchmark has regressed if it got slower by more than threshold (as a fraction of the base time).
+    Returns {name: {'base', 'new', 'change', 'regression'}}.
+    """
+    comparison = {}
+    for name, base_result in base['benchmarks'].items():
+        if name not in new['benchmarks']:
+            continue
+        new_result = new['benchmarks'][name]
+        # compare per operation, in case a workload was resized between the two commits
+        change = new_result['per_op'] / base_result['per_op'] - 1
+        comparison[name] = {
+            'base': base_result['per_op'],
+            'new': new_result['per_op'],
+            'change': change,
+            'regression': change > threshold,
+        }
+    return comparison
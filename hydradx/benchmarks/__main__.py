@@ -0,0 +1,47 @@
+"""
+python -m hydradx.benchmarks run [-o results.json] [-r repeats] [names...]
+python -m hydradx.benchmarks compare base.json new.json [-t threshold]
+
+compare exits with status 1 if any benchmark got slower by more than the threshold.
+"""
+import argparse
+import sys
+
+from . import benchmarks, run_benchmarks, save_results, load_results, compare
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m hydradx.benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run benchmarks and save the results as JSON')
+    run_parser.add_argument('names', nargs='*', help=f'benchmarks to run (default: all of {", ".join(benchmarks)})')
+    run_parser.add_argument('-o', '--output', help='file to save the results to')
+    run_parser.add_argument('-r', '--repeats', type=int, default=5)
+
+    compare_parser = commands.add_parser('compare', help='compare two sets of saved results')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run_benchmarks(args.names, repeats=args.repeats, silent=False)
+        if args.output:
+            save_results(results, args.output)
+        return 0
+
+    base, new = load_results(args.base), load_results(args.new)
+    comparison = compare(base, new, threshold=args.threshold)
+    print(f'{(base["commit"] or "?")[:10]} -> {(new["commit"] or "?")[:10]}')
+    for name, result in comparison.items():
+        flag = '  REGRESSION' if result['regression'] else ''
+        print(
+            f'{name}: {result["base"] * 1e6:.1f} -> {result["new"] * 1e6:.1f} us / op '
+            f'({result["change"]:+.1%}){flag}'
+        )
+    return 1 if any(result['regression'] for result in comparison.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
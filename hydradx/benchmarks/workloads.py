@@ -0,0 +1,346 @@
+import random
+import warnings
+from typing import Callable
+
+from hypothesis import given, settings, Phase, HealthCheck
+
+from hydradx.model.amm.agents import Agent
+from hydradx.model.amm import arbitrage_agent, arbitrage_agent_general
+from hydradx.model.amm.centralized_market import CentralizedMarket, OrderBook
+from hydradx.model.amm.global_state import GlobalState, fluctuate_prices
+from hydradx.model.amm.omnipool_amm import OmnipoolState
+from hydradx.model.amm.price_paths import PricePaths
+from hydradx.model.amm.trade_strategies import random_swaps, omnipool_arbitrage, invest_all
+from hydradx.model import ensemble
+from hydradx.model.processing import postprocessing
+from hydradx.model.run import run
+from hydradx.tests.strategies_omnipool import omnipool_reasonable_config, omnipool_config, stableswap_config
+
+# name: setup function, which returns (work, number of operations work performs)
+benchmarks: dict[str, Callable[[], tuple[Callable, int]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup: Callable[[], tuple[Callable, int]]):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+
+def example(strategy, index: int = 0):
+    """
+    Draw a reproducible example from a hypothesis strategy: the same index always gives the same value.
+    """
+    found = []
+
+    @settings(
+        derandomize=True, database=None, max_examples=index + 1, phases=[Phase.generate],
+        suppress_health_check=list(HealthCheck), deadline=None
+    )
+    @given(strategy)
+    def draw(value):
+        found.append(value)
+
+    with warnings.catch_warnings():
+        # some of the strategies use the random module, which hypothesis seeds deterministically
+        warnings.simplefilter('ignore')
+        draw()
+    return found[-1]
+
+
+def canonical_omnipool() -> OmnipoolState:
+    return example(omnipool_reasonable_config(token_count=5, lrna_fee=0.0005, asset_fee=0.0025), index=3)
+
+
+def canonical_state(archive_all: bool = True) -> GlobalState:
+    omnipool = canonical_omnipool()
+    prices = {tkn: omnipool.usd_price(omnipool, tkn) for tkn in omnipool.asset_list}
+    return GlobalState(
+        pools={'omnipool': omnipool},
+        agents={
+            'trader': Agent(
+                holdings={tkn: 1000000 / prices[tkn] for tkn in omnipool.asset_list},
+                trade_strategy=random_swaps(pool_id='omnipool', amount={tkn: 1000 for tkn in omnipool.asset_list})
+            ),
+            'arbitrageur': Agent(
+                holdings={tkn: 1e15 for tkn in omnipool.asset_list + ['LRNA']},
+                trade_strategy=omnipool_arbitrage(pool_id='omnipool')
+            ),
+            'lp': Agent(
+                holdings={tkn: 10000 / prices[tkn] for tkn in omnipool.asset_list},
+                trade_strategy=invest_all(pool_id='omnipool')
+            )
+        },
+        external_market=prices,
+        evolve_function=fluctuate_prices(volatility={tkn: 0.5 for tkn in omnipool.asset_list}),
+        archive_all=archive_all
+    )
+
+
+def order_book(mid_price: float, levels: int, spread: float = 0.001, depth: float = 10) -> OrderBook:
+    return OrderBook(
+        bids=[[mid_price * (1 - spread * (i + 1)), depth] for i in range(levels)],
+        asks=[[mid_price * (1 + spread * (i + 1)), depth] for i in range(levels)]
+    )
+
+
+def arbitrage_market() -> tuple[OmnipoolState, CentralizedMarket]:
+    # the same market as in test_get_arb_swaps, with the centralized prices off by a few percent
+    omnipool = OmnipoolState(
+        tokens={
+            'USDT': {'liquidity': 2062772, 'LRNA': 2062772},
+            'DOT': {'liquidity': 350000, 'LRNA': 1456248},
+            'HDX': {'liquidity': 108000000, 'LRNA': 494896}
+        },
+        lrna_fee=0.0005,
+        asset_fee=0.0025,
+        preferred_stablecoin='USDT',
+    )
+    cex = CentralizedMarket(
+        order_book={
+            ('DOT', 'USDT'): order_book(omnipool.price(omnipool, 'DOT', 'USDT') * 1.05, 8, 0.005, 1000),
+            ('HDX', 'USDT'): order_book(omnipool.price(omnipool, 'HDX', 'USDT') * 0.95, 8, 0.005, 100000),
+            ('HDX', 'DOT'): order_book(omnipool.price(omnipool, 'HDX', 'DOT') * 1.02, 4, 0.01, 100000)
+        },
+        asset_list=['USDT', 'DOT', 'HDX'],
+        trade_fee=0.0016
+    )
+    return omnipool, cex
+
+
+@benchmark('omnipool_swap_direct')
+def omnipool_swap_direct():
+    omnipool = canonical_omnipool()
+    tkn_1, tkn_2 = omnipool.asset_list[2], omnipool.asset_list[3]
+    agent = Agent(holdings={tkn: 1e12 for tkn in omnipool.asset_list})
+    n = 200
+
+    def work():
+        for i in range(n):
+            tkn_sell, tkn_buy = (tkn_1, tkn_2) if i % 2 == 0 else (tkn_2, tkn_1)
+            omnipool.swap(agent, tkn_buy=tkn_buy, tkn_sell=tkn_sell, sell_quantity=100)
+    return work, n
+
+
+@benchmark('omnipool_swap_lrna')
+def omnipool_swap_lrna():
+    omnipool = canonical_omnipool()
+    tkn = omnipool.asset_list[2]
+    agent = Agent(holdings={'LRNA': 1e12})
+    n = 200
+
+    def work():
+        for i in range(n):
+            omnipool.swap(agent, tkn_buy=tkn, tkn_sell='LRNA', sell_quantity=10)
+    return work, n
+
+
+@benchmark('omnipool_swap_subpool')
+def omnipool_swap_subpool():
+    omnipool = example(omnipool_config(
+        token_count=3, lrna_fee=0.0005, asset_fee=0.0025,
+        sub_pools={'stableswap': {'token_count': 3, 'trade_fee': 0.0005, 'amplification': 100}}
+    ), index=2)
+    stable_pool = omnipool.sub_pools['stableswap']
+    tkn_omnipool, tkn_stable = omnipool.asset_list[2], stable_pool.asset_list[0]
+    agent = Agent(holdings={tkn: 1e12 for tkn in omnipool.asset_list + stable_pool.asset_list})
+    n = 20
+
+    def work():
+        for i in range(n):
+            tkn_sell, tkn_buy = (tkn_stable, tkn_omnipool) if i % 2 == 0 else (tkn_omnipool, tkn_stable)
+            omnipool.swap(agent, tkn_buy=tkn_buy, tkn_sell=tkn_sell, sell_quantity=10)
+    return work, n
+
+
+@benchmark('stableswap_calculate_d')
+def stableswap_calculate_d():
+    pool = example(stableswap_config(token_count=4, amplification=100, trade_fee=0.0005), index=3)
+    reserves = [float(x) for x in pool.liquidity.values()]
+    n = 500
+
+    def work():
+        for i in range(n):
+            pool.calculate_d(reserves)
+    return work, n
+
+
+@benchmark('stableswap_calculate_y')
+def stableswap_calculate_y():
+    pool = example(stableswap_config(token_count=4, amplification=100, trade_fee=0.0005), index=3)
+    reserves = [float(x) for x in pool.liquidity.values()]
+    d = pool.calculate_d(reserves)
+    n = 500
+
+    def work():
+        for i in range(n):
+            pool.calculate_y(reserves[:-1], d)
+    return work, n
+
+
+@benchmark('centralized_market_swap')
+def centralized_market_swap():
+    market = CentralizedMarket(
+        order_book={('DOT', 'USDT'): order_book(5, levels=2000, spread=0.0001, depth=10)},
+        asset_list=['USDT', 'DOT'],
+        trade_fee=0.0016
+    )
+    agent = Agent(holdings={'USDT': 1e12, 'DOT': 1e12})
+    n = 10
+
+    def work():
+        # each trade eats through about twenty levels of the book
+        for i in range(n):
+            if i % 2 == 0:
+                market.swap(agent, tkn_sell='DOT', tkn_buy='USDT', sell_quantity=200)
+            else:
+                market.swap(agent, tkn_sell='USDT', tkn_buy='DOT', sell_quantity=1000)
+    return work, n
+
+
+@benchmark('arbitrage_agent_get_arb_swaps')
+def arbitrage_agent_get_arb_swaps():
+    omnipool, cex = arbitrage_market()
+    config = [
+        {'tkn_pair': pair, 'exchange': 'cex', 'order_book': pair, 'buffer': 0.0} for pair in cex.order_book
+    ]
+    n = 3
+
+    def work():
+        for i in range(n):
+            arbitrage_agent.get_arb_swaps(omnipool, {'cex': cex}, config)
+    return work, n
+
+
+@benchmark('arbitrage_agent_general_get_arb_swaps')
+def arbitrage_agent_general_get_arb_swaps():
+    omnipool, cex = arbitrage_market()
+    config = [{'exchanges': {'dex': pair, 'cex': pair}, 'buffer': 0.0} for pair in cex.order_book]
+    n = 3
+
+    def work():
+        for i in range(n):
+            arbitrage_agent_general.get_arb_swaps({'dex': omnipool, 'cex': cex}, config)
+    return work, n
+
+
+@benchmark('global_state_copy')
+def global_state_copy():
+    state = canonical_state()
+    n = 100
+
+    def work():
+        for i in range(n):
+            state.copy()
+    return work, n
+
+
+@benchmark('global_state_copy_30_assets')
+def global_state_copy_30_assets():
+    omnipool = example(omnipool_config(
+        token_count=30, lrna_fee=0.0005, asset_fee=0.0025,
+        sub_pools={
+            'stableswap_1': {'token_count': 4, 'trade_fee': 0.0005, 'amplification': 100},
+            'stableswap_2': {'token_count': 3, 'trade_fee': 0.0005, 'amplification': 50}
+        }
+    ), index=1)
+    tokens = omnipool.asset_list + [tkn for pool in omnipool.sub_pools.values() for tkn in pool.asset_list]
+    state = GlobalState(
+        pools={'omnipool': omnipool},
+        agents={f'agent_{i}': Agent(holdings={tkn: 1000 for tkn in tokens}) for i in range(10)},
+        external_market={tkn: 1 for tkn in tokens}
+    )
+    n = 20
+
+    def work():
+        for i in range(n):
+            state.copy()
+    return work, n
+
+
+@benchmark('postprocessing')
+def postprocessing_benchmark():
+    random.seed(0)
+    events = run(canonical_state(), time_steps=50, silent=True)
+
+    def work():
+        postprocessing(events, optional_params=['deposit_val', 'holdings_val', 'pool_val', 'trade_volume'])
+    return work, len(events)
+
+
+@benchmark('postprocessing_many_agents')
+def postprocessing_many_agents():
+    tokens = ['HDX', 'USD'] + [f'TKN{i}' for i in range(28)]
+    omnipool = OmnipoolState(
+        tokens={tkn: {'liquidity': 1000000, 'LRNA': 1000000} for tkn in tokens}, preferred_stablecoin='USD'
+    )
+    agents = {f'agent_{i}': Agent(holdings={tkn: 100 for tkn in tokens}) for i in range(50)}
+    state = GlobalState(pools={'omnipool': omnipool}, agents=agents, external_market={tkn: 1 for tkn in tokens})
+    for i, agent in enumerate(agents.values()):
+        omnipool.add_liquidity(agent, 10, tokens[i % len(tokens)])
+    events = [state.copy() for _ in range(20)]
+
+    def work():
+        postprocessing(events, optional_params=['impermanent_loss', 'holdings_val', 'pool_val', 'trade_volume'])
+    return work, len(events) * len(agents)
+
+
+@benchmark('run')
+def run_benchmark():
+    state = canonical_state()
+
+    def work():
+        random.seed(0)
+        run(state, time_steps=200, silent=True)
+    return work, 200
+
+
+@benchmark('run_archive_states')
+def run_archive_states_benchmark():
+    state = canonical_state(archive_all=False)
+
+    def work():
+        random.seed(0)
+        run(state, time_steps=200, silent=True)
+    return work, 200
+
+
+@benchmark('run_fast_forward')
+def run_fast_forward_benchmark():
+    omnipool = canonical_omnipool()
+    prices = {tkn: omnipool.usd_price(omnipool, tkn) for tkn in omnipool.asset_list}
+    paths = PricePaths.random_walk(prices, 2000, {tkn: 0.5 for tkn in omnipool.asset_list}, seed=0)
+    state = GlobalState(
+        pools={'omnipool': omnipool},
+        agents={'arbitrageur': Agent(
+            holdings={tkn: 1e15 for tkn in omnipool.asset_list + ['LRNA']},
+            trade_strategy=omnipool_arbitrage(pool_id='omnipool', frequency=50)
+        )},
+        external_market=prices,
+        evolve_function=paths.evolve_function()
+    )
+
+    def work():
+        run(state, time_steps=2000, silent=True, fast_forward=True)
+    return work, 2000
+
+
+@benchmark('omnipool_ensemble')
+def omnipool_ensemble():
+    omnipool = canonical_omnipool()
+    prices = {tkn: omnipool.usd_price(omnipool, tkn) for tkn in omnipool.asset_list}
+    paths = PricePaths.random_walk(prices, 50, {tkn: 0.5 for tkn in omnipool.asset_list}, n_paths=1000, seed=0)
+    agents = {
+        'trader': Agent(holdings={tkn: 1000000 / prices[tkn] for tkn in omnipool.asset_list}),
+        'arbitrageur': Agent(holdings={tkn: 1e15 for tkn in omnipool.asset_list + ['LRNA']})
+    }
+    strategies = {
+        'trader': ensemble.random_swaps(amount={tkn: 1000 for tkn in omnipool.asset_list}),
+        'arbitrageur': ensemble.omnipool_arbitrage()
+    }
+
+    def work():
+        ensemble.OmnipoolEnsemble(omnipool, agents, 1000, external_market=prices).run(
+            50, strategies, prices=paths, seed=0, record=False
+        )
+    return work, 50 * 1000
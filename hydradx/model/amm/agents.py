@@ -49,16 +49,14 @@ class Agent:
                 ) + ')\n')
 
     def copy(self):
-        copy_self = Agent(
-            holdings={k: v for k, v in self.holdings.items()},
-            share_prices={k: v for k, v in self.share_prices.items()},
-            delta_r={k: v for k, v in self.delta_r.items()},
-            trade_strategy=self.trade_strategy,
-            unique_id=self.unique_id,
-            nfts={id: copy.deepcopy(nft) for id, nft in self.nfts.items()}
-        )
-        copy_self.initial_holdings = {k: v for k, v in self.initial_holdings.items()}
-        copy_self.asset_list = [tkn for tkn in self.asset_list]
+        copy_self = object.__new__(type(self))
+        copy_self.__dict__.update(self.__dict__)
+        copy_self.holdings = self.holdings.copy()
+        copy_self.share_prices = self.share_prices.copy()
+        copy_self.delta_r = self.delta_r.copy()
+        copy_self.nfts = {id: copy.deepcopy(nft) for id, nft in self.nfts.items()}
+        copy_self.initial_holdings = self.initial_holdings.copy()
+        copy_self.asset_list = self.asset_list.copy()
         return copy_self
         # return copy.deepcopy(self)
 
@@ -1,5 +1,8 @@
 from .agents import Agent
 import copy
+import types
+from contextlib import contextmanager
+from numbers import Number
 from typing import Callable
 
 
@@ -14,6 +17,7 @@ class FeeMechanism:
     def assign(self, exchange, tkn=''):
         self.exchange = exchange
         self.tkn = tkn
+        self.block_fee = None
         return self
 
     def compute(self, tkn: str = '', delta_tkn: float = 0) -> float:
@@ -23,25 +27,178 @@ class FeeMechanism:
             delta_tkn=delta_tkn
         )
 
+    # fees which can skip ahead over blocks with no trades (see OmnipoolState.fast_forward) replace this with
+    # a method fast_forward(blocks, block) returning the fee after that many blocks
+    fast_forward = None
+    # fees which only change from block to block, not from trade to trade, set this, so that an OmnipoolState
+    # can work them out once per block and keep them in block_fee, instead of computing them on every trade
+    block_constant = False
+    block_fee = None
+
+
+# types whose instances are immutable, so copies can share them
+_atomic_types = {
+    int, float, bool, complex, str, bytes, type(None), range, type,
+    types.FunctionType, types.BuiltinFunctionType
+}
+_plain_types = {}
+
+
+def _is_atomic(value) -> bool:
+    if type(value) in _atomic_types:
+        return True
+    if isinstance(value, Number):
+        # e.g. mpf and numpy scalars
+        _atomic_types.add(type(value))
+        return True
+    return False
+
+
+def _is_plain(cls: type) -> bool:
+    # instances of cls can be copied by copying their __dict__
+    if cls not in _plain_types:
+        _plain_types[cls] = (
+            getattr(cls, '__deepcopy__', None) is None
+            and cls.__reduce_ex__ is object.__reduce_ex__
+            and cls.__reduce__ is object.__reduce__
+            # object.__getstate__ only exists from Python 3.11 on
+            and getattr(cls, '__getstate__', None) in (None, getattr(object, '__getstate__', None))
+            and getattr(cls, '__setstate__', None) is None
+            and not any('__slots__' in base.__dict__ for base in cls.__mro__)
+        )
+    return _plain_types[cls]
+
+
+def fast_copy(obj, memo: dict = None):
+    """
+    Same result as copy.deepcopy(obj), but a good deal faster for the objects pools are made of.
+    Numbers, strings and functions are shared, as deepcopy shares them, so containers holding only those
+    are copied in one go, and other objects are rebuilt from their __dict__ without going through __init__
+    or __setattr__. Bound methods are rebound to the copy of their object (e.g. FeeMechanism.fee_function).
+    Anything else is left to copy.deepcopy.
+    """
+    if _is_atomic(obj):
+        return obj
+    if memo is None:
+        memo = {}
+    key = id(obj)
+    if key in memo:
+        return memo[key]
+    cls = type(obj)
+    if cls is dict:
+        if all(type(value) in _atomic_types for value in obj.values()):
+            result = obj.copy()
+        else:
+            result = memo[key] = {}
+            for k, value in obj.items():
+                result[k] = fast_copy(value, memo)
+    elif cls is list:
+        if all(type(value) in _atomic_types for value in obj):
+            result = obj.copy()
+        else:
+            result = memo[key] = []
+            result.extend(fast_copy(value, memo) for value in obj)
+    elif cls is tuple:
+        result = tuple(fast_copy(value, memo) for value in obj)
+    elif cls is set and all(type(value) in _atomic_types for value in obj):
+        result = obj.copy()
+    elif cls is types.MethodType:
+        result = types.MethodType(obj.__func__, fast_copy(obj.__self__, memo))
+    elif hasattr(obj, '__dict__') and _is_plain(cls):
+        result = memo[key] = object.__new__(cls)
+        result.__dict__.update({name: fast_copy(value, memo) for name, value in obj.__dict__.items()})
+    else:
+        result = copy.deepcopy(obj, memo)
+    memo[key] = result
+    return result
+
+
+def _restore_dict(target: dict, saved: dict):
+    # put saved back into target in place, since other objects (e.g. a Ledger) may hold on to target
+    for key in [key for key in target if key not in saved]:
+        del target[key]
+    target.update(saved)
+
+
+def _save_agent(agent: Agent) -> tuple:
+    return (
+        agent.holdings.copy(), agent.share_prices.copy(), agent.delta_r.copy(),
+        {nft_id: (nft, nft.__dict__.copy()) for nft_id, nft in agent.nfts.items()}
+    )
+
+
+def _restore_agent(agent: Agent, saved: tuple):
+    holdings, share_prices, delta_r, nfts = saved
+    _restore_dict(agent.holdings, holdings)
+    _restore_dict(agent.share_prices, share_prices)
+    _restore_dict(agent.delta_r, delta_r)
+    for nft, nft_dict in nfts.values():
+        nft.__dict__.update(nft_dict)
+    _restore_dict(agent.nfts, {nft_id: nft for nft_id, (nft, _) in nfts.items()})
+
 
 class AMM:
     unique_id: str
     asset_list: list[str]
     liquidity: dict[str: float]
     update_function: Callable = None
+    # the attributes which trades and liquidity changes can modify, which are all that savepoint() saves
+    trade_fields = ('liquidity', 'fail')
 
     def __init__(self):
         self.oracles = None
         self.fail = ''
 
     def copy(self):
-        copy_self = copy.deepcopy(self)
+        copy_self = fast_copy(self)
         copy_self.fail = ''
         return copy_self
 
+    @contextmanager
+    def savepoint(self, *agents: Agent):
+        """
+        Undo everything done to the pool and to agents inside the with block when it exits, e.g.
+            with pool.savepoint(agent):
+                pool.swap(agent, tkn_buy='USD', tkn_sell='DOT', sell_quantity=100)
+                price_after = pool.price(pool, 'DOT', 'USD')
+        Only trade_fields are saved, which makes this much cheaper than trading on a copy,
+        but it won't undo anything else (update(), adding tokens, changing fees...).
+        As with copy(), fail starts out empty.
+        """
+        saved = self._save()
+        saved_agents = [(agent, _save_agent(agent)) for agent in agents]
+        self.fail = ''
+        try:
+            yield self
+        finally:
+            self._restore(saved)
+            for agent, saved_agent in saved_agents:
+                _restore_agent(agent, saved_agent)
+
+    def _save(self) -> dict:
+        return {
+            name: value.copy() if isinstance(value, dict) else value
+            for name, value in ((name, getattr(self, name)) for name in self.trade_fields)
+        }
+
+    def _restore(self, saved: dict):
+        for name, value in saved.items():
+            if isinstance(value, dict):
+                _restore_dict(getattr(self, name), value)
+            else:
+                setattr(self, name, value)
+
     def update(self):
         pass
 
+    def fast_forward(self, blocks: int):
+        """
+        The same as calling update() `blocks` times with no trades in between.
+        """
+        for _ in range(blocks):
+            self.update()
+        return self
+
     @staticmethod
     def price(state, tkn: str, denomination: str = '') -> float:
         return 0
@@ -121,4 +278,5 @@ def basic_fee(f: float = 0) -> FeeMechanism:
         return f
     f_mech = FeeMechanism(fee_function, f"{f * 100}%")
     f_mech.fee = f
+    f_mech.block_constant = True
     return f_mech
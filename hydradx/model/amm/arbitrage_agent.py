@@ -262,7 +262,8 @@ def calculate_arb_amount_bid(
         precision=1e-15,
         max_iters=None
 ):
-    state = init_state.copy()
+    # trial trades are made on init_state itself, inside savepoints which undo them
+    state = init_state
     init_amt = 1000000000
     holdings = {asset: init_amt for asset in [tkn, numeraire]}
     agent = Agent(holdings=holdings, unique_id='bot')
@@ -274,14 +275,15 @@ def calculate_arb_amount_bid(
     # If buying the min amount moves the price too much, return 0
     if min_amt < 1e-18:
         raise
-    test_agent = agent.copy()
-    test_state = state.copy()
-    test_state.swap(test_agent, tkn_buy=tkn, tkn_sell=numeraire, buy_quantity=min_amt)
-    op_spot = OmnipoolState.price(test_state, tkn, numeraire)
+    with state.savepoint(agent):
+        state.swap(agent, tkn_buy=tkn, tkn_sell=numeraire, buy_quantity=min_amt)
+        op_spot = OmnipoolState.price(state, tkn, numeraire)
+        failed = state.fail != ''
+        numeraire_sold = init_amt - agent.holdings[numeraire]
     buy_spot = op_spot / ((1 - lrna_fee) * (1 - asset_fee))
-    if min_amt >= state.liquidity[tkn] or buy_spot > cex_price or test_state.fail != '':
+    if min_amt >= state.liquidity[tkn] or buy_spot > cex_price or failed:
         return 0
-    if agent.holdings[numeraire] - test_agent.holdings[numeraire] > max_liq_num:
+    if numeraire_sold > max_liq_num:
         return 0
 
     op_spot = OmnipoolState.price(state, tkn, numeraire)
@@ -295,15 +297,16 @@ def calculate_arb_amount_bid(
     best_buy_spot = buy_spot
     while cex_price - best_buy_spot > precision:
         if amt < state.liquidity[tkn]:
-            test_agent = agent.copy()
-            test_state = state.copy()
-            test_state.swap(test_agent, tkn_buy=tkn, tkn_sell=numeraire, buy_quantity=amt)
-            op_spot = OmnipoolState.price(test_state, tkn, numeraire)
+            with state.savepoint(agent):
+                state.swap(agent, tkn_buy=tkn, tkn_sell=numeraire, buy_quantity=amt)
+                op_spot = OmnipoolState.price(state, tkn, numeraire)
+                failed = state.fail != ''
+                numeraire_sold = init_amt - agent.holdings[numeraire]
             buy_spot = op_spot / ((1 - lrna_fee) * (1 - asset_fee))
-        if amt >= state.liquidity[tkn] or buy_spot > cex_price or test_state.fail != '':
+        if amt >= state.liquidity[tkn] or buy_spot > cex_price or failed:
             amt_high = amt
         elif buy_spot < cex_price:
-            if agent.holdings[numeraire] - test_agent.holdings[numeraire] > max_liq_num:
+            if numeraire_sold > max_liq_num:
                 # best trade will involve trading max_liquidity, so can be calculated as a sell
                 # test_agent = agent.copy()
                 # test_state = state.copy()
@@ -344,7 +347,8 @@ def calculate_arb_amount_ask(
         precision=1e-15,
         max_iters=None
 ):
-    state = init_state.copy()
+    # trial trades are made on init_state itself, inside savepoints which undo them
+    state = init_state
     init_amt = 1000000000
     holdings = {asset: init_amt for asset in [tkn, numeraire]}
     agent = Agent(holdings=holdings, unique_id='bot')
@@ -356,12 +360,12 @@ def calculate_arb_amount_ask(
     # If buying the min amount moves the price too much, return 0
     if min_amt < 1e-18:
         raise
-    test_agent = agent.copy()
-    test_state = state.copy()
-    test_state.swap(test_agent, tkn_buy=numeraire, tkn_sell=tkn, sell_quantity=min_amt)
-    op_spot = OmnipoolState.price(test_state, tkn, numeraire)
+    with state.savepoint(agent):
+        state.swap(agent, tkn_buy=numeraire, tkn_sell=tkn, sell_quantity=min_amt)
+        op_spot = OmnipoolState.price(state, tkn, numeraire)
+        failed = state.fail != ''
     sell_spot = op_spot * (1 - lrna_fee) * (1 - asset_fee)
-    if min_amt >= state.liquidity[tkn] or sell_spot < cex_price or test_state.fail != '':
+    if min_amt >= state.liquidity[tkn] or sell_spot < cex_price or failed:
         return 0
 
     op_spot = OmnipoolState.price(state, tkn, numeraire)
@@ -374,15 +378,16 @@ def calculate_arb_amount_ask(
     i = 0
     best_sell_spot = sell_spot
     while best_sell_spot - cex_price > precision:
-        test_agent = agent.copy()
-        test_state = state.copy()
-        test_state.swap(test_agent, tkn_buy=numeraire, tkn_sell=tkn, sell_quantity=amt)
-        op_spot = OmnipoolState.price(test_state, tkn, numeraire)
+        with state.savepoint(agent):
+            state.swap(agent, tkn_buy=numeraire, tkn_sell=tkn, sell_quantity=amt)
+            op_spot = OmnipoolState.price(state, tkn, numeraire)
+            failed = state.fail != ''
+            numeraire_bought = agent.holdings[numeraire] - init_amt
         sell_spot = op_spot * (1 - lrna_fee) * (1 - asset_fee)
-        if sell_spot < cex_price or test_state.fail != '':
+        if sell_spot < cex_price or failed:
             amt_high = amt
         elif sell_spot > cex_price:
-            if test_agent.holdings[numeraire] - agent.holdings[numeraire] > max_liq_num:
+            if numeraire_bought > max_liq_num:
                 # best trade will involve trading max_liquidity, so can be calculated as a sell
                 # test_agent = agent.copy()
                 # test_state = state.copy()
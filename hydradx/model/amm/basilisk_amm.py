@@ -6,6 +6,8 @@ precision_level = 20
 
 
 class ConstantProductPoolState(AMM):
+    trade_fields = ('liquidity', 'shares', 'fail')
+
     def __init__(
             self,
             tokens: dict[str: float],
@@ -174,13 +176,11 @@ class ConstantProductPoolState(AMM):
             return self.fail_transaction('Tried to remove more shares than agent owns.', agent)
         if tkn_remove not in self.asset_list:
             # withdraw some of each
-            tkns = self.asset_list
-            withdraw_fraction = quantity / self.shares
-            for tkn in tkns:
-                withdraw_quantity = self.liquidity[tkn] * withdraw_fraction
+            for tkn, withdraw_quantity in self.calculate_remove_liquidity(quantity).items():
                 self.liquidity[tkn] -= withdraw_quantity
                 agent.holdings[tkn] += withdraw_quantity
-            agent.holdings[tkn_remove] -= quantity
+            agent.holdings[self.unique_id] -= quantity
+            self.shares -= quantity
         else:
             withdraw_quantity = abs(quantity) / self.shares * self.liquidity[tkn_remove]
             self.add_liquidity(
@@ -188,6 +188,13 @@ class ConstantProductPoolState(AMM):
             )
         return self
 
+    def calculate_remove_liquidity(self, quantity: float) -> dict[str, float]:
+        """
+        Quantity of each asset paid out for removing quantity shares. Does not change the pool.
+        """
+        withdraw_fraction = quantity / self.shares
+        return {tkn: self.liquidity[tkn] * withdraw_fraction for tkn in self.asset_list}
+
 
 def simulate_add_liquidity(
     old_state: ConstantProductPoolState,
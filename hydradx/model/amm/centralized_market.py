@@ -79,6 +79,8 @@ OrderBook.copy = lambda self: OrderBook(
 
 
 class CentralizedMarket(AMM):
+    trade_fields = ('order_book', 'fail')
+
     def __init__(
             self,
             order_book: dict[tuple[str, str], OrderBook],
@@ -324,6 +326,14 @@ class CentralizedMarket(AMM):
     def copy(self):
         return copy.deepcopy(self)
 
+    def _save(self) -> dict:
+        # trades change the orders in place, so the books are saved as copies
+        return {'order_book': {pair: book.copy() for pair, book in self.order_book.items()}, 'fail': self.fail}
+
+    def _restore(self, saved: dict):
+        self.order_book = saved['order_book']
+        self.fail = saved['fail']
+
     def buy_spot(self, tkn_buy: str, tkn_sell: str, fee: float = None) -> float:
         # denominated in tkn_sell
         if fee is None:
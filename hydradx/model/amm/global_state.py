@@ -5,9 +5,48 @@ from typing import Callable
 from .agents import Agent
 from .agents import AgentArchiveState
 from .amm import AMM
+from .basilisk_amm import ConstantProductPoolState
+from .ledger import Ledger, track
 from .liquidations import money_market
-from .omnipool_amm import OmnipoolState, simulate_swap
+from .omnipool_amm import OmnipoolState
 from .otc import OTC
+from .price_paths import PricePaths
+from .stableswap_amm import StableSwapPoolState
+
+
+class _SharePrices:
+    """
+    The prices of LP shares worked out by GlobalState.market_prices, kept until the time step changes
+    or the liquidity of a pool does (as it does in every trade), which the pools' TrackedDicts report here
+    as they would to a Ledger.
+    """
+    def __init__(self):
+        self.prices = {}
+        self.time_step = None
+        self.liquidity = {}
+
+    def __getstate__(self):
+        # pickles of TrackedDicts are plain dicts, so start again after loading
+        return {'prices': {}, 'time_step': None, 'liquidity': {}}
+
+    def watch(self, state: 'GlobalState'):
+        self.prices.clear()
+        self.time_step = state.time_step
+        for pool in state.pools.values():
+            track(pool, 'liquidity', self)
+        self.liquidity = {pool_id: pool.liquidity for pool_id, pool in state.pools.items()}
+
+    def change(self, totals, tkn, delta: float):
+        self.prices.clear()
+
+    def watches(self, state: 'GlobalState') -> bool:
+        # pools added to the state, or given new liquidity dicts, since this started aren't being watched
+        if len(state.pools) != len(self.liquidity):
+            return False
+        for pool_id, pool in state.pools.items():
+            if self.liquidity.get(pool_id) is not pool.liquidity:
+                return False
+        return True
 
 
 class GlobalState:
@@ -52,6 +91,8 @@ class GlobalState:
         self.archive_all = archive_all
         self.money_market = money_market
         self.otcs = otcs
+        self.ledger = None
+        self._share_prices = None
 
     def price(self, tkn: str, numeraire: str = 'USD') -> float:
         if tkn in self.external_market:
@@ -59,7 +100,18 @@ class GlobalState:
         else:
             return 0
 
+    def track_totals(self, check: bool = False) -> Ledger:
+        """
+        Keep running totals of every asset, so that total_asset(), total_assets() and total_wealth() are cheap.
+        With check=True, the totals are checked against a full recount every time they are used.
+        Copies of this state keep track of their own totals.
+        """
+        self.ledger = Ledger(check=check)
+        return self.ledger
+
     def total_wealth(self):
+        if self.ledger:
+            return sum([self.total_asset(tkn) * self.price(tkn) for tkn in self.ledger.assets(self)])
         return sum([
             sum([
                 agent.holdings[tkn] * self.price(tkn) for tkn in agent.holdings
@@ -73,6 +125,8 @@ class GlobalState:
         ])
 
     def total_asset(self, tkn):
+        if self.ledger:
+            return sum(self.ledger.totals(self, tkn))
         return (
                 sum([pool.liquidity[tkn] if tkn in pool.liquidity else 0 for pool in self.pools.values()])
                 + sum([agent.holdings[tkn] if tkn in agent.holdings else 0 for agent in self.agents.values()])
@@ -82,17 +136,33 @@ class GlobalState:
         return {tkn: self.total_asset(tkn) for tkn in self.asset_list}
 
     def copy(self):
-        copy_state = GlobalState(
-            agents={agent_id: self.agents[agent_id].copy() for agent_id in self.agents},
-            pools={pool_id: self.pools[pool_id].copy() for pool_id in self.pools},
-            money_market=self.money_market.copy() if self.money_market else None,
-            otcs=[otc.copy() for otc in self.otcs],
-            external_market=self.external_market.copy(),
-            evolve_function=copy.copy(self._evolve_function),
-            save_data=self.datastreams,
-            archive_all=self.archive_all
-        )
-        copy_state.time_step = self.time_step
+        # skips __init__, but keeps the guarantees it makes about asset_list, unique ids and agent holdings,
+        # in case agents or pools were changed since
+        copy_state = object.__new__(GlobalState)
+        copy_state.__dict__.update(self.__dict__)
+        copy_state.agents = {agent_id: self.agents[agent_id].copy() for agent_id in self.agents}
+        copy_state.pools = {pool_id: self.pools[pool_id].copy() for pool_id in self.pools}
+        copy_state.money_market = self.money_market.copy() if self.money_market else None
+        copy_state.otcs = [otc.copy() for otc in self.otcs]
+        copy_state.external_market = self.external_market.copy()
+        copy_state.ledger = Ledger(check=self.ledger.check) if self.ledger else None
+        copy_state._share_prices = None
+        copy_state.asset_list = list(set(
+            [asset for pool in copy_state.pools.values() for asset in pool.asset_list]
+            + [asset for agent in copy_state.agents.values() for asset in agent.asset_list]
+            + list(copy_state.external_market.keys())
+        ))
+        for agent_id, agent in copy_state.agents.items():
+            agent.unique_id = agent_id
+            for asset in copy_state.asset_list:
+                if asset not in agent.holdings:
+                    agent.holdings[asset] = 0
+        for pool_id, pool in copy_state.pools.items():
+            pool.unique_id = pool_id
+        copy_state.save_data = {
+            tag: self.datastreams[tag].assemble(copy_state)
+            for tag in self.datastreams
+        } if self.datastreams else {}
         return copy_state
 
     def archive(self):
@@ -106,10 +176,18 @@ class GlobalState:
         else:
             return ArchiveState(self)
 
-    def evolve(self):
-        self.time_step += 1
+    def evolve(self, blocks: int = 1):
+        """
+        Move on to the next time step, or `blocks` time steps ahead with nothing happening in between.
+        When skipping ahead, pools fast-forward over the blocks (see AMM.fast_forward) and the evolve function
+        is only called once, at the end, so it should depend only on time_step (as PricePaths does).
+        """
+        self.time_step += blocks
         for pool in self.pools.values():
-            pool.update()
+            if blocks == 1:
+                pool.update()
+            else:
+                pool.fast_forward(blocks)
         if self._evolve_function:
             return self._evolve_function(self)
         else:
@@ -137,28 +215,50 @@ class GlobalState:
 
     # functions for calculating extra parameters we may want to track
 
-    def market_prices(self, shares: dict) -> dict:
+    def market_prices(self, shares: dict, prices: dict = None) -> dict:
         """
         return the market price of each asset in state.asset_list, as well as the price of each asset in shares
+        prices, if given, are the asset prices taken from this state already (e.g. once per step), to start from
+        Without them, share prices are kept from one call to the next until the time step changes or a pool's
+        liquidity does.
         """
-        prices = {tkn: self.price(tkn) for tkn in self.asset_list}
+        if prices is not None:
+            # e.g. postprocessing, which goes through each archived state once, so keeping share prices won't pay
+            prices = prices.copy()
+            share_prices = {}
+        else:
+            prices = {tkn: self.price(tkn) for tkn in self.asset_list}
+            share_prices = None
         for share_id in shares:
             # if shares are for a specific asset in a specific pool, get prices according to that pool
             if isinstance(share_id, tuple):
-                pool_id = share_id[0]
-                tkn_id = share_id[1]
-                prices[share_id] = self.pools[pool_id].usd_price(self.pools[pool_id], tkn_id)
+                if share_prices is None:
+                    share_prices = self._current_share_prices()
+                if share_id not in share_prices:
+                    pool_id = share_id[0]
+                    tkn_id = share_id[1]
+                    share_prices[share_id] = self.pools[pool_id].usd_price(self.pools[pool_id], tkn_id)
+                prices[share_id] = share_prices[share_id]
 
         return prices
 
-    def cash_out(self, agent: Agent) -> float:
+    def _current_share_prices(self) -> dict:
+        cache = self._share_prices
+        if cache is None:
+            cache = self._share_prices = _SharePrices()
+        if not cache.watches(self):
+            cache.watch(self)
+        elif cache.time_step != self.time_step:
+            cache.prices.clear()
+            cache.time_step = self.time_step
+        return cache.prices
+
+    def cash_out(self, agent: Agent, prices: dict = None) -> float:
         """
         return the value of the agent's holdings if they withdraw all liquidity
-        and then sell at current spot prices
+        and then sell at current spot prices (optionally, prices from market_prices({}) on this state)
         """
-        if 'LRNA' not in agent.holdings:
-            agent.holdings['LRNA'] = 0
-        withdraw_holdings = {tkn: agent.holdings[tkn] for tkn in list(agent.holdings.keys())}
+        withdraw_holdings = {'LRNA': 0, **agent.holdings}
 
         for key in agent.holdings.keys():
             # shares.keys might just be the pool name, or it might be a tuple (pool, token)
@@ -169,10 +269,9 @@ class GlobalState:
                 pool_id = key
                 tkn = key
             if pool_id in self.pools:
-                if isinstance(self.pools[pool_id], OmnipoolState):
-                    # optimized for omnipool, no copy operations
-                    delta_qa, delta_r, delta_q, \
-                        delta_s, delta_b, delta_l = self.pools[pool_id].calculate_remove_liquidity(
+                pool = self.pools[pool_id]
+                if isinstance(pool, OmnipoolState):
+                    delta_qa, delta_r, *_ = pool.calculate_remove_liquidity(
                         agent,
                         agent.holdings[key],
                         tkn_remove=tkn
@@ -180,19 +279,24 @@ class GlobalState:
                     withdraw_holdings[key] = 0
                     withdraw_holdings['LRNA'] += delta_qa
                     withdraw_holdings[tkn] -= delta_r
+                    continue
+                elif isinstance(pool, StableSwapPoolState):
+                    withdrawn = pool.calculate_remove_uniform(agent.holdings[key])
+                elif isinstance(pool, ConstantProductPoolState):
+                    withdrawn = pool.calculate_remove_liquidity(agent.holdings[key])
                 else:
-                    # much less efficient, but works for any pool
-                    new_state = self.copy()
-                    new_pool: AMM = new_state.pools[pool_id]
-                    new_agent = new_state.agents[agent.unique_id]
+                    # works for any pool, at the cost of copying it
+                    new_pool, new_agent = pool.copy(), agent.copy()
                     new_pool.remove_liquidity(agent=new_agent, quantity=agent.holdings[key], tkn_remove=tkn)
-                    withdraw_holdings = {
-                        tkn: withdraw_holdings[tkn] + new_agent.holdings[tkn] - agent.holdings[tkn]
-                        for tkn in agent.holdings
+                    withdrawn = {
+                        tkn: new_agent.holdings[tkn] - agent.holdings.get(tkn, 0)
+                        for tkn in new_agent.holdings if tkn != key
                     }
+                withdraw_holdings[key] = 0
+                for tkn, quantity in withdrawn.items():
+                    withdraw_holdings[tkn] = withdraw_holdings.get(tkn, 0) + quantity
 
-        prices = self.market_prices(withdraw_holdings)
-        return value_assets(prices, withdraw_holdings)
+        return value_assets(self.market_prices(withdraw_holdings, prices), withdraw_holdings)
 
     def pool_val(self, pool: AMM):
         """ get the total value of all liquidity in the pool. """
@@ -362,7 +466,10 @@ def oscillate_prices(volatility: dict[str: float], trend: dict[str: float] = Non
     return transform
 
 
-def historical_prices(price_list: list[dict[str: float]]) -> Callable:
+def historical_prices(price_list: list[dict[str: float]] or PricePaths) -> Callable:
+    if isinstance(price_list, PricePaths):
+        return price_list.evolve_function()
+
     def transform(state: GlobalState) -> GlobalState:
         for tkn in price_list[state.time_step]:
             state.external_market[tkn] = price_list[state.time_step][tkn]
@@ -528,10 +635,10 @@ def find_partial_otc_sell_amount(omnipool, otc):
 
     # binary search
     for i in range(iters):
-        temp_state, temp_agent = simulate_swap(omnipool, agent, tkn_buy=buy_asset,
-                                               tkn_sell=sell_asset, sell_quantity=sell_amt)
-        amt_bought = agent.holdings[buy_asset] - temp_agent.holdings[buy_asset]
-        spot_after = temp_state.buy_spot(buy_asset, sell_asset)
+        with omnipool.savepoint(agent):
+            omnipool.swap(agent, tkn_buy=buy_asset, tkn_sell=sell_asset, sell_quantity=sell_amt)
+            amt_bought = agent.holdings[buy_asset]  # the agent starts out with none
+            spot_after = omnipool.buy_spot(buy_asset, sell_asset)
         # execution_price = amt_sold / buy_amt if buy_amt != 0 else float('inf')
 
         if spot_after > otc.price or amt_bought == 0:  # trade amount too high
@@ -580,7 +687,8 @@ def _set_mm_oracles_to_external_market(state: GlobalState, stablecoin: str, trig
             state.money_market.oracles[tkn_pair] = market_price
 
 
-def update_prices_and_process(pool_id: str, liquidating_agent_id: str, price_list: list[dict[str: float]],
+def update_prices_and_process(pool_id: str, liquidating_agent_id: str,
+                              price_list: list[dict[str: float]] or PricePaths,
                               stablecoin: str, trigger_pct: float = 0) -> Callable:
     transform_price = historical_prices(price_list)
     transform_liquidate = liquidate_against_omnipool(pool_id, liquidating_agent_id)
@@ -0,0 +1,240 @@
+import copy
+import math
+
+
+class TrackedDict(dict):
+    """
+    A dict of asset quantities which reports every change to a Ledger, or to anything else with the same
+    change(totals, tkn, delta) method. Several can listen to one dict (see track()).
+    Copies, deep copies and pickles of it are plain dicts.
+    """
+    __slots__ = ('listeners',)
+
+    def __init__(self, data: dict, ledger: 'Ledger', totals: dict):
+        super().__init__(data)
+        self.listeners = [(ledger, totals)]
+
+    def _report(self, key, delta: float):
+        for ledger, totals in self.listeners:
+            ledger.change(totals, key, delta)
+
+    def __setitem__(self, key, value):
+        self._report(key, value - self.get(key, 0))
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._report(key, -self[key])
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._report(key, -self[key])
+        return super().pop(key, *default)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._report(key, -value)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def track(obj, name: str, ledger, totals: dict = None):
+    """
+    Report every change to the dict obj.<name> to ledger, making it a TrackedDict if it isn't one already.
+    Whatever else it reports to is kept, except ledger itself, which only keeps the new totals.
+    """
+    tracked = getattr(obj, name)
+    if isinstance(tracked, TrackedDict):
+        tracked.listeners = [listener for listener in tracked.listeners if listener[0] is not ledger]
+        tracked.listeners.append((ledger, totals))
+    else:
+        setattr(obj, name, TrackedDict(tracked, ledger, totals))
+
+
+class CountedDict(dict):
+    """
+    A dict which counts every item added, replaced or removed in self.version, so that whatever depends on
+    which items it holds (the agents or pools of a state) only has to compare one number to know whether
+    to look at them again. Copies, deep copies and pickles of it are plain dicts.
+    """
+    __slots__ = ('version',)
+
+    def __init__(self, items: dict):
+        super().__init__(items)
+        self.version = 0
+
+    def __setitem__(self, key, value):
+        self.version += 1
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.version += 1
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        self.version += 1
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        self.version += 1
+        super().update(*args, **kwargs)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        self.version += 1
+        super().clear()
+
+    def __deepcopy__(self, memo):
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def counted(obj, name: str) -> CountedDict:
+    """
+    obj.<name>, made a CountedDict if it isn't one already.
+    """
+    items = getattr(obj, name)
+    if type(items) is not CountedDict:
+        items = CountedDict(items)
+        setattr(obj, name, items)
+    return items
+
+
+class Ledger:
+    """
+    Running totals of every asset held in pools and by agents, kept up to date as
+    pool.liquidity and agent.holdings change, so GlobalState.total_asset() and friends don't need
+    to add everything up again each time. Enable it with GlobalState.track_totals().
+
+    The ledger attaches itself to a state the first time it is asked for a total, by replacing the
+    liquidity of each pool and the holdings of each agent with a TrackedDict holding the same values
+    (or listening to the TrackedDict already there). It also makes state.pools and state.agents CountedDicts,
+    and attaches itself again whenever pools or agents are added, replaced or removed, or either is replaced.
+    Liquidity or holdings dicts replaced wholesale are not tracked until reset() is called.
+    With check=True, every total is compared with a full recount.
+
+    Assets with infinite quantities anywhere are recounted in full whenever they are asked for.
+    """
+    def __init__(self, check: bool = False):
+        self.check = check
+        self.pools = {}
+        self.agents = {}
+        self._state = None
+        self._versions = None
+        self._recount = set()
+
+    def __getstate__(self):
+        # checkpoints store plain dicts, so reattach after loading
+        return {
+            'check': self.check, 'pools': {}, 'agents': {}, '_state': None, '_versions': None, '_recount': set()
+        }
+
+    def attach(self, state):
+        self.pools, self.agents = {}, {}
+        self._recount = set()
+        pools, agents = counted(state, 'pools'), counted(state, 'agents')
+        self._versions = (pools, pools.version, agents, agents.version)
+        for pool in state.pools.values():
+            track(pool, 'liquidity', self, self.pools)
+            for tkn, quantity in pool.liquidity.items():
+                self.change(self.pools, tkn, quantity)
+        for agent in state.agents.values():
+            track(agent, 'holdings', self, self.agents)
+            for tkn, quantity in agent.holdings.items():
+                self.change(self.agents, tkn, quantity)
+        self._state = state
+
+    def reset(self):
+        self._state = None
+
+    def attached(self, state) -> bool:
+        # False if this isn't the state the ledger is attached to, or its pools or agents have changed since
+        if self._state is not state:
+            return False
+        pools, pools_version, agents, agents_version = self._versions
+        return (
+            state.pools is pools and pools.version == pools_version
+            and state.agents is agents and agents.version == agents_version
+        )
+
+    def change(self, totals: dict, tkn, delta: float):
+        if tkn in self._recount:
+            return
+        if not math.isfinite(delta):
+            self._recount.add(tkn)
+            return
+        totals[tkn] = totals.get(tkn, 0) + delta
+
+    def count(self, state, tkn) -> tuple[float, float]:
+        """
+        (total in pools, total held by agents), added up from scratch.
+        """
+        return (
+            sum([pool.liquidity[tkn] if tkn in pool.liquidity else 0 for pool in state.pools.values()]),
+            sum([agent.holdings[tkn] if tkn in agent.holdings else 0 for agent in state.agents.values()])
+        )
+
+    def totals(self, state, tkn) -> tuple[float, float]:
+        """
+        (total in pools, total held by agents)
+        """
+        if not self.attached(state):
+            self.attach(state)
+        if tkn in self._recount:
+            in_pools, in_agents = self.count(state, tkn)
+            if math.isfinite(in_pools + in_agents):
+                # back to normal
+                self._recount.discard(tkn)
+                self.pools[tkn], self.agents[tkn] = in_pools, in_agents
+            return in_pools, in_agents
+        in_pools, in_agents = self.pools.get(tkn, 0), self.agents.get(tkn, 0)
+        if self.check:
+            counted_pools, counted_agents = self.count(state, tkn)
+            scale = max(abs(counted_pools), abs(counted_agents), 1)
+            if abs(in_pools - counted_pools) > 1e-9 * scale or abs(in_agents - counted_agents) > 1e-9 * scale:
+                raise AssertionError(
+                    f'Ledger is out of sync for {tkn}: pools {in_pools} vs. {counted_pools}, '
+                    f'agents {in_agents} vs. {counted_agents}.'
+                )
+        return in_pools, in_agents
+
+    def assets(self, state) -> list:
+        if not self.attached(state):
+            self.attach(state)
+        return list({**self.pools, **self.agents, **{tkn: 0 for tkn in self._recount}})
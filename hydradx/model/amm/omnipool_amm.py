@@ -2,14 +2,24 @@ import copy
 from numbers import Number
 from typing import Callable
 
+import numpy as np
+
 from .agents import Agent
-from .amm import AMM, FeeMechanism, basic_fee
+from .amm import AMM, FeeMechanism, basic_fee, fast_copy, _restore_dict
 from .oracle import Oracle, Block, OracleArchiveState
 from .stableswap_amm import StableSwapPoolState
 
 
+# the parts of current_block which trades change
+_block_fields = ['volume_in', 'volume_out', 'price', 'lps', 'withdrawals']
+# setting any of these can change a block-constant fee, so it clears the fee cache
+_fee_parameters = {'asset_fee', 'lrna_fee', 'last_fee', 'last_lrna_fee', 'oracles', 'time_step'}
+
+
 class OmnipoolState(AMM):
     unique_id: str = 'omnipool'
+    # savepoint() also saves the trade volumes in current_block, and the sub-pools' trade fields
+    trade_fields = ('liquidity', 'lrna', 'shares', 'protocol_shares', 'lrna_imbalance', 'fail')
 
     def __init__(self,
                  tokens: dict[str: dict],
@@ -151,6 +161,8 @@ class OmnipoolState(AMM):
             super().__setattr__(key, self._get_fee(value))
         else:
             super().__setattr__(key, value)
+        if key in _fee_parameters:
+            self.clear_fee_cache()
 
     def _get_fee(self, value: dict or FeeMechanism or float) -> dict:
 
@@ -216,7 +228,7 @@ class OmnipoolState(AMM):
         self.time_step += 1
         self.current_block = Block(self)
 
-        # update fees
+        # update fees (setting time_step and these also clears the fees cached in the last block)
         self.last_fee = {tkn: self.asset_fee[tkn].compute() for tkn in self.asset_list}
         self.last_lrna_fee = {tkn: self.lrna_fee[tkn].compute() for tkn in self.asset_list}
 
@@ -226,6 +238,58 @@ class OmnipoolState(AMM):
 
         return self
 
+    def fast_forward(self, blocks: int):
+        """
+        The same as calling update() `blocks` times with no trades in between. After the first block,
+        the oracles decay towards the (unchanging) empty block in one step, and the fees skip ahead
+        if they know how (fixed fees and dynamic fees do).
+        """
+        self.update()
+        blocks -= 1
+        fees = list(self.asset_fee.values()) + list(self.lrna_fee.values())
+        if blocks <= 0:
+            return self
+        elif self.update_function or not all(hasattr(fee, 'fee') or fee.fast_forward for fee in fees):
+            return super().fast_forward(blocks)
+
+        block = self.current_block
+        # fees first, since dynamic fees work forward from the oracles as they are now
+        last_fee = {
+            tkn: fee.fee if fee.fast_forward is None else fee.fast_forward(blocks, block)
+            for tkn, fee in self.asset_fee.items()
+        }
+        last_lrna_fee = {
+            tkn: fee.fee if fee.fast_forward is None else fee.fast_forward(blocks, block)
+            for tkn, fee in self.lrna_fee.items()
+        }
+        for oracle in self.oracles.values():
+            oracle.fast_forward(block, blocks)
+        self.time_step += blocks
+        self.last_fee.update(last_fee)
+        self.last_lrna_fee.update(last_lrna_fee)
+        return self
+
+    def clear_fee_cache(self):
+        """
+        Forget the fees worked out for this block, so that they are computed again on the next trade.
+        This happens in update() and whenever a fee or anything fees depend on is set (e.g. omnipool.asset_fee = 0.01
+        or omnipool.last_fee = {...}), and a fee mechanism starts out with nothing cached when it is assigned to a
+        token (omnipool.asset_fee['DOT'] = basic_fee(0.01).assign(omnipool, 'DOT')).
+        """
+        for fees in (self.__dict__.get('asset_fee', {}), self.__dict__.get('lrna_fee', {})):
+            for fee in fees.values():
+                fee.block_fee = None
+
+    @staticmethod
+    def _block_fee(fee_mechanism: FeeMechanism) -> float:
+        # block-constant fees are computed on the first trade in each block, and others (e.g. slip fees) on every trade
+        fee = fee_mechanism.block_fee
+        if fee is None:
+            fee = fee_mechanism.compute()
+            if fee_mechanism.block_constant:
+                fee_mechanism.block_fee = fee
+        return fee
+
     @property
     def lrna_total(self):
         return sum(self.lrna.values())
@@ -242,13 +306,26 @@ class OmnipoolState(AMM):
     def buy_limit(self, tkn_buy: str, tkn_sell: str):
         if tkn_buy not in self.liquidity:
             return 0
-        return self.liquidity[tkn_buy] * (1 - self.asset_fee[tkn_buy].compute())
+        return self.liquidity[tkn_buy] * (1 - self._block_fee(self.asset_fee[tkn_buy]))
 
     def copy(self):
-        copy_state = copy.deepcopy(self)
+        copy_state = fast_copy(self)
         copy_state.fail = ''
         return copy_state
 
+    def _save(self) -> dict:
+        saved = super()._save()
+        saved['current_block'] = {name: getattr(self.current_block, name).copy() for name in _block_fields}
+        saved['sub_pools'] = {pool_id: pool._save() for pool_id, pool in self.sub_pools.items()}
+        return saved
+
+    def _restore(self, saved: dict):
+        super()._restore({name: saved[name] for name in self.trade_fields})
+        for name, values in saved['current_block'].items():
+            _restore_dict(getattr(self.current_block, name), values)
+        for pool_id, pool_saved in saved['sub_pools'].items():
+            self.sub_pools[pool_id]._restore(pool_saved)
+
     def archive(self):
         return OmnipoolArchiveState(self)
 
@@ -307,12 +384,12 @@ class OmnipoolState(AMM):
         """
         Given a buy quantity, calculate the effective price, so we can execute it as a sell
         """
-        asset_fee = self.asset_fee[tkn_buy].compute()
+        asset_fee = self._block_fee(self.asset_fee[tkn_buy])
         if buy_quantity >= self.liquidity[tkn_buy] * (1 - asset_fee):
             return float('inf')
         delta_Qj = self.lrna[tkn_buy] * buy_quantity / (
                 self.liquidity[tkn_buy] * (1 - asset_fee) - buy_quantity)
-        lrna_fee = self.lrna_fee[tkn_sell].compute()
+        lrna_fee = self._block_fee(self.lrna_fee[tkn_sell])
         # lrna_fee = self.last_lrna_fee[tkn_sell]
         delta_Qi = -delta_Qj / (1 - lrna_fee)
         if -delta_Qi >= self.lrna[tkn_sell]:
@@ -331,8 +408,8 @@ class OmnipoolState(AMM):
         """
         delta_Ri = sell_quantity
         delta_Qi = self.lrna[tkn_sell] * -delta_Ri / (self.liquidity[tkn_sell] + delta_Ri)
-        asset_fee = self.asset_fee[tkn_buy].compute()
-        lrna_fee = self.lrna_fee[tkn_sell].compute()
+        asset_fee = self._block_fee(self.asset_fee[tkn_buy])
+        lrna_fee = self._block_fee(self.lrna_fee[tkn_sell])
         delta_Qt = -delta_Qi * (1 - lrna_fee)
         delta_Rj = self.liquidity[tkn_buy] * -delta_Qt / (self.lrna[tkn_buy] + delta_Qt) * (1 - asset_fee)
         return -delta_Rj
@@ -357,9 +434,9 @@ class OmnipoolState(AMM):
                         fee['asset'] = pool.trade_fee
                         break
             if 'lrna' not in fee:
-                fee['lrna'] = self.lrna_fee[tkn_sell].compute()
+                fee['lrna'] = self._block_fee(self.lrna_fee[tkn_sell])
             if 'asset' not in fee:
-                fee['asset'] = self.asset_fee[tkn_buy].compute()
+                fee['asset'] = self._block_fee(self.asset_fee[tkn_buy])
         elif not isinstance(fee, dict):
             fee = {
                 'lrna': fee,
@@ -367,7 +444,7 @@ class OmnipoolState(AMM):
             }
         if tkn_buy not in self.asset_list:
             return 0
-        elif tkn_sell not in self.asset_list + ['LRNA']:
+        elif tkn_sell != 'LRNA' and tkn_sell not in self.asset_list:
             return 0
         else:
             return price(self, tkn_buy, tkn_sell) / (1 - fee['lrna']) / (1 - fee['asset'])
@@ -392,9 +469,9 @@ class OmnipoolState(AMM):
                         fee['asset'] = pool.trade_fee
                         break
             if 'lrna' not in fee:
-                fee['lrna'] = self.lrna_fee[tkn_sell].compute()
+                fee['lrna'] = self._block_fee(self.lrna_fee[tkn_sell])
             if 'asset' not in fee:
-                fee['asset'] = self.asset_fee[tkn_buy].compute()
+                fee['asset'] = self._block_fee(self.asset_fee[tkn_buy])
         elif not isinstance(fee, dict):
             fee = {
                 'lrna': fee,
@@ -402,7 +479,7 @@ class OmnipoolState(AMM):
             }
         if tkn_buy not in self.asset_list:
             return 0
-        elif tkn_sell not in self.asset_list + ["LRNA"]:
+        elif tkn_sell != 'LRNA' and tkn_sell not in self.asset_list:
             return 0
         else:
             return price(self, tkn_sell, tkn_buy) * (1 - fee['lrna']) * (1 - fee['asset'])
@@ -435,7 +512,10 @@ class OmnipoolState(AMM):
         old_buy_liquidity = self.liquidity[tkn_buy] if tkn_buy in self.liquidity else 0
         old_sell_liquidity = self.liquidity[tkn_sell] if tkn_sell in self.liquidity else 0
 
-        if tkn_buy not in self.asset_list + ['LRNA'] or tkn_sell not in self.asset_list + ['LRNA']:
+        if (
+                tkn_buy != 'LRNA' and tkn_buy not in self.asset_list
+                or tkn_sell != 'LRNA' and tkn_sell not in self.asset_list
+        ):
             # note: this default routing behavior assumes that an asset will only exist in one place in the omnipool
             return_val = self.stable_swap(
                 agent=agent,
@@ -477,8 +557,8 @@ class OmnipoolState(AMM):
                 return self.fail_transaction(f"Agent doesn't have enough {i}", agent)
 
             delta_Qi = self.lrna[tkn_sell] * -delta_Ri / (self.liquidity[tkn_sell] + delta_Ri)
-            asset_fee = self.asset_fee[tkn_buy].compute()
-            lrna_fee = self.lrna_fee[tkn_sell].compute()
+            asset_fee = self._block_fee(self.asset_fee[tkn_buy])
+            lrna_fee = self._block_fee(self.lrna_fee[tkn_sell])
             delta_Qt = -delta_Qi * (1 - lrna_fee)
             delta_Qm = (self.lrna[tkn_buy] + delta_Qt) * delta_Qt * asset_fee / self.lrna[
                 tkn_buy] * self.lrna_mint_pct
@@ -544,7 +624,7 @@ class OmnipoolState(AMM):
 
         if delta_qa < 0:
             # selling LRNA
-            asset_fee = self.asset_fee[tkn].compute()
+            asset_fee = self._block_fee(self.asset_fee[tkn])
             if delta_qa + agent.holdings['LRNA'] < 0:
                 return self.fail_transaction('Agent has insufficient lrna', agent)
             delta_ra = -self.liquidity[tkn] * delta_qa / (-delta_qa + self.lrna[tkn]) * (1 - asset_fee)
@@ -561,7 +641,7 @@ class OmnipoolState(AMM):
 
         elif delta_ra > 0:
             # buying asset
-            asset_fee = self.asset_fee[tkn].compute()
+            asset_fee = self._block_fee(self.asset_fee[tkn])
             if -delta_ra + self.liquidity[tkn] <= 0:
                 return self.fail_transaction('insufficient assets in pool', agent)
             denom = (self.liquidity[tkn] * (1 - asset_fee) - delta_ra)
@@ -579,7 +659,7 @@ class OmnipoolState(AMM):
         # buying LRNA
         elif delta_qa > 0:
             # buying LRNA
-            lrna_fee = self.lrna_fee[tkn].compute()
+            lrna_fee = self._block_fee(self.lrna_fee[tkn])
             delta_qi = -delta_qa / (1 - lrna_fee)
             if delta_qi + self.lrna[tkn] <= 0:
                 return self.fail_transaction('insufficient lrna in pool', agent)
@@ -599,7 +679,7 @@ class OmnipoolState(AMM):
 
         elif delta_ra < 0:
             # selling asset
-            lrna_fee = self.lrna_fee[tkn].compute()
+            lrna_fee = self._block_fee(self.lrna_fee[tkn])
             if delta_ra > agent.holdings[tkn]:
                 return self.fail_transaction('agent has insufficient assets', agent)
             delta_qi = self.lrna[tkn] * delta_ra / (self.liquidity[tkn] - delta_ra)
@@ -628,6 +708,191 @@ class OmnipoolState(AMM):
 
         return self
 
+    def settle_batch(self, intents: list[dict]):
+        """
+        Settle all the swaps submitted in a block together, rather than one at a time.
+        Each intent holds the arguments of a swap, e.g.
+            {'agent': agent, 'tkn_sell': 'DOT', 'tkn_buy': 'USD', 'sell_quantity': 100}
+        Sells of Omnipool assets and LRNA are netted through LRNA: everything sold into and bought out of an asset
+        settles at one LRNA price, and only the difference trades against the asset's curve, so opposing orders
+        fill each other. Every intent selling tkn_sell for tkn_buy gets the same rate, so outputs are shared out
+        pro rata. Fees are charged as swap() charges them, and a batch of one intent has the same result as swap().
+
+        Intents which buy a fixed quantity or trade sub-pool assets are executed one by one with swap() afterwards.
+        So are the intents which, settled together, would take an asset past the per-block trade limit or the
+        liquidity cap: swap() fills as many of them as fit. Intents whose agents can't pay fail, as in swap().
+        The batch is solved in floating point, so pools holding mpf values are rejected.
+        """
+        tkns = self.asset_list
+        if not all(isinstance(self.liquidity[tkn], (int, float)) and isinstance(self.lrna[tkn], (int, float))
+                   for tkn in tkns):
+            raise TypeError('settle_batch solves in floating point; use swap() with mpf pools.')
+        position = {tkn: i for i, tkn in enumerate(tkns)}
+        batch, later = [], []
+        committed = {}  # so that agents with several intents can't spend the same holdings twice
+        for intent in intents:
+            tkn_sell, tkn_buy = intent['tkn_sell'], intent['tkn_buy']
+            if (
+                    intent.get('buy_quantity') or tkn_sell == tkn_buy
+                    or tkn_sell != 'LRNA' and tkn_sell not in position
+                    or tkn_buy != 'LRNA' and tkn_buy not in position
+            ):
+                later.append(intent)
+                continue
+            agent, quantity = intent['agent'], intent.get('sell_quantity', 0)
+            key = (id(agent), tkn_sell)
+            if quantity <= 0:
+                self.fail_transaction('sell amount must be greater than zero', agent)
+            elif quantity > agent.holdings.get(tkn_sell, 0) - committed.get(key, 0):
+                self.fail_transaction(f"Agent doesn't have enough {tkn_sell}", agent)
+            else:
+                committed[key] = committed.get(key, 0) + quantity
+                batch.append((agent, tkn_sell, tkn_buy, quantity, intent))
+
+        n = len(tkns)
+        block = self.current_block
+        r = np.array([self.liquidity[tkn] for tkn in tkns], dtype=float)
+        q = np.array([self.lrna[tkn] for tkn in tkns], dtype=float)
+        deferred = []
+        while True:
+            sold = np.zeros(n)  # of each asset, for LRNA or other assets
+            lrna_sold = np.zeros(n)  # for each asset
+            routed = np.zeros((n, n))  # routed[i, k] is how much of asset i is sold for asset k
+            for agent, tkn_sell, tkn_buy, quantity, _ in batch:
+                if tkn_sell == 'LRNA':
+                    lrna_sold[position[tkn_buy]] += quantity
+                else:
+                    sold[position[tkn_sell]] += quantity
+                    if tkn_buy != 'LRNA':
+                        routed[position[tkn_sell], position[tkn_buy]] += quantity
+            bought = (routed.sum(axis=0) + lrna_sold) > 0
+            touched = (sold > 0) | bought
+            asset_fee = np.array(
+                [self._block_fee(self.asset_fee[tkn]) if bought[i] else 0 for i, tkn in enumerate(tkns)]
+            )
+            lrna_fee = np.array(
+                [self._block_fee(self.lrna_fee[tkn]) if sold[i] > 0 else 0 for i, tkn in enumerate(tkns)]
+            )
+
+            # Selling x of an asset with reserves (r, q) pays q / (r + x) LRNA each. If an asset has s sold and d LRNA
+            # spent on it, the net trade is s - d / p, so its clearing price p = q / (r + s - d / p), i.e.
+            # p * (r + s) - d = q. d includes the LRNA from selling other assets, which depends on their prices,
+            # so all the prices come out of one linear system.
+            carried = routed * (1 - lrna_fee)[:, np.newaxis]  # LRNA reaching asset k per unit price of asset i
+            p = np.linalg.solve(np.diag(r + sold) - carried.T, q + lrna_sold)
+            lrna_spent = lrna_sold + carried.T @ p
+            gross_out = np.divide(lrna_spent, p, out=np.zeros(n), where=bought)
+            fee_kept = gross_out * asset_fee
+            delta_r = sold - gross_out + fee_kept
+
+            # intents which take an asset too far are left to swap(), and the rest are settled again without them
+            too_much_in, too_much_out = set(), set()
+            for i in np.flatnonzero(touched).tolist():
+                tkn = tkns[i]
+                if sold[i] and r[i] + sold[i] > 10 ** 12:
+                    too_much_in.add(tkn)
+                if tkn not in block.asset_list:
+                    continue
+                net_out = block.volume_out[tkn] - block.volume_in[tkn] - delta_r[i]
+                if net_out > self.trade_limit_per_block * block.liquidity[tkn]:
+                    too_much_out.add(tkn)
+                elif -net_out > self.trade_limit_per_block * block.liquidity[tkn]:
+                    too_much_in.add(tkn)
+            if not too_much_in and not too_much_out:
+                break
+            deferred += [order[4] for order in batch if order[1] in too_much_in or order[2] in too_much_out]
+            batch = [order for order in batch if order[1] not in too_much_in and order[2] not in too_much_out]
+
+        delta_q = lrna_spent - sold * p
+        minted = fee_kept * (q + delta_q) / (r + sold - gross_out) * self.lrna_mint_pct
+        lrna_fees = float((sold * p * lrna_fee).sum())
+
+        # LRNA sold to the pool changes the imbalance, as in _lrna_swap
+        lrna_added = float((lrna_sold * (1 + np.divide(minted, lrna_spent, out=np.zeros(n), where=bought))).sum())
+        if lrna_added:
+            total = self.lrna_total
+            self.lrna_imbalance += -lrna_added * (total + self.lrna_imbalance) / (total + lrna_added) - lrna_added
+        delta_l = min(lrna_fees, -self.lrna_imbalance)
+        self.lrna_imbalance += delta_l
+
+        old_liquidity = {tkn: self.liquidity[tkn] for tkn in tkns}
+        for i in np.flatnonzero(touched).tolist():
+            self.liquidity[tkns[i]] += delta_r[i].item()
+            self.lrna[tkns[i]] += (delta_q[i] + minted[i]).item()
+        if lrna_fees:
+            self.lrna['HDX'] += lrna_fees - delta_l
+
+        # pay out
+        p, lrna_fee, asset_fee = p.tolist(), lrna_fee.tolist(), asset_fee.tolist()
+        for agent, tkn_sell, tkn_buy, quantity, _ in batch:
+            if tkn_sell == 'LRNA':
+                lrna = quantity
+            else:
+                i = position[tkn_sell]
+                lrna = quantity * p[i] * (1 - lrna_fee[i])
+            if tkn_buy == 'LRNA':
+                out = lrna
+            else:
+                k = position[tkn_buy]
+                out = lrna / p[k] * (1 - asset_fee[k])
+            agent.holdings[tkn_sell] -= quantity
+            if tkn_buy not in agent.holdings:
+                agent.holdings[tkn_buy] = 0
+            agent.holdings[tkn_buy] += out
+
+        # update oracle
+        for i in np.flatnonzero(touched).tolist():
+            tkn = tkns[i]
+            if tkn in block.asset_list:
+                block.volume_in[tkn] += sold[i].item()
+                block.volume_out[tkn] += sold[i].item() + old_liquidity[tkn] - self.liquidity[tkn]
+                block.price[tkn] = self.lrna[tkn] / self.liquidity[tkn]
+
+        for intent in deferred + later:
+            self.swap(**intent)
+        return self
+
+    def calculate_stable_buy(
+            self,
+            tkn_buy: str,
+            tkn_sell: str,
+            buy_quantity: float,
+            pool_buy: StableSwapPoolState = None,
+            pool_sell: StableSwapPoolState = None
+    ) -> tuple[float, float, float]:
+        """
+        Quote buying buy_quantity of tkn_buy with tkn_sell, where either token may be in a stableswap pool whose
+        shares are an Omnipool asset: tkn_buy in pool_buy and tkn_sell in pool_sell.
+        Returns (sell_quantity, shares_sold, shares_bought): the tkn_sell paid in, the pool_sell shares bought and
+        sold into the Omnipool, and the pool_buy shares bought from the Omnipool and withdrawn as tkn_buy.
+        Each stableswap pool's invariant is found once, so the results can be passed on to buy_shares and
+        withdraw_asset instead of being worked out again. Does not change any pool.
+        """
+        shares_bought = shares_sold = 0
+        if pool_buy is not None:
+            shares_bought = pool_buy.calculate_withdrawal_shares(tkn_buy, buy_quantity)
+            omnipool_buy, omnipool_buy_quantity = pool_buy.unique_id, shares_bought
+        else:
+            omnipool_buy, omnipool_buy_quantity = tkn_buy, buy_quantity
+
+        if tkn_sell == 'LRNA':
+            r, q = self.liquidity[omnipool_buy], self.lrna[omnipool_buy]
+            denom = r * (1 - self._block_fee(self.asset_fee[omnipool_buy])) - omnipool_buy_quantity
+            sell_quantity = q * omnipool_buy_quantity / denom if denom > 0 else float('inf')
+            return sell_quantity, shares_sold, shares_bought
+
+        omnipool_sell = pool_sell.unique_id if pool_sell is not None else tkn_sell
+        omnipool_sell_quantity = self.calculate_sell_from_buy(omnipool_buy, omnipool_sell, omnipool_buy_quantity)
+        if pool_sell is None:
+            return omnipool_sell_quantity, shares_sold, shares_bought
+
+        shares_sold = omnipool_sell_quantity
+        if 0 <= shares_sold < float('inf'):
+            sell_quantity = pool_sell.calculate_buy_shares(shares_sold, tkn_sell)
+        else:
+            sell_quantity = float('inf')
+        return sell_quantity, shares_sold, shares_bought
+
     def stable_swap(
             self,
             agent: Agent,
@@ -641,12 +906,12 @@ class OmnipoolState(AMM):
             if buy_quantity:
                 sub_pool = self.sub_pools[sub_pool_buy_id]
                 # buy a specific quantity of a stableswap asset using LRNA
-                shares_needed = sub_pool.calculate_withdrawal_shares(tkn_remove=tkn_buy, quantity=buy_quantity)
+                _, _, shares_needed = self.calculate_stable_buy(tkn_buy, 'LRNA', buy_quantity, pool_buy=sub_pool)
                 self._lrna_swap(agent, delta_ra=shares_needed, tkn=sub_pool.unique_id)
                 if self.fail:
                     # if the swap failed, the transaction failed.
                     return self.fail_transaction(self.fail, agent)
-                sub_pool.withdraw_asset(agent, buy_quantity, tkn_buy)
+                sub_pool.withdraw_asset(agent, buy_quantity, tkn_buy, shares_removed=shares_needed)
                 return self
             elif sell_quantity:
                 sub_pool = self.sub_pools[sub_pool_buy_id]
@@ -682,10 +947,12 @@ class OmnipoolState(AMM):
                 return self
             elif buy_quantity:
                 # buy an omnipool asset with a stableswap asset
-                sell_shares = self.calculate_sell_from_buy(tkn_buy, sub_pool.unique_id, buy_quantity)
+                sell_quantity, sell_shares, _ = self.calculate_stable_buy(
+                    tkn_buy, tkn_sell, buy_quantity, pool_sell=sub_pool
+                )
                 if sell_shares < 0:
                     return self.fail_transaction("Not enough liquidity in the stableswap/LRNA pool.", agent)
-                sub_pool.buy_shares(agent, sell_shares, tkn_sell)
+                sub_pool.buy_shares(agent, sell_shares, tkn_sell, delta_tkn=sell_quantity)
                 if sub_pool.fail:
                     return self.fail_transaction(sub_pool.fail, agent)
                 self.swap(agent, tkn_buy, sub_pool.unique_id, buy_quantity)
@@ -695,7 +962,7 @@ class OmnipoolState(AMM):
             sub_pool: StableSwapPoolState = self.sub_pools[sub_pool_buy_id]
             if buy_quantity:
                 # buy a stableswap asset with an omnipool asset
-                shares_traded = sub_pool.calculate_withdrawal_shares(tkn_buy, buy_quantity)
+                _, _, shares_traded = self.calculate_stable_buy(tkn_buy, tkn_sell, buy_quantity, pool_buy=sub_pool)
 
                 # buy shares in the subpool
                 self.swap(agent, tkn_buy=sub_pool.unique_id, tkn_sell=tkn_sell, buy_quantity=shares_traded)
@@ -703,7 +970,7 @@ class OmnipoolState(AMM):
                     # if the swap failed, the transaction failed.
                     return self.fail_transaction(self.fail, agent)
                 # withdraw the shares for the desired token
-                sub_pool.withdraw_asset(agent, quantity=buy_quantity, tkn_remove=tkn_buy)
+                sub_pool.withdraw_asset(agent, quantity=buy_quantity, tkn_remove=tkn_buy, shares_removed=shares_traded)
                 if sub_pool.fail:
                     return self.fail_transaction(sub_pool.fail, agent)
                 return self
@@ -729,17 +996,14 @@ class OmnipoolState(AMM):
             pool_sell: StableSwapPoolState = self.sub_pools[sub_pool_sell_id]
             if buy_quantity:
                 # buy enough shares of tkn_sell to afford buy_quantity worth of tkn_buy
-                shares_bought = pool_buy.calculate_withdrawal_shares(tkn_buy, buy_quantity)
+                sell_quantity, shares_sold, shares_bought = self.calculate_stable_buy(
+                    tkn_buy, tkn_sell, buy_quantity, pool_buy=pool_buy, pool_sell=pool_sell
+                )
                 if shares_bought > pool_buy.liquidity[tkn_buy]:
                     return self.fail_transaction(f'Not enough liquidity in {pool_buy.unique_id}: {tkn_buy}.', agent)
-                shares_sold = self.calculate_sell_from_buy(
-                    tkn_buy=pool_buy.unique_id,
-                    tkn_sell=pool_sell.unique_id,
-                    buy_quantity=shares_bought
-                )
                 pool_sell.buy_shares(
                     agent=agent, quantity=shares_sold,
-                    tkn_add=tkn_sell
+                    tkn_add=tkn_sell, delta_tkn=sell_quantity
                 )
                 if pool_sell.fail:
                     return self.fail_transaction(pool_sell.fail, agent)
@@ -752,7 +1016,9 @@ class OmnipoolState(AMM):
                     return self.fail_transaction(self.fail, agent)
                 pool_buy.withdraw_asset(
                     agent=agent, quantity=buy_quantity,
-                    tkn_remove=tkn_buy, fail_on_overdraw=False
+                    tkn_remove=tkn_buy, fail_on_overdraw=False,
+                    # buying shares in pool_sell changed pool_buy too, if they are the same pool
+                    shares_removed=shares_bought if pool_buy is not pool_sell else None
                 )
                 if pool_buy.fail:
                     return self.fail_transaction(pool_buy.fail, agent)
@@ -1265,11 +1531,11 @@ class OmnipoolLiquidityPosition:
 class OmnipoolArchiveState:
     def __init__(self, state: OmnipoolState):
         self.asset_list = [tkn for tkn in state.asset_list]
-        self.liquidity = {k: v for (k, v) in state.liquidity.items()}
-        self.lrna = {k: v for (k, v) in state.lrna.items()}
-        self.lrna_total = sum(state.lrna.values())
-        self.shares = {k: v for (k, v) in state.shares.items()}
-        self.protocol_shares = {k: v for (k, v) in state.protocol_shares.items()}
+        self.liquidity = state.liquidity.copy()
+        self.lrna = state.lrna.copy()
+        self.lrna_total = state.lrna_total
+        self.shares = state.shares.copy()
+        self.protocol_shares = state.protocol_shares.copy()
         self.lrna_imbalance = state.lrna_imbalance
         self.fail = state.fail
         self.stablecoin = state.stablecoin
@@ -1279,8 +1545,8 @@ class OmnipoolArchiveState:
         self.volume_in = state.current_block.volume_in
         self.volume_out = state.current_block.volume_out
         # record these for analysis later
-        self.last_fee = {k: v for (k, v) in state.last_fee.items()}
-        self.last_lrna_fee = {k: v for (k, v) in state.last_lrna_fee.items()}
+        self.last_fee = state.last_fee.copy()
+        self.last_lrna_fee = state.last_lrna_fee.copy()
 
 
 # Works with OmnipoolState *or* OmnipoolArchiveState
@@ -1288,7 +1554,7 @@ def price(state: OmnipoolState or OmnipoolArchiveState, tkn: str, denominator: s
     """
     price of an asset i denominated in j, according to current market conditions in the omnipool
     """
-    if tkn not in state.asset_list + ['LRNA']:
+    if tkn != 'LRNA' and tkn not in state.asset_list:
         return 0
     elif tkn == denominator:
         return 1
@@ -1434,6 +1700,8 @@ def dynamicadd_asset_fee(
         fee_max: float = 0.5
 ) -> FeeMechanism:
     class Fee(FeeMechanism):
+        block_constant = True
+
         def __init__(self):
             super().__init__(
                 fee_function=self.fee_function,
@@ -1469,6 +1737,16 @@ def dynamicadd_asset_fee(
 
             return fee
 
+        def fast_forward(self, blocks: int, block: Block) -> float:
+            exchange, tkn = self.exchange, self.tkn
+            raise_oracle: Oracle = exchange.oracles[raise_oracle_name]
+            self.time_step = exchange.time_step + blocks
+            return _skip_dynamic_fee(
+                exchange.last_fee[tkn], raise_oracle.volume_out[tkn] - raise_oracle.volume_in[tkn],
+                raise_oracle.liquidity[tkn], block.liquidity[tkn], raise_oracle.decay_factor, blocks,
+                amplification, decay, minimum, fee_max
+            )
+
     return Fee()
 
 
@@ -1480,6 +1758,8 @@ def dynamicadd_lrna_fee(
         fee_max: float = 0.5,
 ) -> FeeMechanism:
     class Fee(FeeMechanism):
+        block_constant = True
+
         def __init__(self):
             super().__init__(
                 fee_function=self.fee_function,
@@ -1515,9 +1795,43 @@ def dynamicadd_lrna_fee(
 
             return fee
 
+        def fast_forward(self, blocks: int, block: Block) -> float:
+            exchange, tkn = self.exchange, self.tkn
+            raise_oracle: Oracle = exchange.oracles[raise_oracle_name]
+            self.time_step = exchange.time_step + blocks
+            return _skip_dynamic_fee(
+                exchange.last_lrna_fee[tkn], raise_oracle.volume_in[tkn] - raise_oracle.volume_out[tkn],
+                raise_oracle.liquidity[tkn], block.liquidity[tkn], raise_oracle.decay_factor, blocks,
+                amplification, decay, minimum, fee_max
+            )
+
     return Fee()
 
 
+def _skip_dynamic_fee(
+        fee: float,
+        net_volume: float,
+        liquidity: float,
+        block_liquidity: float,
+        decay_factor: float,
+        blocks: int,
+        amplification: float,
+        decay: float,
+        minimum: float,
+        fee_max: float
+) -> float:
+    # a dynamic fee after `blocks` blocks with no trades, while its oracle's net volume decays away
+    for _ in range(blocks):
+        net_volume *= 1 - decay_factor
+        liquidity = (1 - decay_factor) * liquidity + decay_factor * block_liquidity
+        x = net_volume / liquidity if liquidity != 0 else 0
+        fee = min(max(fee + amplification * x - decay, minimum), fee_max)
+        if fee == minimum and amplification * abs(net_volume) <= decay * min(liquidity, block_liquidity):
+            # the volume can't outweigh the decay any more, so the fee stays at the minimum
+            break
+    return fee
+
+
 def value_assets(prices: dict, assets: dict) -> float:
     """
     return the value of the agent's assets if they were sold at current spot prices
@@ -180,12 +180,12 @@ class OmnipoolRouter:
             stable_pool: StableSwapPoolState = self.exchanges[buy_pool_id]
             if buy_quantity:
                 # buy a specific quantity of a stableswap asset using LRNA
-                shares_needed = stable_pool.calculate_withdrawal_shares(tkn_remove=tkn_buy, quantity=buy_quantity)
+                _, _, shares_needed = omnipool.calculate_stable_buy(tkn_buy, 'LRNA', buy_quantity, pool_buy=stable_pool)
                 omnipool.lrna_swap(agent, delta_ra=shares_needed, tkn=buy_pool_id)
                 if omnipool.fail:
                     # if the swap failed, the transaction failed.
                     return self.fail_transaction(omnipool.fail)
-                stable_pool.withdraw_asset(agent, buy_quantity, tkn_buy)
+                stable_pool.withdraw_asset(agent, buy_quantity, tkn_buy, shares_removed=shares_needed)
                 return self
             elif sell_quantity:
                 # sell a specific quantity of LRNA for a stableswap asset
@@ -221,10 +221,12 @@ class OmnipoolRouter:
                 return self
             elif buy_quantity:
                 # buy an omnipool asset with a stableswap asset
-                sell_shares = omnipool.calculate_sell_from_buy(tkn_buy, stable_pool.unique_id, buy_quantity)
+                sell_quantity, sell_shares, _ = omnipool.calculate_stable_buy(
+                    tkn_buy, tkn_sell, buy_quantity, pool_sell=stable_pool
+                )
                 if sell_shares < 0:
                     return self.fail_transaction("Not enough liquidity in the stableswap/LRNA pool.")
-                stable_pool.buy_shares(agent, sell_shares, tkn_sell)
+                stable_pool.buy_shares(agent, sell_shares, tkn_sell, delta_tkn=sell_quantity)
                 if stable_pool.fail:
                     return self.fail_transaction(stable_pool.fail)
                 omnipool.swap(agent, tkn_buy, stable_pool.unique_id, buy_quantity)
@@ -234,7 +236,9 @@ class OmnipoolRouter:
             stable_pool: StableSwapPoolState = self.exchanges[buy_pool_id]
             if buy_quantity:
                 # buy a stableswap asset with an omnipool asset
-                shares_traded = stable_pool.calculate_withdrawal_shares(tkn_buy, buy_quantity)
+                _, _, shares_traded = omnipool.calculate_stable_buy(
+                    tkn_buy, tkn_sell, buy_quantity, pool_buy=stable_pool
+                )
 
                 # buy shares in the subpool
                 omnipool.swap(agent, tkn_buy=stable_pool.unique_id, tkn_sell=tkn_sell, buy_quantity=shares_traded)
@@ -242,7 +246,7 @@ class OmnipoolRouter:
                     # if the swap failed, the transaction failed.
                     return self.fail_transaction(omnipool.fail)
                 # withdraw the shares for the desired token
-                stable_pool.withdraw_asset(agent, quantity=buy_quantity, tkn_remove=tkn_buy)
+                stable_pool.withdraw_asset(agent, quantity=buy_quantity, tkn_remove=tkn_buy, shares_removed=shares_traded)
                 if stable_pool.fail:
                     return self.fail_transaction(stable_pool.fail)
                 return self
@@ -268,17 +272,14 @@ class OmnipoolRouter:
             pool_sell: StableSwapPoolState = self.exchanges[sell_pool_id]
             if buy_quantity:
                 # buy enough shares of tkn_sell to afford buy_quantity worth of tkn_buy
-                shares_bought = pool_buy.calculate_withdrawal_shares(tkn_buy, buy_quantity)
+                sell_quantity, shares_sold, shares_bought = omnipool.calculate_stable_buy(
+                    tkn_buy, tkn_sell, buy_quantity, pool_buy=pool_buy, pool_sell=pool_sell
+                )
                 if shares_bought > pool_buy.liquidity[tkn_buy]:
                     return self.fail_transaction(f'Not enough liquidity in {pool_buy.unique_id}: {tkn_buy}.')
-                shares_sold = omnipool.calculate_sell_from_buy(
-                    tkn_buy=pool_buy.unique_id,
-                    tkn_sell=pool_sell.unique_id,
-                    buy_quantity=shares_bought
-                )
                 pool_sell.buy_shares(
                     agent=agent, quantity=shares_sold,
-                    tkn_add=tkn_sell
+                    tkn_add=tkn_sell, delta_tkn=sell_quantity
                 )
                 if pool_sell.fail:
                     return self.fail_transaction(pool_sell.fail)
@@ -291,7 +292,8 @@ class OmnipoolRouter:
                     return self.fail_transaction(omnipool.fail)
                 pool_buy.withdraw_asset(
                     agent=agent, quantity=buy_quantity,
-                    tkn_remove=tkn_buy, fail_on_overdraw=False
+                    tkn_remove=tkn_buy, fail_on_overdraw=False,
+                    shares_removed=shares_bought
                 )
                 if pool_buy.fail:
                     return self.fail_transaction(pool_buy.fail)
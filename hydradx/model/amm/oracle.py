@@ -61,6 +61,23 @@ class Oracle:
             ) if tkn in self.volume_out else block.volume_out[tkn]
         return self
 
+    def fast_forward(self, block: Block, blocks: int):
+        """
+        The same as calling update(block) `blocks` times: each value moves towards the block's
+        by a factor of (1 - decay_factor) ** blocks.
+        """
+        self.age += blocks
+        remaining = (1 - self.decay_factor) ** blocks
+        for values, block_values in (
+                (self.liquidity, block.liquidity), (self.price, block.price),
+                (self.volume_in, block.volume_in), (self.volume_out, block.volume_out)
+        ):
+            for tkn in block.liquidity:
+                values[tkn] = (
+                    block_values[tkn] + remaining * (values[tkn] - block_values[tkn])
+                ) if tkn in values else block_values[tkn]
+        return self
+
 
 class OracleArchiveState:
     def __init__(self, oracle: Oracle):
@@ -0,0 +1,178 @@
+import json
+import os
+from typing import Callable
+
+import numpy as np
+
+
+class PricePaths:
+    """
+    External market prices of a fixed list of assets over a whole run, drawn or loaded up front:
+    prices[path, step, i] is the price of assets[i] at time step `step` on path `path`, where step 0 is
+    the initial price. Follow a path during a run with
+        GlobalState(..., evolve_function=paths.evolve_function(path))
+
+    Indexing with a path number or slice gives a PricePaths that shares the same array, so Monte Carlo
+    batches can draw one large set of paths and hand each run its own slice.
+
+    The array can also be a memory-mapped file (see save, load and create), for long historical price series.
+    """
+    def __init__(self, assets: list[str], prices: np.ndarray):
+        prices = np.asanyarray(prices)
+        if not np.issubdtype(prices.dtype, np.floating):
+            prices = prices.astype(float)
+        if prices.ndim == 2:
+            prices = prices[np.newaxis]
+        if prices.ndim != 3 or prices.shape[2] != len(assets):
+            raise ValueError('prices should have the shape (paths, time steps + 1, assets).')
+        self.assets = list(assets)
+        self.prices = prices
+        self.asset_index = {tkn: i for i, tkn in enumerate(self.assets)}
+
+    @property
+    def n_paths(self) -> int:
+        return self.prices.shape[0]
+
+    @property
+    def time_steps(self) -> int:
+        return self.prices.shape[1] - 1
+
+    def __len__(self):
+        return self.n_paths
+
+    def __getitem__(self, paths: int or slice) -> 'PricePaths':
+        if isinstance(paths, (int, np.integer)):
+            paths = slice(paths, paths + 1 if paths != -1 else None)
+        return PricePaths(self.assets, self.prices[paths])
+
+    def path(self, tkn: str, path: int = 0) -> np.ndarray:
+        """ the price of tkn at every step of one path """
+        return self.prices[path, :, self.asset_index[tkn]]
+
+    def at(self, step: int, path: int = 0) -> dict[str: float]:
+        return dict(zip(self.assets, self.prices[path, step].tolist()))
+
+    def evolve_function(self, path: int = 0) -> Callable:
+        """
+        Sets state.external_market to the prices on the given path at every time step.
+        """
+        prices, assets = self.prices[path], self.assets
+
+        def transform(state):
+            state.external_market.update(zip(assets, prices[state.time_step].tolist()))
+            return state
+
+        transform.__name__ = 'price_paths'
+        return transform
+
+    def apply(self, state, overrides: dict):
+        """
+        For monte_carlo.run_paths: makes the run follow the path given as overrides['path'].
+        """
+        state._evolve_function = self.evolve_function(overrides['path'])
+        state.evolve_function = state._evolve_function.__name__
+
+    def save(self, path: str):
+        """
+        Saves the prices to path (a .npy file) and the asset names next to it (.json).
+        """
+        np.save(path, self.prices)
+        with open(_assets_file(path), 'w') as f:
+            json.dump(self.assets, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'PricePaths':
+        """
+        Opens prices saved with save() or create(). With mmap=True (the default) the file is memory-mapped
+        read-only, so only the rows a run actually reaches are ever read from disk.
+        """
+        with open(_assets_file(path)) as f:
+            assets = json.load(f)
+        return cls(assets, np.load(path, mmap_mode='r' if mmap else None))
+
+    @classmethod
+    def create(
+            cls,
+            path: str,
+            assets: list[str],
+            time_steps: int,
+            n_paths: int = 1,
+            dtype=np.float64
+    ) -> 'PricePaths':
+        """
+        A new memory-mapped file of prices, all zero, to be filled in a piece at a time, e.g.
+            paths = PricePaths.create('prices.npy', ['DOT', 'HDX'], time_steps=len(dot_prices) - 1)
+            paths.prices[0, :, paths.asset_index['DOT']] = dot_prices
+            paths.prices.flush()
+        """
+        prices = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n_paths, time_steps + 1, len(assets)))
+        with open(_assets_file(path), 'w') as f:
+            json.dump(list(assets), f)
+        return cls(assets, prices)
+
+    @classmethod
+    def from_price_list(cls, price_list: list[dict[str: float]]) -> 'PricePaths':
+        """ the same prices as historical_prices(price_list) would set """
+        assets = list(price_list[0])
+        return cls(assets, np.array([[prices[tkn] for tkn in assets] for prices in price_list]))
+
+    @classmethod
+    def random_walk(
+            cls,
+            initial_prices: dict[str: float],
+            time_steps: int,
+            volatility: dict[str: float],
+            trend: dict[str: float] = None,
+            n_paths: int = 1,
+            seed: int = None
+    ) -> 'PricePaths':
+        """
+        Geometric Brownian motion. volatility and trend are in percent per time step, as in fluctuate_prices;
+        assets without a volatility or trend keep their price, or follow their trend only.
+
+        Each path is drawn from its own generator, split off from seed, so path i is the same
+        however many paths are drawn alongside it.
+        """
+        trend = trend or {}
+        assets = list(initial_prices)
+        sigma = np.array([volatility.get(tkn, 0) / 100 for tkn in assets])
+        mu = np.array([trend.get(tkn, 0) / 100 for tkn in assets])
+        prices = np.empty((n_paths, time_steps + 1, len(assets)))
+        prices[:, 0] = [initial_prices[tkn] for tkn in assets]
+        for i, child in enumerate(np.random.SeedSequence(seed).spawn(n_paths)):
+            shocks = np.random.default_rng(child).standard_normal((time_steps, len(assets)))
+            log_returns = mu - sigma ** 2 / 2 + sigma * shocks
+            prices[i, 1:] = prices[i, 0] * np.exp(np.cumsum(log_returns, axis=0))
+        return cls(assets, prices)
+
+    @classmethod
+    def oscillating(
+            cls,
+            initial_prices: dict[str: float],
+            time_steps: int,
+            volatility: dict[str: float],
+            trend: dict[str: float] = None,
+            period: int = 1
+    ) -> 'PricePaths':
+        """
+        The same prices oscillate_prices would give, computed all at once.
+        """
+        trend = trend or {}
+        assets = list(initial_prices)
+        steps = np.arange(time_steps)
+        # the direction reverses every period steps
+        direction = np.where((steps // period) % 2 == 0, 1, -1)
+        changes = np.zeros((time_steps + 1, len(assets)))
+        changes[0] = [initial_prices[tkn] for tkn in assets]
+        for i, tkn in enumerate(assets):
+            if tkn in volatility:
+                changes[1:, i] = (
+                    direction * volatility[tkn] / 100 / period
+                    + (trend[tkn] if tkn in trend else 0) / 100 / period
+                )
+        # summed in order, so the result is the same as adding one change per step
+        return cls(assets, np.cumsum(changes, axis=0))
+
+
+def _assets_file(path: str) -> str:
+    return os.path.splitext(path)[0] + '.json'
@@ -1,11 +1,13 @@
 import copy
+import math
 
 from .agents import Agent
-from .amm import AMM
+from .amm import AMM, fast_copy
 
 
 class StableSwapPoolState(AMM):
     unique_id: str = 'stableswap'
+    trade_fields = ('liquidity', 'shares', 'fail')
 
     def __init__(
             self,
@@ -69,6 +71,13 @@ class StableSwapPoolState(AMM):
         if self.target_amp_block >= self.time_step:
             self.amplification += self.amp_change_step
 
+    def fast_forward(self, blocks: int):
+        # the amplification changes on every block up to and including target_amp_block
+        ramp_blocks = min(max(math.floor(self.target_amp_block) - self.time_step, 0), blocks)
+        self.time_step += blocks
+        self.amplification += ramp_blocks * self.amp_change_step
+        return self
+
     def set_amplification(self, amplification: float, duration: float):
         self.target_amp_block = self.time_step + duration
         self.amp_change_step = (amplification - self.amplification) / duration
@@ -231,7 +240,7 @@ class StableSwapPoolState(AMM):
         return self.shares * (1 - updated_d / self.d) / (1 - self.trade_fee)
 
     def copy(self):
-        return copy.deepcopy(self)
+        return fast_copy(self)
 
     def __repr__(self):
         # round to given precision
@@ -359,17 +368,20 @@ class StableSwapPoolState(AMM):
             agent: Agent,
             quantity: float,
             tkn_remove: str,
-            fail_on_overdraw: bool = True
+            fail_on_overdraw: bool = True,
+            shares_removed: float = None
     ):
         """
-        Calculate a withdrawal based on the asset quantity rather than the share quantity
+        Calculate a withdrawal based on the asset quantity rather than the share quantity.
+        shares_removed can be passed in if it was already found with calculate_withdrawal_shares.
         """
         if quantity >= self.liquidity[tkn_remove]:
             return self.fail_transaction(f'Not enough liquidity in {tkn_remove}.')
         if quantity <= 0:
             raise ValueError('Withdraw quantity must be > 0.')
 
-        shares_removed = self.calculate_withdrawal_shares(tkn_remove, quantity)
+        if shares_removed is None:
+            shares_removed = self.calculate_withdrawal_shares(tkn_remove, quantity)
 
         if shares_removed > agent.holdings[self.unique_id]:
             if fail_on_overdraw:
@@ -402,6 +414,20 @@ class StableSwapPoolState(AMM):
         elif shares_removed <= 0:
             return self.fail_transaction('Withdraw quantity must be > 0.')
 
+        dy = self.calculate_remove_liquidity(shares_removed, tkn_remove)
+
+        agent.holdings[self.unique_id] -= shares_removed
+        self.shares -= shares_removed
+        self.liquidity[tkn_remove] -= dy
+        if tkn_remove not in agent.holdings:
+            agent.holdings[tkn_remove] = 0
+        agent.holdings[tkn_remove] += dy
+        return self
+
+    def calculate_remove_liquidity(self, shares_removed: float, tkn_remove: str) -> float:
+        """
+        Quantity of tkn_remove paid out for shares_removed. Does not change the pool.
+        """
         _fee = self.trade_fee
         _fee *= self.n_coins / 4 / (self.n_coins - 1)
 
@@ -422,15 +448,7 @@ class StableSwapPoolState(AMM):
                 dx_expected = self.liquidity[tkn] - self.liquidity[tkn] * reduced_d / initial_d
                 xp_reduced[tkn] -= _fee * dx_expected
 
-        dy = asset_reserve - self.calculate_y(list(xp_reduced.values()), reduced_d)
-
-        agent.holdings[self.unique_id] -= shares_removed
-        self.shares -= shares_removed
-        self.liquidity[tkn_remove] -= dy
-        if tkn_remove not in agent.holdings:
-            agent.holdings[tkn_remove] = 0
-        agent.holdings[tkn_remove] += dy
-        return self
+        return asset_reserve - self.calculate_y(list(xp_reduced.values()), reduced_d)
 
     def add_liquidity(
             self,
@@ -482,8 +500,9 @@ class StableSwapPoolState(AMM):
         if precision is None: precision = self.spot_price_precision
         trade_size = self.liquidity[tkn_add] * precision
         agent = Agent({tkn_add: trade_size})
-        new_state, new_agent = simulate_add_liquidity(self, agent, trade_size, tkn_add)
-        return trade_size / new_agent.holdings[self.unique_id]
+        with self.savepoint():
+            self.add_liquidity(agent, trade_size, tkn_add)
+        return trade_size / agent.holdings[self.unique_id]
 
     def buy_shares_spot(self, tkn_add: str, precision: float = None):
         """Calculates spot price of buying shares as shares denominated in liquidity"""
@@ -492,16 +511,18 @@ class StableSwapPoolState(AMM):
         share_price = self.share_price(tkn_add)
         init_tkn_add = share_price * trade_size * 2
         agent = Agent({tkn_add: init_tkn_add})
-        new_state, new_agent = simulate_buy_shares(self, agent, trade_size, tkn_add)
-        return (init_tkn_add - new_agent.holdings[tkn_add]) / trade_size
+        with self.savepoint():
+            self.buy_shares(agent, trade_size, tkn_add)
+        return (init_tkn_add - agent.holdings[tkn_add]) / trade_size
 
     def remove_liquidity_spot(self, tkn_remove: str, precision: float = None):
         """Calculates spot price of removing liquidity as shares denominated in liquidity"""
         if precision is None: precision = self.spot_price_precision
         trade_size = self.liquidity[tkn_remove] * precision
         agent = Agent({self.unique_id: trade_size})
-        new_state, new_agent = simulate_remove_liquidity(self, agent, trade_size, tkn_remove)
-        return new_agent.holdings[tkn_remove] / trade_size
+        with self.savepoint():
+            self.remove_liquidity(agent, trade_size, tkn_remove)
+        return agent.holdings[tkn_remove] / trade_size
 
     def withdraw_asset_spot(self, tkn_remove: str, precision: float = None):
         """Calculates spot price of withdrawing asset as shares denominated in liquidity"""
@@ -510,14 +531,10 @@ class StableSwapPoolState(AMM):
         delta_shares = self.calculate_withdrawal_shares(tkn_remove, trade_size)
         return trade_size / delta_shares
 
-    def buy_shares(
-            self,
-            agent: Agent,
-            quantity: float,
-            tkn_add: str,
-            fail_overdraft: bool = True
-    ):
-
+    def calculate_buy_shares(self, quantity: float, tkn_add: str) -> float:
+        """
+        Quantity of tkn_add it costs to buy quantity shares. Does not change the pool.
+        """
         initial_d = self.d
         d1 = initial_d + initial_d * quantity / self.shares
 
@@ -543,7 +560,22 @@ class StableSwapPoolState(AMM):
         dy = y1 - asset_reserve
         dy_0 = y - asset_reserve
         fee_amount = dy - dy_0
-        delta_tkn = dy + fee_amount
+        return dy + fee_amount
+
+    def buy_shares(
+            self,
+            agent: Agent,
+            quantity: float,
+            tkn_add: str,
+            fail_overdraft: bool = True,
+            delta_tkn: float = None
+    ):
+        """
+        Buy quantity shares with tkn_add.
+        delta_tkn, the cost in tkn_add, can be passed in if it was already found with calculate_buy_shares.
+        """
+        if delta_tkn is None:
+            delta_tkn = self.calculate_buy_shares(quantity, tkn_add)
 
         if delta_tkn > agent.holdings[tkn_add]:
             if fail_overdraft:
@@ -571,12 +603,8 @@ class StableSwapPoolState(AMM):
         elif shares_removed <= 0:
             raise ValueError('Withdraw quantity must be > 0.')
 
-        share_fraction = shares_removed / self.shares
-
-        delta_tkns = {}
+        delta_tkns = self.calculate_remove_uniform(shares_removed)
         for tkn in self.asset_list:
-            delta_tkns[tkn] = share_fraction * self.liquidity[tkn]  # delta_tkn is positive
-
             if delta_tkns[tkn] >= self.liquidity[tkn]:
                 return self.fail_transaction(f'Not enough liquidity in {tkn}.')
 
@@ -591,6 +619,13 @@ class StableSwapPoolState(AMM):
             agent.holdings[tkn] += delta_tkns[tkn]  # agent is receiving funds, because delta_tkn is a negative number
         return self
 
+    def calculate_remove_uniform(self, shares_removed: float) -> dict[str, float]:
+        """
+        Quantity of each asset paid out for shares_removed, withdrawn in proportion. Does not change the pool.
+        """
+        share_fraction = shares_removed / self.shares
+        return {tkn: share_fraction * self.liquidity[tkn] for tkn in self.asset_list}  # all positive
+
 
 def simulate_swap(
         old_state: StableSwapPoolState,
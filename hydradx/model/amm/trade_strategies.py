@@ -15,11 +15,34 @@ import numpy as np
 
 
 class TradeStrategy:
-    def __init__(self, strategy_function: Callable[[GlobalState, str], GlobalState], name: str, run_once: bool = False):
+    def __init__(
+            self,
+            strategy_function: Callable[[GlobalState, str], GlobalState],
+            name: str,
+            run_once: bool = False,
+            wake_up: Callable[[GlobalState, str], int or None] = None
+    ):
+        """
+        wake_up(state, agent_id), if given, returns the next time step at which the strategy might do something,
+        or None if it never will again. run() does not call execute before then, so every call in between
+        must be a no-op. Without it, the strategy is executed on every time step until it is done: that is the
+        schedule of the strategies here which trade every step (e.g. constant_swaps or the arbitrage strategies
+        without a frequency) or draw random numbers every step (e.g. random_swaps or price_sensitive_trading,
+        whose results would change if any draw were skipped). While one of them is running, a fast-forwarded run
+        can't skip any steps.
+        """
         self.function = strategy_function
         self.run_once = run_once
         self.done = False
         self.name = name
+        self.wake_up = wake_up
+
+    def next_wake_up(self, state: GlobalState, agent_id: str) -> int or None:
+        if self.done:
+            return None
+        elif self.wake_up is None:
+            return state.time_step + 1
+        return self.wake_up(state, agent_id)
 
     def execute(self, state: GlobalState, agent_id: str) -> GlobalState:
         if self.done:
@@ -38,7 +61,14 @@ class TradeStrategy:
             new_state = self.execute(state, agent_id)
             return other.execute(new_state, agent_id)
 
-        return TradeStrategy(combo_function, name='\n'.join([self.name, other.name]))
+        def combo_wake_up(state, agent_id) -> int or None:
+            wake_ups = [
+                wake_up for wake_up in (self.next_wake_up(state, agent_id), other.next_wake_up(state, agent_id))
+                if wake_up is not None
+            ]
+            return min(wake_ups) if wake_ups else None
+
+        return TradeStrategy(combo_function, name='\n'.join([self.name, other.name]), wake_up=combo_wake_up)
 
 
 def random_swaps(
@@ -177,7 +207,10 @@ def invest_all(pool_id: str, assets: list or str = None, when: int = 0) -> Trade
 
             return state
 
-    return TradeStrategy(Strategy(when).execute, name=f'invest all ({pool_id})')
+    return TradeStrategy(
+        Strategy(when).execute, name=f'invest all ({pool_id})',
+        wake_up=lambda state, agent_id: max(when, state.time_step + 1)
+    )
 
 
 def withdraw_all(when: int) -> TradeStrategy:
@@ -205,7 +238,10 @@ def withdraw_all(when: int) -> TradeStrategy:
         else:
             return state
 
-    return TradeStrategy(strategy, name=f'withdraw all at time step {when}')
+    return TradeStrategy(
+        strategy, name=f'withdraw all at time step {when}',
+        wake_up=lambda state, agent_id: when if state.time_step < when else None
+    )
 
 
 def sell_all(pool_id: str, tkn_sell: str, tkn_buy: str, when: int = -1) -> TradeStrategy:
@@ -225,7 +261,16 @@ def sell_all(pool_id: str, tkn_sell: str, tkn_buy: str, when: int = -1) -> Trade
                 pool_id, agent_id, tkn_sell, tkn_buy, sell_quantity=agent.holdings[tkn_sell]
             )
 
-    return TradeStrategy(Strategy().execute, name=f'sell all {tkn_sell} for {tkn_buy}')
+    sell_all_strategy = Strategy()
+
+    def wake_up(state: GlobalState, agent_id: str) -> int or None:
+        if sell_all_strategy.done:
+            return None
+        return max(when, state.time_step + 1)
+
+    return TradeStrategy(
+        sell_all_strategy.execute, name=f'sell all {tkn_sell} for {tkn_buy}', wake_up=wake_up
+    )
 
 
 def invest_and_withdraw(frequency: float = 0.001, pool_id: str = 'omnipool', sell_lrna: bool = False) -> TradeStrategy:
@@ -561,7 +606,10 @@ def omnipool_arbitrage(pool_id: str, arb_precision=1, skip_assets=None, frequenc
 
         return state
 
-    return TradeStrategy(strategy, name='omnipool arbitrage')
+    return TradeStrategy(
+        strategy, name='omnipool arbitrage',
+        wake_up=lambda state, agent_id: (state.time_step // frequency + 1) * frequency
+    )
 
 
 def stableswap_arbitrage(pool_id: str, minimum_profit: float = 1, precision: float = 1e-6):
@@ -688,7 +736,10 @@ def toxic_asset_attack(pool_id: str, asset_name: str, trade_size: float, start_t
         )
         return state
 
-    return TradeStrategy(strategy, name=f'toxic asset attack (asset={asset_name}, trade_size={trade_size})')
+    return TradeStrategy(
+        strategy, name=f'toxic asset attack (asset={asset_name}, trade_size={trade_size})',
+        wake_up=lambda state, agent_id: max(start_timestep, state.time_step + 1)
+    )
 
 
 def price_manipulation(
@@ -765,6 +816,7 @@ def price_manipulation(
     return TradeStrategy(
         strategy_function=price_manipulation_strategy,
         name='price_manipulation',
+        wake_up=lambda state, agent_id: (state.time_step // interval + 1) * interval
     )
 
 
@@ -997,6 +1049,7 @@ def price_sensitive_trading(
         )
         return state
 
+    # no wake_up: random.random() is drawn every step, trade or not, so it has to be executed on every step
     return TradeStrategy(strategy, name=f'price sensitive trading (sensitivity ={price_sensitivity})')
 
 
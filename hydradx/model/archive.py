@@ -0,0 +1,975 @@
+import copy
+import math
+import operator
+import types
+from collections import OrderedDict
+from itertools import chain
+from numbers import Number
+from typing import Callable
+
+import numpy as np
+
+from .amm.agents import AgentArchiveState
+from .amm.global_state import GlobalState, ArchiveState
+from .amm.omnipool_amm import OmnipoolState, OmnipoolArchiveState
+from .amm.oracle import OracleArchiveState
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def _numeric_dicts(obj) -> list[str]:
+    return [
+        name for name, value in vars(obj).items()
+        if isinstance(value, dict) and value and all(_is_number(v) for v in value.values())
+    ]
+
+
+def _numeric_scalars(obj) -> list[str]:
+    return [name for name, value in vars(obj).items() if _is_number(value)]
+
+
+class _Columns:
+    """
+    One row per step for a dict of numbers. Every key gets a column the first time it is seen,
+    and NaN marks a key that was not present in a given row.
+    Spare columns are reserved as rows are, so that adding a key rarely has to reallocate.
+    """
+    def __init__(self, capacity: int):
+        self.keys = []
+        self.index = {}
+        self.values = np.full((capacity, 0), np.nan)
+        # key order of the last dict written, and the columns those keys map to
+        self._layout = []
+        self._layout_columns = np.zeros(0, dtype=int)
+
+    def grow(self, capacity: int):
+        new_values = np.full((capacity, self.values.shape[1]), np.nan)
+        new_values[:len(self.values)] = self.values
+        self.values = new_values
+
+    def _add_key(self, key):
+        column = len(self.keys)
+        if column == self.values.shape[1]:
+            new_values = np.full((len(self.values), max(2 * column, 4)), np.nan)
+            new_values[:, :column] = self.values
+            self.values = new_values
+        self.index[key] = column
+        self.keys.append(key)
+
+    def write(self, row: int, values: dict):
+        layout = list(values)
+        if layout != self._layout:
+            for key in layout:
+                if key not in self.index:
+                    self._add_key(key)
+            self._layout = layout
+            self._layout_columns = np.array([self.index[key] for key in layout], dtype=int)
+        self.values[row, self._layout_columns] = list(values.values())
+
+    def read(self, row: int) -> dict:
+        return {key: value for key, value in zip(self.keys, self.values[row].tolist()) if value == value}
+
+    def rows(self, start: int, end: int) -> '_Columns':
+        rows = _Columns(0)
+        rows.keys = list(self.keys)
+        rows.index = dict(self.index)
+        rows.values = self.values[start:end, :len(self.keys)].copy()
+        return rows
+
+    def extend(self, row: int, other: '_Columns'):
+        # write the rows of other from row on; other may have keys this one does not have yet
+        for key in other.keys:
+            if key not in self.index:
+                self._add_key(key)
+        columns = [self.index[key] for key in other.keys]
+        self.values[row:row + len(other.values), columns] = other.values[:, :len(other.keys)]
+
+
+class PoolArchiveState:
+    """
+    Archived values of a pool that has no archive class of its own.
+    """
+    pass
+
+
+class ColumnarArchive:
+    """
+    Stores the numeric state of every step in preallocated numpy arrays instead of keeping a copy of the state.
+    Pass one to run(..., archive=ColumnarArchive()) and run returns it in place of the list of events.
+
+    For each pool, every dict of numbers (liquidity, lrna, shares, protocol_shares, fees...), every numeric setting,
+    the oracles and the current block volumes are recorded; for each agent, holdings and share_prices;
+    and the external_market prices. Pools, agents and oracles that appear mid-run are recorded from then on,
+    and rebuilt states only include those that were in the state at that step.
+
+    events[i] rebuilds an ArchiveState for step i on access, so existing analysis code
+    (events[i].pools['omnipool'].liquidity['HDX'], get_datastream, ...) keeps working.
+    Rebuilt states are snapshots: changes made to them are not kept in the archive.
+    For bulk analysis, columns(...) gives the underlying arrays directly.
+    """
+    def __init__(self, capacity: int = 0):
+        self.capacity = capacity
+        self.length = 0
+        self.time_step = np.zeros(capacity, dtype=int)
+        self._groups: dict[tuple, _Columns] = {}
+        self._fields: dict[tuple, list[str]] = {}
+        self._scalars: dict[tuple, list[str]] = {}
+        self._labels: dict[tuple, dict] = {}
+
+    def start(self, state: GlobalState, time_steps: int):
+        """
+        Decide which fields to record, based on the state at the start of the run,
+        and allocate room for time_steps rows.
+        """
+        self.capacity = max(self.capacity, time_steps, 1)
+        self.time_step = np.zeros(self.capacity, dtype=int)
+        self.length = 0
+        self._groups = {}
+        self._fields = {}
+        self._scalars = {}
+        self._labels = {}
+        self._last_asset_lists = {}
+        self._add_group(('external_market',))
+        for pool_id, pool in state.pools.items():
+            self._add_pool(pool_id, pool)
+        for agent_id, agent in state.agents.items():
+            self._add_agent(agent_id, agent)
+
+    def _add_pool(self, pool_id: str, pool):
+        # pools that first appear mid-run are added here too; rows from before they existed are empty
+        path = ('pools', pool_id)
+        self._fields[path] = _numeric_dicts(pool)
+        self._scalars[path] = _numeric_scalars(pool)
+        self._add_group(path)
+        for name in self._fields[path]:
+            self._add_group(path + (name,))
+        self._labels[path] = {
+            'type': type(pool),
+            'unique_id': getattr(pool, 'unique_id', pool_id),
+            'stablecoin': getattr(pool, 'stablecoin', None),
+            'fail': np.empty(self.capacity, dtype=object),
+            # None in rows where the pool was not in the state
+            'asset_list': np.empty(self.capacity, dtype=object),
+        }
+        for oracle_name in (getattr(pool, 'oracles', None) or {}):
+            self._add_oracle(path + ('oracles', oracle_name))
+        if hasattr(pool, 'current_block'):
+            for name in ('volume_in', 'volume_out'):
+                self._add_group(path + ('current_block', name))
+
+    def _add_oracle(self, oracle_path: tuple):
+        self._add_group(oracle_path)
+        for name in ('liquidity', 'price', 'volume_in', 'volume_out'):
+            self._add_group(oracle_path + (name,))
+
+    def _add_agent(self, agent_id: str, agent):
+        path = ('agents', agent_id)
+        for name in ('holdings', 'share_prices'):
+            self._add_group(path + (name,))
+        self._labels[path] = {
+            'unique_id': agent.unique_id,
+            # None in rows where the agent was not in the state
+            'asset_list': np.empty(self.capacity, dtype=object),
+        }
+
+    def _add_group(self, path: tuple):
+        self._groups[path] = _Columns(self.capacity)
+
+    def _grow(self):
+        self.capacity = max(2 * self.capacity, 1)
+        for group in self._groups.values():
+            group.grow(self.capacity)
+        self.time_step = np.concatenate([self.time_step, np.zeros(self.capacity - len(self.time_step), dtype=int)])
+        for labels in self._labels.values():
+            for name in ('fail', 'asset_list'):
+                if name in labels:
+                    labels[name] = np.concatenate(
+                        [labels[name], np.empty(self.capacity - len(labels[name]), dtype=object)]
+                    )
+
+    def _asset_list(self, path: tuple, asset_list: list) -> list:
+        # asset lists rarely change, so consecutive rows share one copy
+        last = self._last_asset_lists.get(path)
+        if last is None or last != asset_list:
+            last = self._last_asset_lists[path] = list(asset_list)
+        return last
+
+    def record(self, state: GlobalState):
+        """
+        Write one row with the current values in state.
+        """
+        if self.length >= self.capacity:
+            self._grow()
+        row = self.length
+        groups = self._groups
+        self.time_step[row] = state.time_step
+        groups[('external_market',)].write(row, state.external_market)
+        for pool_id, pool in state.pools.items():
+            path = ('pools', pool_id)
+            if path not in self._labels:
+                self._add_pool(pool_id, pool)
+            pool_vars = vars(pool)
+            groups[path].write(row, {name: pool_vars[name] for name in self._scalars[path]})
+            for name in self._fields[path]:
+                groups[('pools', pool_id, name)].write(row, pool_vars[name])
+            for oracle_name, oracle in (pool_vars.get('oracles') or {}).items():
+                oracle_path = ('pools', pool_id, 'oracles', oracle_name)
+                if oracle_path not in groups:
+                    self._add_oracle(oracle_path)
+                groups[oracle_path].write(row, {'age': oracle.age})
+                groups[oracle_path + ('liquidity',)].write(row, oracle.liquidity)
+                groups[oracle_path + ('price',)].write(row, oracle.price)
+                groups[oracle_path + ('volume_in',)].write(row, oracle.volume_in)
+                groups[oracle_path + ('volume_out',)].write(row, oracle.volume_out)
+            if 'current_block' in pool_vars:
+                groups[('pools', pool_id, 'current_block', 'volume_in')].write(row, pool.current_block.volume_in)
+                groups[('pools', pool_id, 'current_block', 'volume_out')].write(row, pool.current_block.volume_out)
+            labels = self._labels[path]
+            labels['fail'][row] = pool.fail
+            labels['asset_list'][row] = self._asset_list(path, pool.asset_list)
+        for agent_id, agent in state.agents.items():
+            path = ('agents', agent_id)
+            if path not in self._labels:
+                self._add_agent(agent_id, agent)
+            groups[('agents', agent_id, 'holdings')].write(row, agent.holdings)
+            groups[('agents', agent_id, 'share_prices')].write(row, agent.share_prices)
+            self._labels[path]['asset_list'][row] = self._asset_list(path, agent.asset_list)
+        self.length += 1
+
+    def segment(self, start: int) -> 'ColumnarArchive':
+        """
+        The rows from start on, as an archive which extend can append to one holding the rows before start.
+        Checkpointer saves these, so each checkpoint only writes what was recorded since the previous one.
+        """
+        end = self.length
+        segment = copy.copy(self)
+        segment.capacity = segment.length = end - start
+        segment.time_step = self.time_step[start:end].copy()
+        segment._groups = {path: group.rows(start, end) for path, group in self._groups.items()}
+        segment._fields = dict(self._fields)
+        segment._scalars = dict(self._scalars)
+        segment._labels = {
+            path: {
+                name: value[start:end].copy() if isinstance(value, np.ndarray) else value
+                for name, value in labels.items()
+            }
+            for path, labels in self._labels.items()
+        }
+        segment._last_asset_lists = dict(self._last_asset_lists)
+        return segment
+
+    def extend(self, other: 'ColumnarArchive'):
+        """
+        Append the rows of other, a segment of the same run starting where this archive ends.
+        """
+        while self.length + other.length > self.capacity:
+            self._grow()
+        rows = slice(self.length, self.length + other.length)
+        self.time_step[rows] = other.time_step[:other.length]
+        for path, group in other._groups.items():
+            if path not in self._groups:
+                self._add_group(path)
+            self._groups[path].extend(self.length, group)
+        self._fields.update(other._fields)
+        self._scalars.update(other._scalars)
+        for path, labels in other._labels.items():
+            if path not in self._labels:
+                self._labels[path] = {
+                    name: np.empty(self.capacity, dtype=object) if isinstance(value, np.ndarray) else value
+                    for name, value in labels.items()
+                }
+            for name, value in labels.items():
+                if isinstance(value, np.ndarray):
+                    self._labels[path][name][rows] = value[:other.length]
+        self._last_asset_lists = dict(other._last_asset_lists)
+        self.length += other.length
+
+    def columns(self, *path) -> dict[any, np.ndarray]:
+        """
+        The recorded values of one group as {key: array with one value per step}, e.g.
+            archive.columns('pools', 'omnipool', 'liquidity')['HDX']
+            archive.columns('pools', 'omnipool', 'oracles', 'price', 'price')['DOT']
+            archive.columns('agents', 'trader', 'holdings')['USD']
+            archive.columns('external_market')['DOT']
+        Scalar settings of a pool are in columns('pools', pool_id), and oracle age in the oracle's own group.
+        """
+        group = self._groups[tuple(path)]
+        return {key: group.values[:self.length, i] for i, key in enumerate(group.keys)}
+
+    def _pool_state(self, pool_id: str, row: int):
+        path = ('pools', pool_id)
+        labels = self._labels[path]
+        pool_type = labels['type']
+        pool = object.__new__(OmnipoolArchiveState if issubclass(pool_type, OmnipoolState) else PoolArchiveState)
+        pool.unique_id = labels['unique_id']
+        pool.stablecoin = labels['stablecoin']
+        pool.fail = labels['fail'][row]
+        pool.asset_list = list(labels['asset_list'][row])
+        for name, value in self._groups[path].read(row).items():
+            setattr(pool, name, value)
+        for name in self._fields[path]:
+            setattr(pool, name, self._groups[('pools', pool_id, name)].read(row))
+        oracles = {}
+        for group_path in self._groups:
+            if len(group_path) == 4 and group_path[:3] == ('pools', pool_id, 'oracles'):
+                age = self._groups[group_path].read(row).get('age')
+                if age is None:
+                    # the oracle was added after this row
+                    continue
+                oracle = object.__new__(OracleArchiveState)
+                for name in ('liquidity', 'price', 'volume_in', 'volume_out'):
+                    setattr(oracle, name, self._groups[group_path + (name,)].read(row))
+                oracle.age = age
+                oracles[group_path[3]] = oracle
+        if oracles or isinstance(pool, OmnipoolArchiveState):
+            pool.oracles = oracles
+        if ('pools', pool_id, 'current_block', 'volume_in') in self._groups:
+            pool.volume_in = self._groups[('pools', pool_id, 'current_block', 'volume_in')].read(row)
+            pool.volume_out = self._groups[('pools', pool_id, 'current_block', 'volume_out')].read(row)
+        if isinstance(pool, OmnipoolArchiveState):
+            pool.lrna_total = sum(pool.lrna.values())
+        return pool
+
+    def _agent_state(self, agent_id: str, row: int) -> AgentArchiveState:
+        agent = object.__new__(AgentArchiveState)
+        agent.unique_id = self._labels[('agents', agent_id)]['unique_id']
+        agent.holdings = self._groups[('agents', agent_id, 'holdings')].read(row)
+        agent.share_prices = self._groups[('agents', agent_id, 'share_prices')].read(row)
+        agent.asset_list = list(self._labels[('agents', agent_id)]['asset_list'][row])
+        return agent
+
+    def _state(self, row: int) -> ArchiveState:
+        state = object.__new__(ArchiveState)
+        state.time_step = int(self.time_step[row])
+        state.external_market = self._groups[('external_market',)].read(row)
+        present = [path for path, labels in self._labels.items() if labels['asset_list'][row] is not None]
+        state.pools = {path[1]: self._pool_state(path[1], row) for path in present if path[0] == 'pools'}
+        state.agents = {path[1]: self._agent_state(path[1], row) for path in present if path[0] == 'agents'}
+        return state
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item: int or slice):
+        if isinstance(item, slice):
+            return [self._state(row) for row in range(*item.indices(self.length))]
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError('archive index out of range')
+        return self._state(item)
+
+    def __iter__(self):
+        for row in range(self.length):
+            yield self._state(row)
+
+
+class Datastream:
+    """
+    One value (or a group of values) to record at every step, picked out the same way as in get_datastream:
+        Datastream(pool='omnipool', prop='liquidity', key=['HDX', 'DOT'])
+        Datastream(pool='omnipool', oracle='price', prop='price', key='DOT')
+        Datastream(pool='omnipool', prop='last_fee', key='all')
+        Datastream(pool='omnipool', prop='lrna_imbalance')
+        Datastream(agent='LP', prop='holdings', key='USD')
+        Datastream(agent='LP', prop='cash_out')  # GlobalState.cash_out(agent); likewise pool_val etc.
+        Datastream(asset='DOT')  # external market price; asset='all' for every price
+
+    Use them as GlobalState(save_data={name: Datastream(...)}), or record them into arrays of the given dtype
+    with run(..., archive=DatastreamArchive()). 'all', or no key for a dict, means every key in the state
+    at the start of the run; a key which later goes missing reads as NaN.
+    """
+    def __init__(
+            self,
+            pool: str = '',
+            agent: str = '',
+            asset: str or list = '',
+            oracle: str = '',
+            prop: str = '',
+            key: str or list = '',
+            dtype=np.float64
+    ):
+        if len([name for name in (pool, agent, asset) if name]) != 1:
+            raise ValueError('Exactly one of pool, agent or asset should be given.')
+        if asset:
+            self.group, self.instance, key = 'external_market', '', asset
+        else:
+            self.group, self.instance = ('pools', pool) if pool else ('agents', agent)
+        self.oracle = oracle
+        self.prop = prop
+        self.key = key
+        self.dtype = np.dtype(dtype)
+
+    def _keys(self, values: dict) -> list or None:
+        if self.key in ('', 'all'):
+            return list(values)
+        return self.key if isinstance(self.key, list) else None
+
+    def readers(self, state: GlobalState) -> dict:
+        """
+        {key: function(state) -> number} for each value in the stream, with key None if it is a single value.
+        """
+        group, instance, oracle, prop, key = self.group, self.instance, self.oracle, self.prop, self.key
+        if group == 'external_market':
+            keys = self._keys(state.external_market)
+            readers = {
+                tkn: lambda s, tkn=tkn: s.external_market.get(tkn, math.nan) for tkn in keys or [key]
+            }
+            return readers if keys is not None else {None: readers[key]}
+
+        def owner(s):
+            return getattr(s, group)[instance]
+
+        if oracle:
+            def values(s):
+                return getattr(owner(s).oracles[oracle], prop)
+        elif callable(getattr(GlobalState, prop, None)):
+            # e.g. GlobalState.pool_val(pool), GlobalState.cash_out(agent)
+            method = getattr(GlobalState, prop)
+            return {None: lambda s: method(s, owner(s))}
+        elif callable(getattr(owner(state), prop)):
+            # e.g. pool.price(pool, tkn)
+            keys = self._keys(dict.fromkeys(owner(state).asset_list))
+            readers = {
+                tkn: lambda s, tkn=tkn: getattr(owner(s), prop)(owner(s), tkn) for tkn in keys or [key]
+            }
+            return readers if keys is not None else {None: readers[key]}
+        else:
+            def values(s):
+                return getattr(owner(s), prop)
+
+        current = values(state)
+        if not isinstance(current, dict):
+            return {None: values}
+        keys = self._keys(current)
+        readers = {tkn: lambda s, tkn=tkn: values(s).get(tkn, math.nan) for tkn in keys or [key]}
+        return readers if keys is not None else {None: readers[key]}
+
+    def assemble(self, state: GlobalState) -> Callable:
+        """
+        function(state) -> the value, or {key: value} for several keys, as GlobalState.save_data expects
+        """
+        readers = self.readers(state)
+        if list(readers) == [None]:
+            return readers[None]
+        return lambda s: {tkn: reader(s) for tkn, reader in readers.items()}
+
+
+class DatastreamArchive:
+    """
+    Records only the given datastreams (see Datastream), each value into its own preallocated array.
+    Pass one to run(..., archive=DatastreamArchive()) to record initial_state's save_data,
+    or give the datastreams here. With every=n, only every nth time step is recorded.
+
+    archive['name'] is the recorded array, or {key: array} for a datastream with several keys,
+    and archive.time_step holds the time step of each row. get_datastream (and so plot) reads the arrays directly:
+        get_datastream(archive, pool='omnipool', prop='liquidity', key='HDX')
+    archive[i] is row i as a {name: value} dict, as run() returns for save_data.
+    """
+    def __init__(self, datastreams: dict[str: Datastream] = None, every: int = 1, capacity: int = 0):
+        self.datastreams = datastreams
+        self.every = every
+        self.capacity = capacity
+        self.length = 0
+        self.time_step = np.zeros(capacity, dtype=int)
+        self._next_step = 0
+        self._columns = []  # (name, key, reader, array)
+        self._index = {}  # (group, instance, oracle, prop) -> {key: position in self._columns}
+
+    def start(self, state: GlobalState, time_steps: int):
+        datastreams = self.datastreams or state.datastreams
+        if not datastreams:
+            raise ValueError('No datastreams to record.')
+        self.capacity = max(self.capacity, -(-time_steps // self.every), 1)
+        self.time_step = np.zeros(self.capacity, dtype=int)
+        self.length = 0
+        self._next_step = state.time_step + self.every
+        self._columns = []
+        self._index = {}
+        for name, datastream in datastreams.items():
+            identity = (datastream.group, datastream.instance, datastream.oracle, datastream.prop)
+            for key, reader in datastream.readers(state).items():
+                value = reader(state)
+                if not _is_number(value):
+                    raise ValueError(f'Datastream {name} ({key}) is not a number: {value!r}')
+                # a single value is found by the key it was given, if any
+                index_key = datastream.key or None if key is None else key
+                self._index.setdefault(identity, {})[index_key] = len(self._columns)
+                self._columns.append((name, key, reader, np.zeros(self.capacity, dtype=datastream.dtype)))
+
+    def _grow(self):
+        self.capacity = max(2 * self.capacity, 1)
+        self.time_step = np.concatenate([self.time_step, np.zeros(self.capacity - len(self.time_step), dtype=int)])
+        self._columns = [
+            (name, key, reader, np.concatenate([values, np.zeros(self.capacity - len(values), dtype=values.dtype)]))
+            for name, key, reader, values in self._columns
+        ]
+
+    def record(self, state: GlobalState):
+        """
+        Write one row, if the state has reached the next time step to be recorded.
+        """
+        if state.time_step < self._next_step:
+            return
+        self._next_step = state.time_step + self.every
+        if self.length >= self.capacity:
+            self._grow()
+        row = self.length
+        self.time_step[row] = state.time_step
+        for _, _, reader, values in self._columns:
+            values[row] = reader(state)
+        self.length += 1
+
+    def segment(self, start: int) -> 'DatastreamArchive':
+        """
+        The rows from start on, as an archive which extend can append to one holding the rows before start.
+        """
+        end = self.length
+        segment = copy.copy(self)
+        segment.capacity = segment.length = end - start
+        segment.time_step = self.time_step[start:end].copy()
+        segment._columns = [
+            (name, key, reader, values[start:end].copy()) for name, key, reader, values in self._columns
+        ]
+        return segment
+
+    def extend(self, other: 'DatastreamArchive'):
+        """
+        Append the rows of other, a segment of the same run starting where this archive ends.
+        """
+        while self.length + other.length > self.capacity:
+            self._grow()
+        rows = slice(self.length, self.length + other.length)
+        self.time_step[rows] = other.time_step[:other.length]
+        for (_, _, _, values), (_, _, _, other_values) in zip(self._columns, other._columns):
+            values[rows] = other_values[:other.length]
+        self._next_step = other._next_step
+        self.length += other.length
+
+    def find(self, group: str, instance: str = '', oracle: str = '', prop: str = '', key: str or list = ''):
+        """
+        The recorded array for the datastream that get_datastream(...) with the same arguments would read,
+        or {key: array} if key is a list, 'all', or not given for a dict.
+        """
+        if group == 'external_market':
+            instance, key = '', instance or key
+        identity = (group, instance, oracle, prop)
+        if identity not in self._index:
+            raise KeyError(f'{identity} was not recorded.')
+        columns = self._index[identity]
+        if key in ('', 'all') and list(columns) == [None]:
+            key = None
+        if key not in ('', 'all') and not isinstance(key, list):
+            return self._columns[columns[key]][3][:self.length]
+        return {
+            tkn: self._columns[columns[tkn]][3][:self.length]
+            for tkn in (key if isinstance(key, list) else columns)
+        }
+
+    def _row(self, row: int) -> dict:
+        values = {}
+        for name, key, _, column in self._columns:
+            if key is None:
+                values[name] = column[row].item()
+            else:
+                values.setdefault(name, {})[key] = column[row].item()
+        return values
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item: int or slice or str):
+        if isinstance(item, str):
+            columns = [(key, values[:self.length]) for name, key, _, values in self._columns if name == item]
+            if not columns:
+                raise KeyError(item)
+            return columns[0][1] if columns[0][0] is None else dict(columns)
+        if isinstance(item, slice):
+            return [self._row(row) for row in range(*item.indices(self.length))]
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError('archive index out of range')
+        return self._row(item)
+
+    def __iter__(self):
+        for row in range(self.length):
+            yield self._row(row)
+
+
+# path steps: an attribute of an object, or an item of a dict or list
+_ATTR, _ITEM = 0, 1
+# these hold behaviour or caches rather than state, and are shared between (or reset in) copies of a state
+_skipped_attributes = {
+    'trade_strategy', '_evolve_function', 'evolve_function', 'datastreams', 'save_data', 'ledger', '_share_prices'
+}
+_opaque_types = (
+    types.FunctionType, types.MethodType, types.BuiltinFunctionType, types.ModuleType, type, np.ndarray
+)
+_scalar_types = {int, float, bool, str, type(None), np.float64, np.int64}
+_missing = object()
+_nodes = {}
+
+
+class _Node:
+    # a dict, list or object at some path; its contents are at the paths below it
+    __slots__ = ('cls',)
+
+    def __init__(self, cls: type):
+        self.cls = cls
+
+    def __eq__(self, other):
+        return isinstance(other, _Node) and other.cls is self.cls
+
+
+class _Values:
+    # a dict or list of plain values, stored and compared as a whole
+    __slots__ = ('values',)
+
+    def __init__(self, values: dict):
+        self.values = values
+
+    def __eq__(self, other):
+        return isinstance(other, _Values) and other.values == self.values
+
+
+class _ValuesUpdate:
+    # the keys of a dict of plain values which changed or were removed since the previous step
+    __slots__ = ('changed', 'removed')
+
+    def __init__(self, changed: dict, removed: list):
+        self.changed = changed
+        self.removed = removed
+
+
+class _Ref:
+    # an object that was already reached through another path
+    __slots__ = ('path',)
+
+    def __init__(self, path: tuple):
+        self.path = path
+
+    def __eq__(self, other):
+        return isinstance(other, _Ref) and other.path == self.path
+
+
+def _node(cls: type) -> _Node:
+    # one marker per type, so unchanged containers compare by identity
+    if cls not in _nodes:
+        _nodes[cls] = _Node(cls)
+    return _nodes[cls]
+
+
+def _flatten(obj, path: tuple = (), flat: dict = None, seen: dict = None, reuse: tuple = None) -> dict:
+    """
+    Every value in obj as {path: value}, parents before children.
+    reuse, if given, is (previous, current): the config subtrees found are recorded in current,
+    which can be passed as previous to the next call on the same state, so they are only checked, not walked.
+    """
+    flat = {} if flat is None else flat
+    seen = {} if seen is None else seen
+    if type(obj) in _scalar_types:
+        flat[path] = obj
+    elif isinstance(obj, (dict, list)) or (hasattr(obj, '__dict__') and not isinstance(obj, _opaque_types)):
+        if id(obj) in seen:
+            flat[path] = _Ref(seen[id(obj)])
+            return flat
+        seen[id(obj)] = path
+        # dict subclasses (e.g. the ledger's TrackedDict) are archived as plain dicts
+        if isinstance(obj, dict) and all(type(value) in _scalar_types for value in obj.values()):
+            flat[path] = _Values(dict(obj))
+            return flat
+        if type(obj) is list and all(type(value) in _scalar_types for value in obj):
+            flat[path] = _Values(list(obj))
+            return flat
+        if reuse is not None and type(obj) is not list:
+            previous, current = reuse
+            record = previous.get(path)
+            if record is None or record[0] is not obj or (record[1] is not None and not record[1].unchanged(seen)):
+                record = (obj, _Config.build(obj, path, seen))
+            current[path] = record
+            if record[1] is not None:
+                seen.update(record[1].seen)
+                flat.update(record[1].entries)
+                return flat
+        flat[path] = _node(dict if isinstance(obj, dict) else type(obj))
+        if isinstance(obj, dict):
+            items = [((_ITEM, key), value) for key, value in obj.items()]
+        elif isinstance(obj, list):
+            items = [((_ITEM, i), value) for i, value in enumerate(obj)]
+        else:
+            items = [((_ATTR, name), value) for name, value in vars(obj).items() if name not in _skipped_attributes]
+        for step, value in items:
+            if type(value) in _scalar_types:
+                flat[path + (step,)] = value
+            else:
+                _flatten(value, path + (step,), flat, seen, reuse)
+    elif isinstance(obj, (set, np.ndarray)):
+        flat[path] = obj.copy()
+    else:
+        flat[path] = obj
+    return flat
+
+
+class _Config:
+    # a dict or object with no dicts of values, lists, sets or arrays anywhere inside (fee mechanisms, for example),
+    # flattened once and then reused for as long as every member inside is still the very same object
+    __slots__ = ('instances', 'attributes', 'members', 'keys', 'values', 'refs', 'seen', 'entries')
+
+    def __init__(self, objects: list, refs: list, seen: dict, entries: dict):
+        self.instances = [obj for obj in objects if not isinstance(obj, dict)]
+        self.attributes = list(map(vars, self.instances))
+        self.members = [_members(obj) for obj in objects]
+        self.keys = list(chain.from_iterable(self.members))
+        self.values = list(chain.from_iterable(map(dict.values, self.members)))
+        # (object, path) for each reference out of the subtree
+        self.refs = refs
+        # everything inside except the root, which the caller registers
+        self.seen = seen
+        self.entries = entries
+
+    @classmethod
+    def build(cls, obj, path: tuple, seen: dict):
+        """
+        Flatten obj as _flatten would, or return None if it is not a config subtree.
+        """
+        objects, refs, inside, entries = [], [], {}, {}
+
+        def walk(node, node_path: tuple) -> bool:
+            is_dict = isinstance(node, dict)
+            if is_dict and all(type(value) in _scalar_types for value in node.values()):
+                return False
+            objects.append(node)
+            entries[node_path] = _node(dict if is_dict else type(node))
+            for key, value in _members(node).items():
+                if not is_dict and key in _skipped_attributes:
+                    continue
+                step = node_path + ((_ITEM if is_dict else _ATTR, key),)
+                if type(value) in _scalar_types:
+                    entries[step] = value
+                elif id(value) in seen:
+                    entries[step] = _Ref(seen[id(value)])
+                    refs.append((value, seen[id(value)]))
+                elif id(value) in inside:
+                    entries[step] = _Ref(inside[id(value)])
+                elif isinstance(value, (list, set, np.ndarray)):
+                    return False
+                elif isinstance(value, dict) or (hasattr(value, '__dict__') and not isinstance(value, _opaque_types)):
+                    inside[id(value)] = step
+                    if not walk(value, step):
+                        return False
+                else:
+                    entries[step] = value
+            return True
+
+        return cls(objects, refs, inside, entries) if walk(obj, path) else None
+
+    def unchanged(self, seen: dict) -> bool:
+        return (
+            seen.keys().isdisjoint(self.seen)
+            and all(map(operator.is_, map(vars, self.instances), self.attributes))
+            and list(chain.from_iterable(self.members)) == self.keys
+            and all(map(operator.is_, chain.from_iterable(map(dict.values, self.members)), self.values))
+            and all(seen.get(id(obj)) == path for obj, path in self.refs)
+        )
+
+
+def _members(obj) -> dict:
+    return obj if isinstance(obj, dict) else vars(obj)
+
+
+def _same(a, b) -> bool:
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, np.ndarray):
+        return np.array_equal(a, b)
+    return a == b
+
+
+def _diff(previous: dict, current: dict) -> tuple[list, list]:
+    """
+    The changes that turn the state flattened in previous into the one flattened in current,
+    as ([(path, new value)], [removed path]).
+    """
+    changes = []
+    replaced = None
+    for path, value in current.items():
+        if replaced is not None and path[:len(replaced)] == replaced:
+            # everything inside a new container has to be recorded, even if it is unchanged
+            changes.append((path, value))
+            continue
+        replaced = None
+        old = previous.get(path, _missing)
+        if old is value:
+            continue
+        if type(old) is type(value):
+            if type(value) is _Values and type(value.values) is dict:
+                old, new = old.values, value.values
+                if old != new:
+                    changes.append((path, _ValuesUpdate(
+                        {key: v for key, v in new.items() if key not in old or not _same(old[key], v)},
+                        [key for key in old if key not in new]
+                    )))
+                continue
+            if _same(old, value):
+                continue
+        changes.append((path, value))
+        if type(value) is _Node:
+            replaced = path
+    removed = previous.keys() - current.keys()
+    # children before parents, and the end of a list before its start
+    removed = [path for path in reversed(previous) if path in removed] if removed else []
+    return changes, removed
+
+
+def _resolve(obj, path: tuple):
+    for kind, key in path:
+        obj = getattr(obj, key) if kind == _ATTR else obj[key]
+    return obj
+
+
+def _apply(state, delta: tuple[list, list]):
+    changes, removed = delta
+    for path in removed:
+        parent = _resolve(state, path[:-1])
+        kind, key = path[-1]
+        if kind == _ATTR:
+            object.__delattr__(parent, key)
+        else:
+            del parent[key]
+    for path, value in changes:
+        if not path:
+            continue
+        if isinstance(value, _ValuesUpdate):
+            target = _resolve(state, path)
+            for key in value.removed:
+                del target[key]
+            target.update(value.changed)
+            continue
+        if isinstance(value, _Values):
+            value = type(value.values)(value.values)
+        elif isinstance(value, _Node):
+            value = {} if value.cls is dict else [] if value.cls is list else object.__new__(value.cls)
+        elif isinstance(value, _Ref):
+            value = _resolve(state, value.path)
+        elif isinstance(value, (set, np.ndarray)):
+            value = value.copy()
+        parent = _resolve(state, path[:-1])
+        kind, key = path[-1]
+        if kind == _ATTR:
+            # bypass __setattr__ overrides, which would convert fees that are being restored
+            object.__setattr__(parent, key, value)
+        elif isinstance(parent, list) and key == len(parent):
+            parent.append(value)
+        else:
+            parent[key] = value
+
+
+def _clone(state: GlobalState) -> GlobalState:
+    # GlobalState.copy() does not carry everything over exactly (pool.fail, for example), so patch the difference
+    clone = state.copy()
+    _apply(clone, _diff(_flatten(clone), _flatten(state)))
+    return clone
+
+
+class DeltaArchive:
+    """
+    Full-fidelity archive which stores a copy of the state every keyframe_interval steps,
+    and in between only the values that changed since the previous step.
+    Pass one to run(..., archive=DeltaArchive()) and run returns it in place of the list of events.
+
+    Everything reachable from the state is tracked, including NFTs, sub_pools, the money market and OTCs,
+    except trade strategies and the evolve function, which are shared with the live state as in GlobalState.copy().
+    events[i] is rebuilt on access from the nearest keyframe or recently rebuilt state,
+    and the last cache_size rebuilt states are kept. Treat them as read-only, since later lookups may start from them.
+    """
+    def __init__(self, keyframe_interval: int = 100, cache_size: int = 16):
+        self.keyframe_interval = keyframe_interval
+        self.cache_size = cache_size
+        self.length = 0
+        self._keyframes = {}
+        self._deltas = []
+        self._previous = {}
+        self._configs = {}
+        self._cache = OrderedDict()
+
+    def start(self, state: GlobalState, time_steps: int):
+        self.length = 0
+        self._keyframes = {}
+        self._deltas = []
+        self._previous = {}
+        self._configs = {}
+        self._cache = OrderedDict()
+
+    def record(self, state: GlobalState):
+        """
+        Store the changes since the last recorded step, or a keyframe.
+        """
+        configs = {}
+        current = _flatten(state, reuse=(self._configs, configs))
+        self._configs = configs
+        if self.length % self.keyframe_interval == 0:
+            keyframe = state.copy()
+            _apply(keyframe, _diff(_flatten(keyframe), current))
+            self._keyframes[self.length] = keyframe
+            self._deltas.append(None)
+        else:
+            self._deltas.append(_diff(self._previous, current))
+        self._previous = current
+        self.length += 1
+
+    def segment(self, start: int) -> 'DeltaArchive':
+        """
+        The rows from start on, as an archive which extend can append to one holding the rows before start.
+        Rows ahead of the segment's first keyframe can only be read once it has been appended.
+        """
+        segment = copy.copy(self)
+        segment.length = self.length - start
+        segment._keyframes = {row - start: keyframe for row, keyframe in self._keyframes.items() if row >= start}
+        segment._deltas = self._deltas[start:]
+        segment._configs = {}
+        segment._cache = OrderedDict()
+        return segment
+
+    def extend(self, other: 'DeltaArchive'):
+        """
+        Append the rows of other, a segment of the same run starting where this archive ends.
+        """
+        self._keyframes.update({row + self.length: keyframe for row, keyframe in other._keyframes.items()})
+        self._deltas.extend(other._deltas)
+        self._previous = other._previous
+        self.length += other.length
+
+    def _state(self, row: int) -> GlobalState:
+        if row in self._cache:
+            self._cache.move_to_end(row)
+            return self._cache[row]
+        keyframe_row = row - row % self.keyframe_interval
+        start = max([cached for cached in self._cache if keyframe_row <= cached < row], default=keyframe_row)
+        state = _clone(self._cache[start] if start in self._cache else self._keyframes[start])
+        for delta in self._deltas[start + 1: row + 1]:
+            _apply(state, delta)
+        self._cache[row] = state
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return state
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item: int or slice):
+        if isinstance(item, slice):
+            return [self._state(row) for row in range(*item.indices(self.length))]
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError('archive index out of range')
+        return self._state(item)
+
+    def __iter__(self):
+        for row in range(self.length):
+            yield self._state(row)
@@ -0,0 +1,139 @@
+import glob
+import os
+import random
+
+import dill
+import numpy as np
+
+from .amm.global_state import GlobalState
+
+
+def _write(path: str, data: bytes):
+    # write to a temporary file first, so a crash mid-write never leaves a truncated checkpoint behind
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+def _steps_saved(path: str) -> int:
+    return int(os.path.basename(path).split('_')[-1].split('.')[0])
+
+
+class Checkpointer:
+    """
+    Periodically saves everything needed to continue a run: the live GlobalState (pools, agents, money_market,
+    otcs, and the trade strategies and evolve function along with whatever state they hold), the state of the
+    `random` and `numpy.random` generators, and the events archived so far.
+
+    Each checkpoint is written as two files in directory:
+        state_<step>.pkl: the state and random generators after <step> steps
+        events_<step>.pkl: the events archived since the previous checkpoint, as a list, or when run() was
+            given an archive object, as an archive of the same type holding only those steps (see its segment method)
+    Where os.fork is available, each checkpoint is serialized and written by a forked child process,
+    which sees a frozen copy of memory, so the simulation carries on while the checkpoint is written.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._events_saved = 0
+        self._writer_pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, '*_*.pkl')):
+            os.remove(path)
+        self._events_saved = 0
+
+    def save(self, step: int, state: GlobalState, events: list or object):
+        """
+        Snapshot state and events after step steps.
+        events is either the list of events so far, or an archive object.
+        """
+        segment_start = self._events_saved
+        self._events_saved = len(events)
+        # taken here, because `random` is reseeded in forked children
+        generators = {'random': random.getstate(), 'numpy_random': np.random.get_state()}
+        if not hasattr(os, 'fork'):
+            self._write(step, state, events, segment_start, generators)
+            return
+        self.wait()
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                self._write(step, state, events, segment_start, generators)
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+        self._writer_pid = pid
+
+    def _write(self, step: int, state: GlobalState, events: list or object, segment_start: int, generators: dict):
+        segment = events[segment_start:] if isinstance(events, list) else events.segment(segment_start)
+        _write(
+            os.path.join(self.directory, f'events_{step:010d}.pkl'),
+            dill.dumps(segment, protocol=dill.HIGHEST_PROTOCOL)
+        )
+        # the state file goes last: it is only there once its events are
+        _write(
+            os.path.join(self.directory, f'state_{step:010d}.pkl'),
+            dill.dumps({
+                'step': step,
+                'state': state,
+                **generators
+            }, protocol=dill.HIGHEST_PROTOCOL)
+        )
+
+    def wait(self):
+        """
+        Wait for the checkpoint being written, if any.
+        """
+        if self._writer_pid is not None:
+            _, status = os.waitpid(self._writer_pid, 0)
+            self._writer_pid = None
+            if status != 0:
+                raise RuntimeError('Checkpoint could not be written.')
+
+    def latest(self) -> str or None:
+        paths = sorted(glob.glob(os.path.join(self.directory, 'state_*.pkl')))
+        return paths[-1] if paths else None
+
+    def resume(self) -> tuple[int, GlobalState, list or object] or None:
+        """
+        Load the latest checkpoint and restore the random generators.
+        Returns (steps completed, state, events), or None if there is no checkpoint.
+        Raises FileNotFoundError if the events of any checkpoint are missing, since they can't be put back together.
+        """
+        path = self.latest()
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            snapshot = dill.load(f)
+        step = snapshot['step']
+        events_paths = sorted(glob.glob(os.path.join(self.directory, 'events_*.pkl')))
+        missing = sorted(
+            {_steps_saved(state_path) for state_path in glob.glob(os.path.join(self.directory, 'state_*.pkl'))}
+            - {_steps_saved(events_path) for events_path in events_paths}
+        )
+        if missing:
+            raise FileNotFoundError(
+                f'Checkpoints in {self.directory} have no events file for steps {missing}, so their events are lost.'
+            )
+        events = None
+        for events_path in events_paths:
+            if _steps_saved(events_path) <= step:
+                with open(events_path, 'rb') as f:
+                    segment = dill.load(f)
+                # lists and archive objects both put their segments back together with extend
+                if events is None:
+                    events = segment
+                else:
+                    events.extend(segment)
+        self._events_saved = len(events)
+        random.setstate(snapshot['random'])
+        np.random.set_state(snapshot['numpy_random'])
+        return step, snapshot['state'], events
+
+    def close(self):
+        """
+        Wait for all checkpoints to be written.
+        """
+        self.wait()
@@ -0,0 +1,436 @@
+from typing import Callable
+
+import numpy as np
+
+from .amm.agents import Agent
+from .amm.omnipool_amm import OmnipoolState
+from .amm.price_paths import PricePaths
+
+
+class OmnipoolEnsemble:
+    """
+    n_paths copies of one Omnipool and its agents, simulated in lockstep. Reserves are arrays of shape
+    (paths, assets) and every operation acts on all paths at once, with its own assets and quantities per path,
+    following the same math as OmnipoolState.swap and OmnipoolState._lrna_swap.
+
+    Agent holdings are arrays of shape (paths, assets + 1), with LRNA in the last column.
+    Only Omnipools with fixed fees and no sub-pools are supported.
+    """
+    def __init__(
+            self,
+            omnipool: OmnipoolState,
+            agents: dict[str: Agent],
+            n_paths: int,
+            external_market: dict[str: float] = None
+    ):
+        if omnipool.sub_pools:
+            raise ValueError('Sub-pools are not supported.')
+        for fee in list(omnipool.asset_fee.values()) + list(omnipool.lrna_fee.values()):
+            if not hasattr(fee, 'fee'):
+                raise ValueError(f'Only fixed fees are supported, not {fee.name}.')
+
+        self.n_paths = n_paths
+        self.asset_list = omnipool.asset_list.copy()
+        self.index = {tkn: i for i, tkn in enumerate(self.asset_list)}
+        self.index['LRNA'] = len(self.asset_list)
+        self.stablecoin = omnipool.stablecoin
+        self.time_step = 0
+        self._omnipool = omnipool.copy()
+        self._agents = {agent_id: agent.copy() for agent_id, agent in agents.items()}
+
+        def per_path(values: dict) -> np.ndarray:
+            return np.tile(np.array([values[tkn] for tkn in self.asset_list], dtype=float), (n_paths, 1))
+
+        self.liquidity = per_path(omnipool.liquidity)
+        self.lrna = per_path(omnipool.lrna)
+        self.shares = per_path(omnipool.shares)
+        self.lrna_imbalance = np.full(n_paths, float(omnipool.lrna_imbalance))
+        self.asset_fee = np.array([omnipool.asset_fee[tkn].fee for tkn in self.asset_list])
+        self.lrna_fee = np.array([omnipool.lrna_fee[tkn].fee for tkn in self.asset_list])
+        self.lrna_mint_pct = omnipool.lrna_mint_pct
+        self.trade_limit_per_block = omnipool.trade_limit_per_block
+
+        block = omnipool.current_block
+        self.block_liquidity = per_path(block.liquidity)
+        self.block_price = per_path(block.price)
+        self.volume_in = per_path(block.volume_in)
+        self.volume_out = per_path(block.volume_out)
+        self.oracles = {
+            name: {
+                'decay_factor': oracle.decay_factor,
+                'age': oracle.age,
+                **{attr: per_path(getattr(oracle, attr)) for attr in ('liquidity', 'price', 'volume_in', 'volume_out')}
+            }
+            for name, oracle in omnipool.oracles.items()
+        }
+
+        self.holdings = {
+            agent_id: np.tile(
+                np.array([agent.holdings.get(tkn, 0) for tkn in self.asset_list + ['LRNA']], dtype=float),
+                (n_paths, 1)
+            )
+            for agent_id, agent in agents.items()
+        }
+        external_market = {'USD': 1, **(external_market or {})}
+        self.external_market = per_path({tkn: external_market.get(tkn, 0) for tkn in self.asset_list})
+
+    def _rows(self, paths: np.ndarray or None) -> np.ndarray:
+        if paths is None:
+            return np.arange(self.n_paths)
+        paths = np.asarray(paths)
+        return np.flatnonzero(paths) if paths.dtype == bool else paths
+
+    def usd_price(self) -> np.ndarray:
+        """ the spot price of every asset in the stablecoin, per path """
+        usd = self.index[self.stablecoin]
+        return self.lrna / self.liquidity / (self.lrna[:, usd] / self.liquidity[:, usd])[:, np.newaxis]
+
+    def update(self):
+        """ the same as OmnipoolState.update: update the oracles and start a new block """
+        self.time_step += 1
+        self.block_price = self.lrna / self.liquidity
+        for oracle in self.oracles.values():
+            decay = oracle['decay_factor']
+            oracle['age'] += 1
+            for attr, block_values in (
+                    ('liquidity', self.block_liquidity), ('price', self.block_price),
+                    ('volume_in', self.volume_in), ('volume_out', self.volume_out)
+            ):
+                oracle[attr] = (1 - decay) * oracle[attr] + decay * block_values
+        self.block_liquidity = self.liquidity.copy()
+        self.volume_in = np.zeros_like(self.liquidity)
+        self.volume_out = np.zeros_like(self.liquidity)
+
+    def swap(
+            self,
+            agent_id: str,
+            tkn_sell: np.ndarray,
+            tkn_buy: np.ndarray,
+            sell_quantity: np.ndarray = None,
+            buy_quantity: np.ndarray = None,
+            paths: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Swap one asset for another on each path (or on the given paths, as indices or a mask),
+        where tkn_sell and tkn_buy are asset indices and either sell_quantity or buy_quantity is given.
+        Returns the indices of the paths on which the swap went through.
+        """
+        rows = self._rows(paths)
+        tkn_sell = np.broadcast_to(tkn_sell, (self.n_paths,))[rows]
+        tkn_buy = np.broadcast_to(tkn_buy, (self.n_paths,))[rows]
+        holdings = self.holdings[agent_id]
+        asset_fee, lrna_fee = self.asset_fee[tkn_buy], self.lrna_fee[tkn_sell]
+        r_i, q_i = self.liquidity[rows, tkn_sell], self.lrna[rows, tkn_sell]
+        r_j, q_j = self.liquidity[rows, tkn_buy], self.lrna[rows, tkn_buy]
+
+        if buy_quantity is not None:
+            # OmnipoolState.calculate_sell_from_buy
+            buy_quantity = np.broadcast_to(buy_quantity, (self.n_paths,))[rows]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                delta_Qj = q_j * buy_quantity / (r_j * (1 - asset_fee) - buy_quantity)
+                delta_Qi = -delta_Qj / (1 - lrna_fee)
+                delta_Ri = -r_i * delta_Qi / (q_i + delta_Qi)
+            delta_Ri[(buy_quantity >= r_j * (1 - asset_fee)) | (-delta_Qi >= q_i)] = np.inf
+            ok = delta_Ri >= 0
+        else:
+            delta_Ri = np.broadcast_to(sell_quantity, (self.n_paths,))[rows]
+            ok = np.ones(len(rows), dtype=bool)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta_Qi = q_i * -delta_Ri / (r_i + delta_Ri)
+            delta_Qt = -delta_Qi * (1 - lrna_fee)
+            delta_Qm = (q_j + delta_Qt) * delta_Qt * asset_fee / q_j * self.lrna_mint_pct
+            delta_Qj = delta_Qt + delta_Qm
+            delta_Rj = r_j * -delta_Qt / (q_j + delta_Qt) * (1 - asset_fee)
+            if buy_quantity is not None:
+                delta_Rj = -buy_quantity
+            delta_L = np.minimum(-delta_Qi * lrna_fee, -self.lrna_imbalance[rows])
+            delta_QH = -lrna_fee * delta_Qi - delta_L
+
+        ok &= (delta_Ri > 0) & (delta_Ri <= holdings[rows, tkn_sell]) & (r_i + delta_Ri <= 10 ** 12)
+        if self.trade_limit_per_block != float('inf'):
+            limit = self.trade_limit_per_block
+            ok &= (
+                -delta_Rj - self.volume_in[rows, tkn_buy] + self.volume_out[rows, tkn_buy]
+                <= limit * self.block_liquidity[rows, tkn_buy]
+            ) & (
+                delta_Ri + self.volume_in[rows, tkn_sell] - self.volume_out[rows, tkn_sell]
+                <= limit * self.block_liquidity[rows, tkn_sell]
+            )
+
+        rows, i, j = rows[ok], tkn_sell[ok], tkn_buy[ok]
+        delta_Ri, delta_Rj = delta_Ri[ok], delta_Rj[ok]
+        old_sell_liquidity, old_buy_liquidity = self.liquidity[rows, i], self.liquidity[rows, j]
+        self.lrna[rows, i] += delta_Qi[ok]
+        self.lrna[rows, j] += delta_Qj[ok]
+        self.liquidity[rows, i] += delta_Ri
+        self.liquidity[rows, j] += delta_Rj
+        self.lrna[rows, self.index['HDX']] += delta_QH[ok]
+        self.lrna_imbalance[rows] += delta_L[ok]
+        holdings[rows, i] -= delta_Ri
+        holdings[rows, j] -= delta_Rj
+
+        self.volume_out[rows, j] += old_buy_liquidity - self.liquidity[rows, j]
+        self.volume_in[rows, i] += self.liquidity[rows, i] - old_sell_liquidity
+        return rows
+
+    def lrna_swap(
+            self,
+            agent_id: str,
+            tkn: np.ndarray,
+            delta_ra: np.ndarray = 0,
+            delta_qa: np.ndarray = 0,
+            modify_imbalance: bool = True,
+            paths: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Trade asset tkn (an index) against LRNA on each path, as OmnipoolState._lrna_swap does:
+        delta_ra and delta_qa are the changes in the agent's holdings, only one of which should be non-zero.
+        Returns the indices of the paths on which the swap went through.
+        """
+        rows = self._rows(paths)
+        tkn = np.broadcast_to(tkn, (self.n_paths,))[rows]
+        delta_ra = np.broadcast_to(np.asarray(delta_ra, dtype=float), (self.n_paths,))[rows].copy()
+        delta_qa = np.broadcast_to(np.asarray(delta_qa, dtype=float), (self.n_paths,))[rows].copy()
+        holdings = self.holdings[agent_id]
+        lrna = self.index['LRNA']
+        r, q = self.liquidity[rows, tkn], self.lrna[rows, tkn]
+        asset_fee, lrna_fee = self.asset_fee[tkn], self.lrna_fee[tkn]
+        delta_q = np.zeros(len(rows))  # change in the pool's LRNA
+        delta_r = np.zeros(len(rows))  # change in the pool's asset
+        delta_l = np.zeros(len(rows))  # change in the imbalance
+        delta_qh = np.zeros(len(rows))  # LRNA fees which go to the HDX pool
+
+        sell_lrna = delta_qa < 0
+        buy_asset = ~sell_lrna & (delta_ra > 0)
+        buy_lrna = ~sell_lrna & ~buy_asset & (delta_qa > 0)
+        sell_asset = ~sell_lrna & ~buy_asset & ~buy_lrna & (delta_ra < 0)
+        ok = sell_lrna | buy_asset | buy_lrna | sell_asset
+        q_total = self.lrna.sum(axis=1)[rows]
+        imbalance = self.lrna_imbalance[rows]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if sell_lrna.any():
+                m = sell_lrna
+                ok[m] &= delta_qa[m] + holdings[rows[m], lrna] >= 0
+                delta_ra[m] = -r[m] * delta_qa[m] / (-delta_qa[m] + q[m]) * (1 - asset_fee[m])
+                delta_qm = asset_fee[m] * (-delta_qa[m]) / q[m] * (q[m] - delta_qa[m]) * self.lrna_mint_pct
+                delta_q[m] = delta_qm - delta_qa[m]
+                if modify_imbalance:
+                    delta_l[m] = (
+                        -delta_q[m] * (q_total[m] + imbalance[m]) / (q_total[m] + delta_q[m]) - delta_q[m]
+                    )
+                delta_r[m] = -delta_ra[m]
+
+            if buy_asset.any():
+                m = buy_asset
+                ok[m] &= -delta_ra[m] + r[m] > 0
+                denom = r[m] * (1 - asset_fee[m]) - delta_ra[m]
+                delta_qa[m] = -q[m] * delta_ra[m] / denom
+                delta_qm = -asset_fee[m] * (1 - asset_fee[m]) * (r[m] / denom) * delta_qa[m] * self.lrna_mint_pct
+                delta_q[m] = -delta_qa[m] + delta_qm
+                if modify_imbalance:
+                    delta_l[m] = -(delta_q[m] * (q_total[m] + imbalance[m]) / (q_total[m] + delta_q[m]) + delta_q[m])
+                delta_r[m] = -delta_ra[m]
+
+            if buy_lrna.any():
+                m = buy_lrna
+                delta_qi = -delta_qa[m] / (1 - lrna_fee[m])
+                ok[m] &= delta_qi + q[m] > 0
+                delta_ra[m] = -r[m] * -delta_qi / (delta_qi + q[m])
+                ok[m] &= holdings[rows[m], tkn[m]] >= -delta_ra[m]
+                delta_q[m] = delta_qi
+                delta_r[m] = -delta_ra[m]
+                lrna_fee_amt = -(delta_qa[m] + delta_qi)
+                delta_l[m] = np.minimum(-imbalance[m], lrna_fee_amt)
+                delta_qh[m] = lrna_fee_amt - delta_l[m]
+
+            if sell_asset.any():
+                m = sell_asset
+                ok[m] &= delta_ra[m] <= holdings[rows[m], tkn[m]]
+                delta_qi = q[m] * delta_ra[m] / (r[m] - delta_ra[m])
+                delta_qa[m] = -delta_qi * (1 - lrna_fee[m])
+                delta_q[m] = delta_qi
+                delta_r[m] = -delta_ra[m]
+                lrna_fee_amt = -(delta_qa[m] + delta_qi)
+                delta_l[m] = np.minimum(-imbalance[m], lrna_fee_amt)
+                delta_qh[m] = lrna_fee_amt - delta_l[m]
+
+        # volumes as OmnipoolState.swap counts them: out if the asset was bought, in if it was sold
+        asset_bought = (sell_lrna | buy_asset)[ok]
+        rows, tkn = rows[ok], tkn[ok]
+        old_liquidity = self.liquidity[rows, tkn]
+        self.lrna_imbalance[rows] += delta_l[ok]
+        self.lrna[rows, tkn] += delta_q[ok]
+        self.liquidity[rows, tkn] += delta_r[ok]
+        self.lrna[rows, self.index['HDX']] += delta_qh[ok]
+        holdings[rows, lrna] += delta_qa[ok]
+        holdings[rows, tkn] += delta_ra[ok]
+
+        self.volume_out[rows[asset_bought], tkn[asset_bought]] += (
+            old_liquidity - self.liquidity[rows, tkn]
+        )[asset_bought]
+        self.volume_in[rows[~asset_bought], tkn[~asset_bought]] += (
+            self.liquidity[rows, tkn] - old_liquidity
+        )[~asset_bought]
+        return rows
+
+    def omnipool(self, path: int) -> OmnipoolState:
+        """ one path of the ensemble as an OmnipoolState """
+        omnipool = self._omnipool.copy()
+        for i, tkn in enumerate(self.asset_list):
+            omnipool.liquidity[tkn] = float(self.liquidity[path, i])
+            omnipool.lrna[tkn] = float(self.lrna[path, i])
+            omnipool.shares[tkn] = float(self.shares[path, i])
+            block = omnipool.current_block
+            block.liquidity[tkn] = float(self.block_liquidity[path, i])
+            block.price[tkn] = float(self.lrna[path, i] / self.liquidity[path, i])
+            block.volume_in[tkn] = float(self.volume_in[path, i])
+            block.volume_out[tkn] = float(self.volume_out[path, i])
+            for name, oracle in self.oracles.items():
+                for attr in ('liquidity', 'price', 'volume_in', 'volume_out'):
+                    getattr(omnipool.oracles[name], attr)[tkn] = float(oracle[attr][path, i])
+        for name, oracle in self.oracles.items():
+            omnipool.oracles[name].age = oracle['age']
+        omnipool.lrna_imbalance = float(self.lrna_imbalance[path])
+        omnipool.time_step = self.time_step
+        return omnipool
+
+    def agent(self, agent_id: str, path: int) -> Agent:
+        """ one path's copy of an agent """
+        agent = self._agents[agent_id].copy()
+        for tkn, i in self.index.items():
+            agent.holdings[tkn] = float(self.holdings[agent_id][path, i])
+        return agent
+
+    def run(
+            self,
+            time_steps: int,
+            strategies: dict[str: Callable],
+            prices: PricePaths = None,
+            seed: int = None,
+            record: bool = True
+    ) -> dict:
+        """
+        Advance every path by time_steps, as run() would: each step, the pool is updated, external prices are
+        taken from prices (path i of the ensemble follows path i of prices, from the ensemble's current time step),
+        then each agent's strategy (see random_swaps and omnipool_arbitrage below) acts, in order.
+
+        If record is True, returns the history of the run as arrays with a leading time step axis:
+        {'liquidity', 'lrna', 'lrna_imbalance', 'external_market', 'holdings': {agent_id: ...}}
+        """
+        rng = np.random.default_rng(seed)
+        if prices is not None:
+            if prices.n_paths < self.n_paths or prices.time_steps < self.time_step + time_steps:
+                raise ValueError('Not enough price paths for the run.')
+            price_columns = [(i, prices.asset_index[tkn]) for i, tkn in enumerate(self.asset_list)
+                             if tkn in prices.asset_index]
+            columns, price_columns = [i for i, _ in price_columns], [j for _, j in price_columns]
+        history = {
+            'liquidity': np.empty((time_steps,) + self.liquidity.shape),
+            'lrna': np.empty((time_steps,) + self.lrna.shape),
+            'lrna_imbalance': np.empty((time_steps, self.n_paths)),
+            'external_market': np.empty((time_steps,) + self.external_market.shape),
+            'holdings': {agent_id: np.empty((time_steps,) + holdings.shape)
+                         for agent_id, holdings in self.holdings.items()}
+        } if record else None
+
+        for step in range(time_steps):
+            self.update()
+            if prices is not None:
+                self.external_market[:, columns] = prices.prices[:self.n_paths, self.time_step, price_columns]
+            for agent_id, strategy in strategies.items():
+                strategy(self, agent_id, rng)
+            if record:
+                history['liquidity'][step] = self.liquidity
+                history['lrna'][step] = self.lrna
+                history['lrna_imbalance'][step] = self.lrna_imbalance
+                history['external_market'][step] = self.external_market
+                for agent_id, holdings in self.holdings.items():
+                    history['holdings'][agent_id][step] = holdings
+        return history
+
+
+def random_swaps(amount: dict[str: float], randomize_amount: bool = True) -> Callable:
+    """
+    Like trade_strategies.random_swaps: on each path, sell a random asset for another, both chosen from amount.
+    """
+    tkns = list(amount)
+    if 'LRNA' in tkns:
+        raise ValueError('LRNA is not supported.')
+    quantities = np.array([amount[tkn] for tkn in tkns], dtype=float)
+
+    def strategy(ensemble: OmnipoolEnsemble, agent_id: str, rng: np.random.Generator):
+        indices = np.array([ensemble.index[tkn] for tkn in tkns])
+        buy = rng.integers(len(tkns), size=ensemble.n_paths)
+        sell = rng.integers(len(tkns), size=ensemble.n_paths)
+        price = ensemble.external_market[np.arange(ensemble.n_paths), indices[sell]]
+        sell_quantity = quantities[sell] / np.where(price == 0, 1, price)
+        if randomize_amount:
+            sell_quantity *= rng.random(ensemble.n_paths)
+        sell_quantity[sell_quantity == 0] = 1
+        ensemble.swap(agent_id, indices[sell], indices[buy], sell_quantity=sell_quantity, paths=buy != sell)
+
+    return strategy
+
+
+def omnipool_arbitrage(arb_precision: int = 1, skip_assets: list[str] = None, frequency: int = 1) -> Callable:
+    """
+    Like trade_strategies.omnipool_arbitrage: trade each path's Omnipool towards the external market prices.
+    Assets that are skipped are held fixed in the system of equations, so every path can be solved at once.
+    """
+    skip_assets = skip_assets or []
+
+    def strategy(ensemble: OmnipoolEnsemble, agent_id: str, rng: np.random.Generator):
+        if ensemble.time_step % frequency != 0:
+            return
+        n, usd = ensemble.n_paths, ensemble.index[ensemble.stablecoin]
+        r, q, p = ensemble.liquidity, ensemble.lrna, ensemble.external_market
+        asset_fee, lrna_fee = ensemble.asset_fee, ensemble.lrna_fee
+
+        include = np.tile([tkn not in skip_assets for tkn in ensemble.asset_list], (n, 1))
+        if arb_precision < 2:
+            usd_price = ensemble.usd_price()
+            low_price = (1 - asset_fee[usd]) * (1 - lrna_fee) * usd_price
+            high_price = 1 / (1 - asset_fee) / (1 - lrna_fee[usd]) * usd_price
+            include &= ~((low_price <= p) & (p <= high_price))
+        include[:, usd] = True
+
+        # new LRNA in each pool: the stablecoin row keeps total LRNA fixed, every other row equalizes the price
+        # with the stablecoin, and assets which are not traded keep their LRNA
+        mat = np.zeros((n, len(ensemble.asset_list), len(ensemble.asset_list)))
+        rhs = np.where(include, 0.0, q)
+        diagonal = np.arange(len(ensemble.asset_list))
+        mat[:, diagonal, diagonal] = np.where(include, -np.sqrt(r[:, usd] * q[:, usd])[:, np.newaxis], 1)
+        mat[:, :, usd] = np.where(include, np.sqrt(p * r * q), 0)
+        mat[:, usd, :] = include
+        rhs[:, usd] = np.where(include, q, 0).sum(axis=1)
+        new_lrna = np.linalg.solve(mat, rhs[..., np.newaxis])[..., 0]
+        dr = r * q / new_lrna - r
+        dq = np.where(include, -q * dr / (r + dr), 0)
+
+        # check that the trade is profitable, scaling it back in arb_precision steps if not:
+        # each path trades steps / arb_precision of dq
+        steps = np.full(n, -1)
+        for j in range(arb_precision):
+            delta_q = dq * (j + 1) / arb_precision
+            delta_q_fee_adj = delta_q / (1 - lrna_fee)
+            delta_r = np.where(
+                delta_q > 0,
+                r * delta_q / (q + delta_q) * (1 - asset_fee),
+                r * delta_q_fee_adj / (q + delta_q_fee_adj)
+            )
+            profit = (np.where(include, delta_r, 0) * p).sum(axis=1)
+            undecided = steps < 0
+            steps[undecided & (profit < 0)] = j
+            if j == arb_precision - 1:
+                steps[undecided & (profit >= 0)] = arb_precision
+
+        for i in range(len(ensemble.asset_list)):
+            # sell LRNA for the asset where dq > 0, otherwise buy LRNA with it
+            quantity = np.where(steps == arb_precision, dq[:, i], dq[:, i] * steps / arb_precision)
+            ensemble.lrna_swap(
+                agent_id, i, delta_qa=-quantity, modify_imbalance=False, paths=include[:, i] & (steps > 0)
+            )
+
+    return strategy
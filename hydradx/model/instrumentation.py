@@ -0,0 +1,222 @@
+import copy
+import functools
+import sys
+import time
+import types
+from collections import Counter, defaultdict
+
+from .amm.agents import Agent
+from .amm.amm import AMM
+from .amm.global_state import GlobalState
+from .amm.liquidations import money_market, CDP
+from .amm.omnipool_router import OmnipoolRouter
+from .amm.oracle import Oracle
+from .amm.otc import OTC
+# imported only so that every exchange type is registered as a subclass of AMM before _exchange_classes looks
+from .amm import (  # noqa: F401
+    basilisk_amm, centralized_market, concentrated_liquidity_pool, omnipool_amm, stableswap_amm
+)
+
+
+def _exchange_classes() -> list[type]:
+    classes = [OmnipoolRouter]
+    subclasses = [AMM]
+    while subclasses:
+        cls = subclasses.pop()
+        classes.append(cls)
+        subclasses.extend(cls.__subclasses__())
+    return classes
+
+
+class Instrumentation:
+    """
+    Opt-in profiling for run(). Pass one in as run(..., instrumentation=Instrumentation()), then call report().
+
+    Records wall time per phase (pool updates, oracle updates, the evolve function, each agent and each
+    trade strategy, and archiving), and counts swaps per pool, fail_transaction calls by message,
+    copy() calls by class, top-level deepcopy calls and oracle updates.
+
+    The counters work by wrapping methods on the classes involved, but only while a run using
+    this instrumentation is in progress; runs without it are not affected at all.
+    deepcopy calls are counted by replacing copy.deepcopy, along with the deepcopy of every module
+    that has already done `from copy import deepcopy`. Modules imported during the run that do so are not counted.
+    The wrappers replace the classes' and modules' own attributes, so they are process-wide: another thread
+    running a simulation at the same time is counted here too, and two instrumented runs at once would
+    mix their counts and undo each other's patches. Use processes (as run_paths does) to run them in parallel.
+    """
+    def __init__(self):
+        self._patches = []
+        self._active = set()
+        self._deepcopy_depth = 0
+        self.reset()
+
+    def reset(self):
+        self.steps = 0
+        self.time = {
+            'total': 0.0,
+            'evolve': 0.0,
+            'pool_update': defaultdict(float),
+            'oracle_update': 0.0,
+            'evolve_function': 0.0,
+            'agents': defaultdict(float),
+            'strategies': defaultdict(float),
+            'archive': 0.0,
+        }
+        self.counts = {
+            'swaps': Counter(),
+            'fail_transaction': Counter(),
+            'copy': Counter(),
+            'deepcopy': 0,
+            'oracle_updates': 0,
+        }
+
+    def _patch(self, owner, name: str, wrapper):
+        self._patches.append((owner, name, owner.__dict__[name]))
+        setattr(owner, name, functools.wraps(owner.__dict__[name])(wrapper))
+
+    def _outermost(self, name: str, method):
+        # wrap method so that on_call only sees the outermost call on each object,
+        # e.g. not both OmnipoolState.swap and a super().swap inside it
+        def decorator(on_call):
+            def wrapper(obj, *args, **kwargs):
+                key = (name, id(obj))
+                if key in self._active:
+                    return method(obj, *args, **kwargs)
+                self._active.add(key)
+                try:
+                    return on_call(obj, *args, **kwargs)
+                finally:
+                    self._active.discard(key)
+            return wrapper
+        return decorator
+
+    def __enter__(self):
+        for cls in _exchange_classes():
+            methods = cls.__dict__
+            if 'swap' in methods:
+                swap = methods['swap']
+
+                @self._outermost('swap', swap)
+                def counted_swap(exchange, *args, _swap=swap, **kwargs):
+                    self.counts['swaps'][exchange.unique_id] += 1
+                    return _swap(exchange, *args, **kwargs)
+                self._patch(cls, 'swap', counted_swap)
+            for name in ('update', 'fast_forward'):
+                if name not in methods:
+                    continue
+                update = methods[name]
+
+                # both count as 'update', so the update() at the start of a fast_forward() isn't counted twice
+                @self._outermost('update', update)
+                def timed_update(exchange, *args, _update=update, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return _update(exchange, *args, **kwargs)
+                    finally:
+                        self.time['pool_update'][exchange.unique_id] += time.perf_counter() - start
+                self._patch(cls, name, timed_update)
+            if 'fail_transaction' in methods:
+                fail_transaction = methods['fail_transaction']
+
+                @self._outermost('fail_transaction', fail_transaction)
+                def counted_fail(exchange, *args, _fail=fail_transaction, **kwargs):
+                    message = args[0] if args else kwargs.get('error', kwargs.get('fail_message', ''))
+                    self.counts['fail_transaction'][message] += 1
+                    return _fail(exchange, *args, **kwargs)
+                self._patch(cls, 'fail_transaction', counted_fail)
+
+        for cls in set(_exchange_classes() + [GlobalState, Agent, money_market, CDP, OTC]):
+            if 'copy' in cls.__dict__:
+                copy_method = cls.__dict__['copy']
+
+                @self._outermost('copy', copy_method)
+                def counted_copy(obj, *args, _copy=copy_method, _name=cls.__name__, **kwargs):
+                    self.counts['copy'][_name] += 1
+                    return _copy(obj, *args, **kwargs)
+                self._patch(cls, 'copy', counted_copy)
+
+        oracle_update = Oracle.__dict__['update']
+
+        def timed_oracle_update(oracle, *args, **kwargs):
+            self.counts['oracle_updates'] += 1
+            start = time.perf_counter()
+            try:
+                return oracle_update(oracle, *args, **kwargs)
+            finally:
+                self.time['oracle_update'] += time.perf_counter() - start
+        self._patch(Oracle, 'update', timed_oracle_update)
+
+        deepcopy = copy.deepcopy
+
+        def counted_deepcopy(*args, **kwargs):
+            # deepcopy calls itself for every member, so only count the outermost call
+            if self._deepcopy_depth == 0:
+                self.counts['deepcopy'] += 1
+            self._deepcopy_depth += 1
+            try:
+                return deepcopy(*args, **kwargs)
+            finally:
+                self._deepcopy_depth -= 1
+        # modules which did `from copy import deepcopy` hold their own reference to it
+        for module in list(sys.modules.values()):
+            if isinstance(module, types.ModuleType) and vars(module).get('deepcopy') is deepcopy:
+                self._patches.append((module, 'deepcopy', deepcopy))
+                setattr(module, 'deepcopy', counted_deepcopy)
+        return self
+
+    def __exit__(self, *exc_info):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+        self._active = set()
+        self._deepcopy_depth = 0
+
+    def evolve(self, state: GlobalState, blocks: int = 1):
+        """
+        state.evolve(blocks), timing the evolve function separately from the pool updates.
+        """
+        pool_time = sum(self.time['pool_update'].values())
+        start = time.perf_counter()
+        state.evolve(blocks)
+        elapsed = time.perf_counter() - start
+        self.time['evolve'] += elapsed
+        self.time['evolve_function'] += elapsed - (sum(self.time['pool_update'].values()) - pool_time)
+        self.steps += blocks
+
+    def execute(self, state: GlobalState, agent_id: str):
+        """
+        Run an agent's trade strategy, timing it by agent and by strategy name.
+        """
+        strategy = state.agents[agent_id].trade_strategy
+        start = time.perf_counter()
+        strategy.execute(state, agent_id)
+        elapsed = time.perf_counter() - start
+        self.time['agents'][agent_id] += elapsed
+        self.time['strategies'][getattr(strategy, 'name', type(strategy).__name__)] += elapsed
+
+    def report(self) -> dict:
+        """
+        Everything recorded so far, as plain dicts.
+        """
+        return {
+            'steps': self.steps,
+            'time': {k: dict(v) if isinstance(v, dict) else v for k, v in self.time.items()},
+            'counts': {k: dict(v) if isinstance(v, dict) else v for k, v in self.counts.items()},
+        }
+
+    def __repr__(self):
+        report = self.report()
+        lines = [f"Instrumentation: {report['steps']} steps, {round(report['time']['total'], 3)} seconds"]
+        for phase, value in report['time'].items():
+            if isinstance(value, dict):
+                for key, seconds in sorted(value.items(), key=lambda kv: -kv[1]):
+                    lines.append(f'    {phase} [{key}]: {round(seconds, 4)} s')
+            elif phase != 'total':
+                lines.append(f'    {phase}: {round(value, 4)} s')
+        for name, value in report['counts'].items():
+            if isinstance(value, dict):
+                for key, count in sorted(value.items(), key=lambda kv: -kv[1]):
+                    lines.append(f'    {name} [{key}]: {count}')
+            else:
+                lines.append(f'    {name}: {value}')
+        return '\n'.join(lines)
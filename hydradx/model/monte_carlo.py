@@ -0,0 +1,146 @@
+import random
+import time
+from typing import Callable
+
+import dill
+import numpy as np
+from multiprocess import Pool
+
+from .amm.global_state import GlobalState
+from .run import run, _steps
+
+# state shared by every path a worker runs, set once by _init_worker
+_worker_config: dict = {}
+
+
+def path_seeds(seed: int or None, n_paths: int) -> list[int]:
+    """
+    Derive one independent seed per path from a single master seed.
+    The same master seed always produces the same list, regardless of how many workers are used.
+    """
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(n_paths)]
+
+
+def _init_worker(payload: bytes):
+    # the initial state (plus the run configuration) is deserialized once per worker, not once per task
+    _worker_config.clear()
+    _worker_config.update(dill.loads(payload))
+
+
+def _run_path(task: tuple):
+    seed, overrides = task
+    config = _worker_config
+    # trade strategies and evolve functions can carry state between steps,
+    # so every path starts from a fresh copy of the pristine initial state
+    initial_state: GlobalState = dill.loads(config['state'])
+    if overrides is not None:
+        config['apply'](initial_state, overrides)
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed % 2 ** 32)
+    events = run(initial_state, time_steps=config['time_steps'], silent=True)
+    return config['summarize'](events) if config['summarize'] else events
+
+
+def run_paths(
+        initial_state: GlobalState,
+        time_steps: int,
+        tasks: list[tuple],
+        summarize: Callable[[list], any] = None,
+        apply: Callable[[GlobalState, dict], any] = None,
+        processes: int = None
+) -> list:
+    """
+    Run one simulation per task, where each task is a (seed, overrides) tuple.
+    If overrides is not None, apply(state, overrides) is called on the fresh initial state before the run.
+    Results are returned in task order.
+    """
+    payload = dill.dumps({
+        'state': dill.dumps(initial_state),
+        'time_steps': time_steps,
+        'summarize': summarize,
+        'apply': apply
+    })
+    if processes == 1 or len(tasks) <= 1:
+        # paths reseed the global generators, which here are the caller's, so leave them as they were found
+        random_state, np_random_state = random.getstate(), np.random.get_state()
+        try:
+            _init_worker(payload)
+            return [_run_path(task) for task in tasks]
+        finally:
+            random.setstate(random_state)
+            np.random.set_state(np_random_state)
+    with Pool(processes=processes, initializer=_init_worker, initargs=(payload,)) as pool:
+        return pool.map(_run_path, tasks, chunksize=1)
+
+
+def run_monte_carlo(
+        initial_state: GlobalState,
+        time_steps: int,
+        n_paths: int,
+        seed: int = None,
+        processes: int = None,
+        summarize: Callable[[list], any] = None,
+        silent: bool = False
+) -> list:
+    """
+    Run the same scenario n_paths times across a process pool.
+
+    Each path gets its own seed (see path_seeds), which is applied to both `random` and `numpy.random`
+    before the path starts, so any single path can be reproduced exactly by re-running with the same master seed.
+    If summarize is given, it is called on each path's events inside the worker and only its return value
+    is sent back, which is usually much cheaper than returning every archived state.
+
+    Returns a list with one entry per path, in seed order.
+    """
+    start_time = time.time()
+    if not silent:
+        print(f'Starting {n_paths} simulations...')
+
+    results = run_paths(
+        initial_state, time_steps,
+        tasks=[(path_seed, None) for path_seed in path_seeds(seed, n_paths)],
+        summarize=summarize,
+        processes=processes
+    )
+
+    if not silent:
+        print(f'Execution time: {round(time.time() - start_time, 3)} seconds.')
+    return results
+
+
+def run_branches(
+        initial_state: GlobalState,
+        prefix_steps: int,
+        suffix_steps: int,
+        branches: list,
+        apply: Callable[[GlobalState, any], any] = None,
+        seed: int = None,
+        summarize: Callable[[list], any] = None,
+        processes: int = None
+) -> tuple[list, list]:
+    """
+    Run initial_state for prefix_steps once, then fork it into one continuation per entry in branches,
+    each of which runs for suffix_steps more, across a process pool as in run_paths.
+    Each continuation starts with apply(state, branch) called on its own copy of the forked state,
+    or, if apply is not given, with branch(state).
+
+    If seed is given, each continuation gets its own seed from path_seeds(seed, len(branches)).
+    Returns (prefix events, results), where each result is that branch's events after the fork
+    (or summarize(events), if summarize is given).
+    """
+    state = initial_state.copy()
+    prefix = [step.archive() for step in _steps(state, prefix_steps)]
+    seeds = path_seeds(seed, len(branches)) if seed is not None else [None] * len(branches)
+    results = run_paths(
+        state, suffix_steps,
+        tasks=list(zip(seeds, branches)),
+        summarize=summarize,
+        apply=apply or _call_branch,
+        processes=processes
+    )
+    return prefix, results
+
+
+def _call_branch(state: GlobalState, branch: Callable[[GlobalState], any]):
+    branch(state)
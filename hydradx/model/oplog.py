@@ -0,0 +1,227 @@
+import inspect
+import json
+import math
+
+import numpy as np
+
+from .amm.global_state import GlobalState
+from .amm.ledger import counted
+from .instrumentation import _exchange_classes
+
+# pool methods which are recorded, when called by an agent on one of the pools in the simulation
+OPERATIONS = ('swap', 'add_liquidity', 'remove_liquidity', 'withdraw_asset', 'buy_shares', 'swap_one')
+_TOKEN_ARGS = ('tkn_sell', 'tkn_add', 'tkn_remove')
+_QUANTITY_ARGS = ('sell_quantity', 'buy_quantity', 'quantity', 'shares_removed')
+
+OP_DTYPE = np.dtype([
+    ('step', '<u4'),  # time step within the run, starting at 1
+    ('pool', '<u4'),  # these four index into OpLog.names
+    ('agent', '<u4'),
+    ('tkn_a', '<u4'),
+    ('tkn_b', '<u4'),
+    ('kind', '<u4'),  # index into OpLog.kinds
+    ('quantity', '<f8'),
+])
+
+
+class OpLog:
+    """
+    Records every pool operation (swap, add_liquidity, remove_liquidity etc.) that agents execute during a run:
+        with OpLog() as op_log:
+            run(initial_state, time_steps)
+        events = replay(other_initial_state, op_log)
+
+    Each operation is one fixed-size row of OP_DTYPE in self.ops, with pool, agent and token names interned
+    in self.names, and the method and argument names it was called with in self.kinds, along with any other
+    arguments which were not left at their defaults (e.g. modify_imbalance). Quantities are stored as 64-bit floats.
+
+    Only the outermost operation is recorded, so e.g. an Omnipool swap through a sub-pool is one row.
+    Operations made while the state evolves, on copies of pools, or by agents that are not
+    in state.agents are not recorded.
+    """
+    def __init__(self):
+        self.names = []
+        self.kinds = []
+        self.ops = np.zeros(0, dtype=OP_DTYPE)
+        self.time_steps = 0
+        self._index = {}
+        self._kind_index = {}
+        self._rows = []
+        self._patches = []
+        self._signatures = {}
+        self._state = None
+        self._start_step = 0
+        self._depth = 0
+        self._versions = None
+        self._pool_ids = {}
+        self._agent_ids = {}
+
+    def __len__(self):
+        return len(self.ops) + len(self._rows)
+
+    def _intern(self, name) -> int:
+        if name not in self._index:
+            self._index[name] = len(self.names)
+            self.names.append(name)
+        return self._index[name]
+
+    def _kind(self, kind: tuple) -> int:
+        if kind not in self._kind_index:
+            self._kind_index[kind] = len(self.kinds)
+            self.kinds.append(kind)
+        return self._kind_index[kind]
+
+    def _attach(self, state: GlobalState):
+        # look pools and agents up by id(), and do so again whenever any are added, replaced or removed
+        pools, agents = counted(state, 'pools'), counted(state, 'agents')
+        if self._versions is not None:
+            old_pools, pools_version, old_agents, agents_version = self._versions
+            if (
+                pools is old_pools and pools.version == pools_version
+                and agents is old_agents and agents.version == agents_version
+            ):
+                return
+        self._pool_ids = {id(pool): pool_id for pool_id, pool in pools.items()}
+        self._agent_ids = {id(agent): agent_id for agent_id, agent in agents.items()}
+        self._versions = (pools, pools.version, agents, agents.version)
+
+    def _record(self, op: str, method, pool, agent, args: tuple, kwargs: dict):
+        state = self._state
+        self._attach(state)
+        pool_id = self._pool_ids.get(id(pool))
+        agent_id = self._agent_ids.get(id(agent))
+        if pool_id is None or agent_id is None:
+            return
+        if method not in self._signatures:
+            self._signatures[method] = inspect.signature(method)
+        signature = self._signatures[method]
+        bound = signature.bind(pool, agent, *args, **kwargs)
+        arguments = list(bound.arguments.items())[2:]
+        tkn_a_arg = next((name for name, _ in arguments if name in _TOKEN_ARGS), None)
+        tkn_b_arg = 'tkn_buy' if 'tkn_buy' in bound.arguments else None
+        quantity_arg, quantity = None, math.nan
+        extras = {}
+        for name, value in arguments:
+            if name in _QUANTITY_ARGS:
+                # a swap comes with both buy_quantity and sell_quantity, one of which is zero
+                if quantity_arg is None or (value and not quantity):
+                    quantity_arg, quantity = name, math.nan if value is None else float(value)
+            elif name not in (tkn_a_arg, tkn_b_arg) and value != signature.parameters[name].default:
+                extras[name] = value
+        self._rows.append((
+            state.time_step - self._start_step,
+            self._intern(pool_id),
+            self._intern(agent_id),
+            self._intern(bound.arguments.get(tkn_a_arg, '')),
+            self._intern(bound.arguments.get(tkn_b_arg, '')),
+            self._kind((op, tkn_a_arg, tkn_b_arg, quantity_arg, tuple(sorted(extras.items())))),
+            quantity
+        ))
+
+    def _patch(self, owner, name: str, wrapper):
+        self._patches.append((owner, name, owner.__dict__[name]))
+        setattr(owner, name, wrapper)
+
+    def __enter__(self):
+        for cls in _exchange_classes():
+            for op in OPERATIONS:
+                if op not in cls.__dict__:
+                    continue
+                method = cls.__dict__[op]
+
+                def recorded(pool, agent=None, *args, _method=method, _op=op, **kwargs):
+                    if self._depth == 0 and self._state is not None:
+                        self._record(_op, _method, pool, agent, args, kwargs)
+                    self._depth += 1
+                    try:
+                        return _method(pool, agent, *args, **kwargs)
+                    finally:
+                        self._depth -= 1
+                self._patch(cls, op, recorded)
+
+        evolve = GlobalState.__dict__['evolve']
+
+        def tracked_evolve(state, *args, **kwargs):
+            if self._state is not state:
+                self._state = state
+                self._start_step = state.time_step - self.time_steps
+            self._depth += 1
+            try:
+                return evolve(state, *args, **kwargs)
+            finally:
+                self._depth -= 1
+                self.time_steps = state.time_step - self._start_step
+        self._patch(GlobalState, 'evolve', tracked_evolve)
+        return self
+
+    def __exit__(self, *exc_info):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches = []
+        self._state = None
+        self._depth = 0
+        self._versions = None
+        self._pool_ids, self._agent_ids = {}, {}
+        if self._rows:
+            self.ops = np.concatenate([self.ops, np.array(self._rows, dtype=OP_DTYPE)])
+            self._rows = []
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            ops=self.ops,
+            time_steps=self.time_steps,
+            names=json.dumps(self.names),
+            kinds=json.dumps(self.kinds)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'OpLog':
+        op_log = cls()
+        with np.load(path) as data:
+            op_log.ops = data['ops']
+            op_log.time_steps = int(data['time_steps'])
+            # json turns tuples (e.g. LP share tokens) into lists
+            op_log.names = [
+                tuple(name) if isinstance(name, list) else name for name in json.loads(str(data['names']))
+            ]
+            op_log.kinds = [
+                (*kind[:4], tuple(tuple(extra) for extra in kind[4])) for kind in json.loads(str(data['kinds']))
+            ]
+        return op_log
+
+
+def replay(initial_state: GlobalState, op_log: OpLog, archive=None) -> list:
+    """
+    Replay the operations in op_log against a copy of initial_state, evolving it as run() would, but
+    without evaluating any trade strategies. Returns the events, or the archive, as run() does.
+    initial_state should have the same pool and agent ids as the state op_log was recorded from.
+    The evolve function is run as usual, so if it draws random numbers, external prices will not match the
+    recorded run's.
+    """
+    state = initial_state.copy()
+    events = []
+    if archive is not None:
+        archive.start(state, op_log.time_steps)
+    names, kinds = op_log.names, op_log.kinds
+    ops = op_log.ops.tolist()
+    row = 0
+    for step in range(1, op_log.time_steps + 1):
+        state.evolve()
+        while row < len(ops) and ops[row][0] == step:
+            _, pool, agent, tkn_a, tkn_b, kind, quantity = ops[row]
+            op, tkn_a_arg, tkn_b_arg, quantity_arg, extras = kinds[kind]
+            kwargs = dict(extras)
+            if tkn_a_arg:
+                kwargs[tkn_a_arg] = names[tkn_a]
+            if tkn_b_arg:
+                kwargs[tkn_b_arg] = names[tkn_b]
+            if quantity_arg:
+                kwargs[quantity_arg] = None if math.isnan(quantity) else quantity
+            getattr(state.pools[names[pool]], op)(state.agents[names[agent]], **kwargs)
+            row += 1
+        if archive is not None:
+            archive.record(state)
+        else:
+            events.append(state.archive())
+    return events if archive is None else archive
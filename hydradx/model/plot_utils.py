@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 from typing import Callable
 from .amm.global_state import GlobalState
+from .archive import DatastreamArchive
 from numbers import Number
 
 
@@ -33,6 +34,10 @@ def get_datastream(
             group = "external_market"
             instance = asset
 
+    if isinstance(events, DatastreamArchive):
+        # the values were recorded as arrays already
+        return events.find(group=group, instance=instance, oracle=oracle, prop=prop, key=key)
+
     if instance == 'all':
         instance = list(getattr(initial_state, group).keys())
     elif oracle == 'all':
@@ -110,7 +115,7 @@ def get_single_stream(
         key = instance or key
 
     initial_state = events[0]
-    if hasattr(initial_state, prop):
+    if not oracle and hasattr(initial_state, prop):
         return [getattr(event, prop)(getattr(event, group)[instance]) for event in events]
     elif not prop:
         return [getattr(event, group)[instance or key] for event in events]
@@ -185,7 +190,7 @@ def plot(
         y = get_datastream(events, pool=pool, agent=agent, asset=asset, oracle=oracle, prop=prop, key=key)
     elif isinstance(y, str):
         title = title or y
-        y = [event[y] for event in events]
+        y = events[y] if isinstance(events, DatastreamArchive) else [event[y] for event in events]
 
     if isinstance(y, dict):
         for i, k in enumerate(y.keys()):
@@ -35,6 +35,8 @@ def postprocessing(events: list, optional_params: list[str] = ()) -> list:
     'holdings_val': the total value of the agent's outside holdings
     'pool_val': tracks the value of all assets held in the pool
     'impermanent_loss': computes loss for LPs due to price movements in either direction
+    'trade_volume': the value of each agent's trades since the previous state in events (with fast_forward, agents
+        don't trade on the steps that were skipped, so this works for fast-forwarded runs too)
     """
     # save initial state
     initial_state: GlobalState = events[0]
@@ -61,8 +63,11 @@ def postprocessing(events: list, optional_params: list[str] = ()) -> list:
     if unrecognized_params:
         raise ValueError(f'Unrecognized parameter {unrecognized_params}')
 
+    previous_state = None
     for step in events:
         state: GlobalState = step
+        # taken once per step, and shared by every agent
+        prices = state.market_prices({})
 
         for pool in state.pools.values():
             if 'pool_val' in optional_params:
@@ -73,27 +78,28 @@ def postprocessing(events: list, optional_params: list[str] = ()) -> list:
             if 'deposit_val' in optional_params:
                 # what are this agent's original holdings theoretically worth at current spot prices?
                 agent.deposit_val = value_assets(
-                    state.market_prices(agent.holdings),
+                    state.market_prices(agent.holdings, prices),
                     withdraw_state.agents[agent.unique_id].holdings
                 )
             if 'withdraw_val' in optional_params:
                 # what are this agent's holdings worth if sold?
-                agent.withdraw_val = state.cash_out(agent)
+                agent.withdraw_val = state.cash_out(agent, prices)
             if 'holdings_val' in optional_params:
-                agent.holdings_val = sum([quantity * state.price(asset) for asset, quantity in agent.holdings.items()])
+                agent.holdings_val = value_assets(prices, agent.holdings)
             if 'impermanent_loss' in optional_params:
                 agent.impermanent_loss = agent.withdraw_val / agent.deposit_val - 1
             if 'token_count' in optional_params:
                 agent.token_count = sum(agent.holdings.values())
             if 'trade_volume' in optional_params:
                 agent.trade_volume = 0
-                if state.time_step > 0:
-                    previous_agent = events[state.time_step - 1].agents[agent.unique_id]
+                if previous_state is not None and agent.unique_id in previous_state.agents:
+                    previous_agent = previous_state.agents[agent.unique_id]
                     agent.trade_volume += (
                         sum([
-                            abs(previous_agent.holdings[tkn] - agent.holdings[tkn]) * state.price(tkn)
+                            abs(previous_agent.holdings.get(tkn, 0) - agent.holdings[tkn]) * prices.get(tkn, 0)
                             for tkn in agent.holdings])
                     )
+        previous_state = state
 
     return events
 
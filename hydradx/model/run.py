@@ -1,36 +1,156 @@
+import contextlib
+import heapq
 import time
+from typing import Iterator
 
 from .amm.global_state import GlobalState
-from copy import deepcopy
+from .amm.ledger import counted
+from .checkpoint import Checkpointer
+from .instrumentation import Instrumentation
 
 
-def run(initial_state: GlobalState, time_steps: int, silent: bool = False) -> list:
+def _steps(
+        state: GlobalState,
+        time_steps: int,
+        instrumentation: Instrumentation = None,
+        fast_forward: bool = False
+) -> Iterator[GlobalState]:
+    # advance state in place, yielding it after each step.
+    # agents are only visited on the time steps their trade strategy asks to be woken up for
+    # (see TradeStrategy.next_wake_up), in the same order as state.agents.
+    # with fast_forward, the state skips straight to the next step on which an agent wakes up
+    # (see GlobalState.evolve), and the steps in between are not yielded
+    agents, version = None, None
+    wake_ups = []  # heap of (time step, position in state.agents, agent id)
+    end = state.time_step + time_steps
+    while state.time_step < end:
+        if state.agents is not agents or agents.version != version:
+            # first step, or agents were added, replaced or removed: schedule everyone again
+            agents = counted(state, 'agents')
+            version = agents.version
+            wake_ups = []
+            for n, agent_id in enumerate(agents):
+                strategy = state.agents[agent_id].trade_strategy
+                wake_up = strategy.next_wake_up(state, agent_id) if strategy else None
+                if wake_up is not None:
+                    wake_ups.append((max(wake_up, state.time_step + 1), n, agent_id))
+            heapq.heapify(wake_ups)
+
+        # market evolutions
+        blocks = min(wake_ups[0][0] if wake_ups else end, end) - state.time_step if fast_forward else 1
+        if instrumentation is None:
+            state.evolve(blocks)
+        else:
+            instrumentation.evolve(state, blocks)
+
+        # agent actions
+        while wake_ups and wake_ups[0][0] <= state.time_step:
+            _, n, agent_id = heapq.heappop(wake_ups)
+            if agent_id not in state.agents:
+                # removed earlier in this step
+                continue
+            strategy = state.agents[agent_id].trade_strategy
+            if not strategy:
+                continue
+            if instrumentation is None:
+                strategy.execute(state, agent_id)
+            else:
+                instrumentation.execute(state, agent_id)
+            wake_up = strategy.next_wake_up(state, agent_id)
+            if wake_up is not None:
+                heapq.heappush(wake_ups, (max(wake_up, state.time_step + 1), n, agent_id))
+
+        yield state
+
+
+def run(
+        initial_state: GlobalState,
+        time_steps: int,
+        silent: bool = False,
+        archive=None,
+        checkpoint_dir: str = None,
+        checkpoint_every: int = 1000,
+        resume: bool = False,
+        instrumentation: Instrumentation = None,
+        fast_forward: bool = False
+) -> list:
     """
     Definition:
     Run simulation
-    """
 
-    start_time = time.time()
-    events = []
-    new_global_state = initial_state.copy()
+    If archive is given (e.g. archive.ColumnarArchive()), each step is passed to archive.record(state)
+    instead of being appended to a list, and the archive is returned in place of the list of events.
 
-    if not silent:
-        print('Starting simulation...')
+    If checkpoint_dir is given, a checkpoint is saved there every checkpoint_every steps (see checkpoint.py).
+    With resume=True, the run continues from the latest checkpoint in checkpoint_dir, if there is one,
+    and returns the same result as an uninterrupted run would have.
 
-    for i in range(time_steps):
+    If instrumentation is given, timings and operation counts for the run are collected in it
+    (see instrumentation.Instrumentation) and, unless silent, printed at the end.
 
-        # market evolutions
-        new_global_state.evolve()
+    With fast_forward=True, time steps on which no agent is scheduled to wake up (see TradeStrategy.next_wake_up)
+    are skipped over in one go, and only the steps on which agents wake up, and the last step, are recorded.
+    Strategies without a wake_up are woken up on every step, so nothing is skipped while one of them is running.
+    The evolve function is then only called on those steps, so it should depend only on state.time_step,
+    as PricePaths.evolve_function and historical_prices do.
+    """
 
-        # agent actions
-        agent_ids = list(new_global_state.agents.keys())
-        for agent_id in agent_ids:
-            agent = new_global_state.agents[agent_id]
-            if agent.trade_strategy:
-                agent.trade_strategy.execute(new_global_state, agent_id)
+    start_time = time.time()
+    with instrumentation or contextlib.nullcontext():
+        events = []
+        step = 0
+        checkpointer = Checkpointer(checkpoint_dir) if checkpoint_dir else None
+        resumed = checkpointer.resume() if checkpointer and resume else None
+        if resumed:
+            step, new_global_state, saved_events = resumed
+            if step > time_steps:
+                raise ValueError(f'Checkpoint is at step {step}, past the end of the run.')
+            if archive is not None:
+                archive = saved_events
+            else:
+                events = saved_events
+        else:
+            if checkpointer:
+                checkpointer.clear()
+            new_global_state = initial_state.copy()
+            if archive is not None:
+                archive.start(new_global_state, time_steps)
+
+        if not silent:
+            print('Starting simulation...' if not resumed else f'Resuming simulation from step {step}...')
 
-        events.append(new_global_state.archive())
+        # the time step at which step 0 was
+        start = new_global_state.time_step - step
+        saved = step
+        for state in _steps(new_global_state, time_steps - step, instrumentation, fast_forward):
+            archive_start = time.perf_counter() if instrumentation else 0
+            if archive is not None:
+                archive.record(state)
+            else:
+                events.append(state.archive())
+            if instrumentation:
+                instrumentation.time['archive'] += time.perf_counter() - archive_start
+            step = state.time_step - start
+            if checkpointer and step - saved >= checkpoint_every:
+                checkpointer.save(step, state, events if archive is None else archive)
+                saved = step
 
+        if checkpointer:
+            checkpointer.close()
+    if instrumentation:
+        instrumentation.time['total'] += time.time() - start_time
     if not silent:
         print(f'Execution time: {round(time.time() - start_time, 3)} seconds.')
-    return events
+        if instrumentation:
+            print(instrumentation)
+    return events if archive is None else archive
+
+
+def run_stream(initial_state: GlobalState, time_steps: int) -> Iterator:
+    """
+    Same as run, but yields each step's archive as soon as the step is done instead of collecting them,
+    so memory use does not grow with the number of steps. See sinks.py for ways to consume the stream.
+    If initial_state.save_data is set, each item is the usual {datastream: value} dict.
+    """
+    for state in _steps(initial_state.copy(), time_steps):
+        yield state.archive()
@@ -0,0 +1,144 @@
+import math
+from numbers import Number
+from typing import Callable, Iterable, Iterator
+
+import dill
+
+
+class Sink:
+    """
+    Receives the events of a streamed simulation (see run.run_stream) one at a time.
+    write(event) is called once per step, and close() once at the end; close returns the sink's result.
+    """
+    def write(self, event):
+        pass
+
+    def close(self):
+        return None
+
+
+class DiskSink(Sink):
+    """
+    Appends each event to a file as it arrives. Read it back with read_events(path).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def write(self, event):
+        if self.file is None:
+            self.file = open(self.path, 'wb')
+        dill.dump(event, self.file)
+
+    def close(self) -> str:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return self.path
+
+
+def read_events(path: str) -> Iterator:
+    """
+    Yield the events written by a DiskSink, one at a time.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield dill.load(f)
+            except EOFError:
+                return
+
+
+class RunningStats:
+    """
+    Count, mean, standard deviation, min, max and last value of a series, updated one value at a time.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sum_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = None
+
+    def add(self, value: float):
+        # Welford's algorithm
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.sum_sq += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.last = value
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.sum_sq / (self.count - 1)) if self.count > 1 else 0.0
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count, 'mean': self.mean, 'std': self.std, 'min': self.min, 'max': self.max, 'last': self.last
+        }
+
+
+class MetricsSink(Sink):
+    """
+    Keeps running statistics of some metrics instead of the events themselves.
+    metrics is {name: function(event) -> number}. If it is not given, events should be save_data dicts,
+    and every numeric datastream in them is tracked.
+    close() returns {name: {'count', 'mean', 'std', 'min', 'max', 'last'}}.
+    """
+    def __init__(self, metrics: dict[str, Callable] = None):
+        self.metrics = metrics
+        self.stats: dict[str, RunningStats] = {}
+
+    def write(self, event):
+        if self.metrics:
+            values = {name: metric(event) for name, metric in self.metrics.items()}
+        else:
+            values = {name: value for name, value in event.items() if isinstance(value, Number)}
+        for name, value in values.items():
+            if name not in self.stats:
+                self.stats[name] = RunningStats()
+            self.stats[name].add(value)
+
+    def close(self) -> dict:
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+
+class DownsampleSink(Sink):
+    """
+    Keeps only every nth event (the first, the (n+1)th, ...), or passes them on to another sink.
+    close() returns the kept events, or the other sink's result.
+    """
+    def __init__(self, every: int, sink: Sink = None):
+        self.every = every
+        self.sink = sink
+        self.events = []
+        self.count = 0
+
+    def write(self, event):
+        if self.count % self.every == 0:
+            if self.sink is not None:
+                self.sink.write(event)
+            else:
+                self.events.append(event)
+        self.count += 1
+
+    def close(self):
+        return self.sink.close() if self.sink is not None else self.events
+
+
+def stream_to_sinks(events: Iterable, sinks: list[Sink]) -> list:
+    """
+    Feed every event to every sink, e.g.
+        stream_to_sinks(run_stream(initial_state, 100000), [DiskSink('run.pkl'), MetricsSink()])
+    The sinks are closed even if the simulation fails part way. Returns each sink's result, in order.
+    """
+    try:
+        for event in events:
+            for sink in sinks:
+                sink.write(event)
+    finally:
+        results = [sink.close() for sink in sinks]
+    return results
@@ -0,0 +1,220 @@
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import time
+import types
+from numbers import Number
+from typing import Callable
+
+import dill
+import numpy as np
+
+from .amm.global_state import GlobalState
+from .amm.omnipool_amm import OmnipoolState, dynamicadd_asset_fee, dynamicadd_lrna_fee
+from .checkpoint import _write
+from .monte_carlo import run_paths
+
+# constructor parameters which are stored under a different attribute name
+_renamed_parameters = {
+    'imbalance': 'lrna_imbalance',
+    'preferred_stablecoin': 'stablecoin',
+    'last_asset_fee': 'last_fee',
+}
+# constructor parameters that define the shape of the pool, rather than a tunable setting
+_fixed_parameters = {'tokens', 'oracles', 'last_oracle_values', 'update_function', 'unique_id'}
+_dynamic_fees = {
+    'asset_fee': dynamicadd_asset_fee,
+    'lrna_fee': dynamicadd_lrna_fee
+}
+
+
+def parameter_grid(**values: list) -> list[dict]:
+    """
+    Every combination of the given parameter values, e.g.
+    parameter_grid(asset_fee=[0.0025, 0.005], trade_limit_per_block=[0.05, 0.1])
+    """
+    names = list(values.keys())
+    return [dict(zip(names, combo)) for combo in itertools.product(*values.values())]
+
+
+def latin_hypercube(n_points: int, bounds: dict[str: tuple], seed: int = None) -> list[dict]:
+    """
+    Latin hypercube sample of n_points over the given {parameter: (low, high)} ranges.
+    Each range is split into n_points strata, and every stratum is sampled exactly once per parameter.
+    """
+    rng = np.random.default_rng(seed)
+    samples = {}
+    for name, (low, high) in bounds.items():
+        strata = (rng.permutation(n_points) + rng.random(n_points)) / n_points
+        samples[name] = low + strata * (high - low)
+    return [{name: float(samples[name][i]) for name in bounds} for i in range(n_points)]
+
+
+def apply_omnipool_overrides(state: GlobalState, overrides: dict, pool_id: str = 'omnipool') -> GlobalState:
+    """
+    Apply OmnipoolState constructor parameters to an existing pool in state.
+
+    Dotted keys configure a dynamic fee, e.g. {'asset_fee.amplification': 2, 'asset_fee.decay': 0.0005}
+    replaces the asset fee with dynamicadd_asset_fee(amplification=2, decay=0.0005).
+    The key 'seed' is reserved for the simulation seed and is ignored here.
+    """
+    pool: OmnipoolState = state.pools[pool_id]
+    constructor_parameters = inspect.signature(OmnipoolState.__init__).parameters
+    dynamic_fee_args = {}
+    for key, value in overrides.items():
+        if key == 'seed':
+            continue
+        if '.' in key:
+            fee_name, fee_param = key.split('.', 1)
+            if fee_name not in _dynamic_fees:
+                raise ValueError(f'{fee_name} is not a dynamic fee parameter.')
+            dynamic_fee_args.setdefault(fee_name, {})[fee_param] = value
+            continue
+        if key not in constructor_parameters or key in _fixed_parameters or key == 'self':
+            raise ValueError(f'{key} is not a tunable OmnipoolState parameter.')
+        if key == 'withdrawal_fee' and value and not hasattr(pool, 'min_withdrawal_fee'):
+            pool.min_withdrawal_fee = constructor_parameters['min_withdrawal_fee'].default
+        if key == 'last_asset_fee' or key == 'last_lrna_fee':
+            value = {tkn: value for tkn in pool.asset_list} if isinstance(value, Number) else value
+        setattr(pool, _renamed_parameters.get(key, key), value)
+
+    for fee_name, fee_args in dynamic_fee_args.items():
+        setattr(pool, fee_name, _dynamic_fees[fee_name](**fee_args))
+    return state
+
+
+def _canonical(obj, seen: set = None):
+    # a JSON-serializable description of obj that does not depend on object ids or on hash randomization
+    seen = seen if seen is not None else set()
+    if obj is None or isinstance(obj, (bool, str)):
+        return obj
+    if isinstance(obj, Number):
+        return repr(float(obj)) if not isinstance(obj, int) else obj
+    if isinstance(obj, dict):
+        return sorted(
+            [[_canonical(k, seen), _canonical(v, seen)] for k, v in obj.items()], key=lambda kv: json.dumps(kv[0])
+        )
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(item, seen) for item in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted([_canonical(item, seen) for item in obj], key=json.dumps)
+    if id(obj) in seen:
+        return '<cycle>'
+    seen = seen | {id(obj)}
+    if isinstance(obj, types.MethodType):
+        return ['method', _canonical(obj.__func__, seen), _canonical(obj.__self__, seen)]
+    if isinstance(obj, types.CodeType):
+        # constants and names matter as much as the bytecode: ev['DOT'] and ev['HDX'] compile to the same co_code
+        return [
+            'code', hashlib.sha256(obj.co_code).hexdigest(), [_canonical(const, seen) for const in obj.co_consts],
+            list(obj.co_names), list(obj.co_varnames)
+        ]
+    if isinstance(obj, types.FunctionType):
+        return [
+            'function', obj.__qualname__, _canonical(obj.__code__, seen),
+            _canonical(obj.__defaults__, seen), _canonical(obj.__kwdefaults__, seen),
+            [_canonical(cell.cell_contents, seen) for cell in obj.__closure__ or ()]
+        ]
+    if isinstance(obj, np.ndarray):
+        return ['array', obj.shape, hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest()]
+    if isinstance(obj, GlobalState):
+        # asset_list is derived from the pools, agents and market, and its order depends on set iteration
+        return ['GlobalState', _canonical({k: v for k, v in vars(obj).items() if k != 'asset_list'}, seen)]
+    if hasattr(obj, '__dict__'):
+        return [type(obj).__qualname__, _canonical(vars(obj), seen)]
+    return repr(obj)
+
+
+def state_digest(state: GlobalState) -> str:
+    """
+    Hash of everything in state, including the parameters captured by trade strategies and evolve functions.
+    """
+    return hashlib.sha256(json.dumps(_canonical(state)).encode()).hexdigest()
+
+
+def sweep_key(
+        base_digest: str, time_steps: int, point: dict, summarize: Callable = None, apply: Callable = None
+) -> str:
+    """
+    Cache key for one sweep point: a hash of the base state digest, the run length,
+    the parameters and the functions used to apply them and summarize the result.
+    """
+    description = json.dumps([base_digest, time_steps, _canonical(point), _canonical(summarize), _canonical(apply)])
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def run_sweep(
+        initial_state: GlobalState,
+        time_steps: int,
+        points: list[dict],
+        pool_id: str = 'omnipool',
+        apply: Callable[[GlobalState, dict], any] = None,
+        summarize: Callable[[list], any] = None,
+        cache_dir: str = None,
+        seed: int = None,
+        processes: int = None,
+        silent: bool = False
+) -> list:
+    """
+    Run initial_state once for every point in points, in parallel.
+
+    Each point is a dict of overrides, applied by apply(state, point) to a fresh copy of initial_state.
+    By default, the overrides are OmnipoolState constructor parameters for the pool with pool_id
+    (see apply_omnipool_overrides). If a point contains a 'seed' key, that seed is used for the run,
+    otherwise every point uses the same seed.
+
+    If cache_dir is given, each point's result is stored there under sweep_key(...), and points which
+    were already computed are loaded instead of being run again. Every point must then have a seed,
+    either its own or the seed argument: the result of an unseeded run can't be reproduced.
+
+    Returns a list of results in the same order as points.
+    """
+    start_time = time.time()
+    if apply is None:
+        def apply(state: GlobalState, overrides: dict):
+            apply_omnipool_overrides(state, overrides, pool_id)
+
+    seeds = [point['seed'] if 'seed' in point else seed for point in points]
+    if cache_dir is not None and None in seeds:
+        raise ValueError('Every point needs a seed to be cached.')
+    base_digest = state_digest(initial_state)
+    keys = [sweep_key(base_digest, time_steps, {'seed': seed, **point}, summarize, apply) for point in points]
+    results = [None] * len(points)
+    cached = set()
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for i, key in enumerate(keys):
+            path = os.path.join(cache_dir, f'{key}.pkl')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    results[i] = dill.load(f)
+                cached.add(i)
+    # the same point may appear more than once, but only needs to be computed once
+    pending = {}
+    for i, key in enumerate(keys):
+        if i not in cached and key not in pending:
+            pending[key] = i
+
+    if not silent:
+        print(f'Sweep: {len(cached)} points cached, {len(pending)} to compute...')
+
+    new_results = run_paths(
+        initial_state, time_steps,
+        tasks=[(seeds[i], points[i]) for i in pending.values()],
+        summarize=summarize,
+        apply=apply,
+        processes=processes
+    ) if pending else []
+    computed = dict(zip(pending.keys(), new_results))
+    for key, result in computed.items():
+        if cache_dir is not None:
+            _write(os.path.join(cache_dir, f'{key}.pkl'), dill.dumps(result))
+    for i, key in enumerate(keys):
+        if key in computed:
+            results[i] = computed[key]
+
+    if not silent:
+        print(f'Execution time: {round(time.time() - start_time, 3)} seconds.')
+    return results
@@ -0,0 +1,231 @@
+import random
+
+import numpy as np
+import pytest
+
+from hydradx.model.amm.agents import Agent
+from hydradx.model.amm.omnipool_amm import dynamicadd_asset_fee
+from hydradx.model.archive import ColumnarArchive, DeltaArchive, Datastream, DatastreamArchive
+from hydradx.model.plot_utils import get_datastream
+from hydradx.model.run import run
+from hydradx.tests.utils import monte_carlo_state
+
+
+def test_columnar_archive():
+    random.seed(3)
+    initial_state = monte_carlo_state()
+    initial_state.archive_all = False
+    events = run(initial_state, time_steps=20, silent=True)
+    random.seed(3)
+    archive = run(monte_carlo_state(), time_steps=20, silent=True, archive=ColumnarArchive(capacity=5))
+
+    if len(archive) != len(events):
+        raise AssertionError('Wrong number of steps archived.')
+    for i in [0, 7, -1]:
+        event, columnar = events[i], archive[i]
+        if event.time_step != columnar.time_step or event.external_market != columnar.external_market:
+            raise AssertionError('Global values were not archived correctly.')
+        pool, columnar_pool = event.pools['omnipool'], columnar.pools['omnipool']
+        for prop in ['liquidity', 'lrna', 'shares', 'protocol_shares', 'lrna_imbalance', 'last_fee', 'volume_in']:
+            if getattr(pool, prop) != getattr(columnar_pool, prop):
+                raise AssertionError(f'Pool {prop} was not archived correctly.')
+        if vars(pool.oracles['price']) != vars(columnar_pool.oracles['price']):
+            raise AssertionError('Oracle was not archived correctly.')
+        if columnar_pool.usd_price(columnar_pool, 'DOT') != pool.usd_price(pool, 'DOT'):
+            raise AssertionError('Archived pool does not support price functions.')
+        if vars(event.agents['trader']) != vars(columnar.agents['trader']):
+            raise AssertionError('Agent was not archived correctly.')
+
+    if list(archive.columns('pools', 'omnipool', 'liquidity')['HDX']) != [
+        event.pools['omnipool'].liquidity['HDX'] for event in events
+    ]:
+        raise AssertionError('Columns do not match archived events.')
+    if get_datastream(archive, agent='trader', prop='holdings', key='DOT') != get_datastream(
+            events, agent='trader', prop='holdings', key='DOT'
+    ):
+        raise AssertionError('Datastreams do not match.')
+
+
+def test_columnar_archive_new_keys():
+    archive = ColumnarArchive()
+    state = monte_carlo_state()
+    archive.start(state, 2)
+    archive.record(state)
+    state.agents['trader'].holdings[('omnipool', 'HDX')] = 100
+    del state.agents['trader'].holdings['USD']
+    archive.record(state)
+    archive.record(state)
+    if 'USD' not in archive[0].agents['trader'].holdings or ('omnipool', 'HDX') in archive[0].agents['trader'].holdings:
+        raise AssertionError('Earlier rows were changed by new keys.')
+    if archive[2].agents['trader'].holdings != state.agents['trader'].holdings:
+        raise AssertionError('New keys were not archived correctly.')
+
+
+def test_columnar_archive_new_pools():
+    archive = ColumnarArchive()
+    state = monte_carlo_state()
+    archive.start(state, 2)
+    archive.record(state)
+    state.pools['omnipool_2'] = state.pools['omnipool'].copy()
+    state.pools['omnipool_2'].unique_id = 'omnipool_2'
+    state.agents['lp'] = Agent(holdings={'HDX': 100})
+    archive.record(state)
+    del state.pools['omnipool_2']
+    archive.record(state)
+    if 'omnipool_2' in archive[0].pools or 'lp' in archive[0].agents or 'omnipool_2' in archive[2].pools:
+        raise AssertionError('Rebuilt states should only include the pools and agents in the state at that step.')
+    if archive[1].pools['omnipool_2'].liquidity != state.pools['omnipool'].liquidity:
+        raise AssertionError('Pool added mid-run was not archived.')
+    if archive[1].agents['lp'].holdings != {'HDX': 100} or archive[2].agents['lp'].holdings != {'HDX': 100}:
+        raise AssertionError('Agent added mid-run was not archived.')
+    if 'price' not in archive[1].pools['omnipool_2'].oracles:
+        raise AssertionError('Oracles of a pool added mid-run were not archived.')
+
+    # many new keys
+    for i in range(100):
+        state.agents['lp'].holdings[f'TKN{i}'] = i
+        archive.record(state)
+    if archive[-1].agents['lp'].holdings != state.agents['lp'].holdings:
+        raise AssertionError('New keys were not archived correctly.')
+
+
+def test_delta_archive():
+    random.seed(5)
+    events = run(monte_carlo_state(), time_steps=25, silent=True)
+    random.seed(5)
+    archive = run(
+        monte_carlo_state(), time_steps=25, silent=True, archive=DeltaArchive(keyframe_interval=10, cache_size=2)
+    )
+
+    if len(archive) != len(events):
+        raise AssertionError('Wrong number of steps archived.')
+    for i in [24, 3, 0, 15, 14, 16, 9]:
+        event, delta = events[i], archive[i]
+        if event.time_step != delta.time_step or event.external_market != delta.external_market:
+            raise AssertionError('Global values were not archived correctly.')
+        pool, delta_pool = event.pools['omnipool'], delta.pools['omnipool']
+        for prop in ['liquidity', 'lrna', 'shares', 'protocol_shares', 'lrna_imbalance', 'last_fee', 'asset_list']:
+            if getattr(pool, prop) != getattr(delta_pool, prop):
+                raise AssertionError(f'Pool {prop} was not archived correctly.')
+        if vars(pool.oracles['price']) != vars(delta_pool.oracles['price']):
+            raise AssertionError('Oracle was not archived correctly.')
+        if vars(pool.current_block) != vars(delta_pool.current_block):
+            raise AssertionError('Current block was not archived correctly.')
+        if delta_pool.asset_fee['DOT'].exchange is not delta_pool:
+            raise AssertionError('Fee is not attached to the archived pool.')
+        if event.agents['trader'].holdings != delta.agents['trader'].holdings:
+            raise AssertionError('Agent was not archived correctly.')
+
+
+def test_delta_archive_structure_changes():
+    archive = DeltaArchive(keyframe_interval=3)
+    state = monte_carlo_state()
+    archive.start(state, 6)
+    agent = state.agents['trader']
+    archive.record(state)
+    agent.nfts['position'] = {'amounts': [1, 2, 3], 'owner': agent.unique_id}
+    archive.record(state)
+    agent.nfts['position']['amounts'].pop()
+    archive.record(state)
+    agent.nfts['position'] = [5]
+    state.pools['omnipool'].fail = 'failed'
+    archive.record(state)
+    del agent.nfts['position']
+    archive.record(state)
+    expected = [
+        {},
+        {'position': {'amounts': [1, 2, 3], 'owner': 'trader'}},
+        {'position': {'amounts': [1, 2], 'owner': 'trader'}},
+        {'position': [5]},
+        {}
+    ]
+    for i in [4, 0, 2, 1, 3]:
+        if archive[i].agents['trader'].nfts != expected[i]:
+            raise AssertionError('NFTs were not archived correctly.')
+    if archive[3].pools['omnipool'].fail != 'failed' or archive[2].pools['omnipool'].fail != '':
+        raise AssertionError('Keyframe did not preserve pool state.')
+
+
+def test_delta_archive_fee_changes():
+    archive = DeltaArchive(keyframe_interval=10)
+    state = monte_carlo_state()
+    pool = state.pools['omnipool']
+    archive.start(state, 4)
+    archive.record(state)
+    fee = dynamicadd_asset_fee().assign(pool, 'DOT')
+    pool.asset_fee['DOT'] = fee
+    archive.record(state)
+    # fees are reused from the previous step while nothing in them changes
+    fee.time_step = 7
+    archive.record(state)
+    archive.record(state)
+    if type(archive[0].pools['omnipool'].asset_fee['DOT']) is type(fee):
+        raise AssertionError('Replaced fee leaked into an earlier step.')
+    for i, time_step in [(1, -1), (2, 7), (3, 7)]:
+        archived = archive[i].pools['omnipool']
+        if archived.asset_fee['DOT'].time_step != time_step:
+            raise AssertionError('Fee was not archived correctly.')
+        if archived.asset_fee['DOT'].exchange is not archived:
+            raise AssertionError('Fee is not attached to the archived pool.')
+
+
+def test_delta_archive_trade_on_state():
+    random.seed(5)
+    archive = run(monte_carlo_state(), time_steps=8, silent=True, archive=DeltaArchive(keyframe_interval=5))
+    # rebuilt from the keyframe at 5 and two deltas
+    pool = archive[7].pools['omnipool']
+    before = pool.liquidity['DOT']
+    pool.swap(Agent(holdings={'USD': 1000}), tkn_buy='DOT', tkn_sell='USD', sell_quantity=1000)
+    if pool.liquidity['DOT'] >= before:
+        raise AssertionError('Swap did not change the archived pool.')
+    if pool.copy().liquidity != pool.liquidity:
+        raise AssertionError('Copy of the archived pool does not match it.')
+
+
+def test_datastream_archive():
+    datastreams = {
+        'liquidity': Datastream(pool='omnipool', prop='liquidity', key=['HDX', 'DOT']),
+        'dot_oracle': Datastream(pool='omnipool', oracle='price', prop='price', key='DOT'),
+        'fees': Datastream(pool='omnipool', prop='last_fee', key='all'),
+        'imbalance': Datastream(pool='omnipool', prop='lrna_imbalance'),
+        'trader_dot': Datastream(agent='trader', prop='holdings', key='DOT', dtype=np.float32),
+        'dot_price': Datastream(asset='DOT'),
+        'pool_val': Datastream(pool='omnipool', prop='pool_val'),
+    }
+    random.seed(5)
+    events = run(monte_carlo_state(), time_steps=20, silent=True)
+    random.seed(5)
+    archive = run(
+        monte_carlo_state(), time_steps=20, silent=True, archive=DatastreamArchive(datastreams, every=3, capacity=2)
+    )
+    rows = [event for event in events if event.time_step % 3 == 0]
+    if list(archive.time_step[:len(archive)]) != [event.time_step for event in rows]:
+        raise AssertionError('Every third step should be recorded.')
+    if archive['trader_dot'].dtype != np.float32 or archive['imbalance'].dtype != np.float64:
+        raise AssertionError('Datastreams should be recorded with their own dtype.')
+
+    for kwargs in [
+        {'pool': 'omnipool', 'prop': 'liquidity', 'key': 'HDX'},
+        {'pool': 'omnipool', 'oracle': 'price', 'prop': 'price', 'key': 'DOT'},
+        {'pool': 'omnipool', 'prop': 'lrna_imbalance'},
+        {'agent': 'trader', 'prop': 'holdings', 'key': 'DOT'},
+        {'asset': 'DOT'},
+    ]:
+        if get_datastream(archive, **kwargs) != pytest.approx(get_datastream(rows, **kwargs), rel=1e-7):
+            raise AssertionError(f'Recorded datastream {kwargs} does not match the events.')
+    fees = get_datastream(archive, pool='omnipool', prop='last_fee', key='all')
+    if (
+        set(fees) != {'HDX', 'USD', 'DOT'}
+        or list(fees['DOT']) != get_datastream(rows, pool='omnipool', prop='last_fee', key='DOT')
+    ):
+        raise AssertionError('Datastreams with several keys should be recorded for every key.')
+
+    # the same datastreams work as save_data
+    random.seed(5)
+    initial_state = monte_carlo_state()
+    initial_state.datastreams = datastreams
+    saved = run(initial_state, time_steps=20, silent=True)
+    random.seed(5)
+    archive = run(monte_carlo_state(), time_steps=20, silent=True, archive=DatastreamArchive(datastreams))
+    if saved[4]['liquidity'] != archive[4]['liquidity'] or saved[-1]['pool_val'] != archive[-1]['pool_val']:
+        raise AssertionError('save_data and DatastreamArchive should record the same values.')
@@ -0,0 +1,38 @@
+import os
+import tempfile
+
+from hydradx.benchmarks import run_benchmarks, save_results, load_results, compare
+from hydradx.benchmarks.__main__ import main
+from hydradx.benchmarks.workloads import canonical_omnipool
+
+
+def test_workloads_reproducible():
+    if canonical_omnipool().liquidity != canonical_omnipool().liquidity:
+        raise AssertionError('Benchmark workloads should be the same every time.')
+
+
+def test_run_and_compare():
+    names = ['omnipool_swap_direct', 'stableswap_calculate_y']
+    results = run_benchmarks(names, repeats=2)
+    if set(results['benchmarks']) != set(names):
+        raise AssertionError('Wrong benchmarks were run.')
+    for result in results['benchmarks'].values():
+        if len(result['times']) != 2 or not 0 < result['min'] <= result['median']:
+            raise AssertionError('Benchmark timings are inconsistent.')
+
+    slower = {**results, 'benchmarks': {
+        name: {**result, 'per_op': result['per_op'] * (1.5 if name == names[0] else 1.05)}
+        for name, result in results['benchmarks'].items()
+    }}
+    comparison = compare(results, slower, threshold=0.1)
+    if not comparison[names[0]]['regression'] or comparison[names[1]]['regression']:
+        raise AssertionError('Regressions were not flagged correctly.')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_path, new_path = os.path.join(tmp, 'base.json'), os.path.join(tmp, 'new.json')
+        save_results(results, base_path)
+        save_results(slower, new_path)
+        if load_results(base_path) != results:
+            raise AssertionError('Results did not survive saving and loading.')
+        if main(['compare', base_path, new_path]) != 1 or main(['compare', base_path, base_path]) != 0:
+            raise AssertionError('compare should fail only when there is a regression.')
@@ -0,0 +1,105 @@
+import os
+import random
+import tempfile
+
+import dill
+import pytest
+
+from hydradx.model.archive import ColumnarArchive, Datastream, DatastreamArchive, DeltaArchive
+from hydradx.model.run import run
+from hydradx.tests.utils import monte_carlo_state
+
+
+def test_resume():
+    random.seed(11)
+    events = run(monte_carlo_state(), time_steps=20, silent=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        random.seed(11)
+        # the first attempt stops after 13 steps, with checkpoints at steps 5 and 10
+        run(monte_carlo_state(), time_steps=13, silent=True, checkpoint_dir=tmp, checkpoint_every=5)
+        if sorted(os.listdir(tmp)) != [
+            'events_0000000005.pkl', 'events_0000000010.pkl', 'state_0000000005.pkl', 'state_0000000010.pkl'
+        ]:
+            raise AssertionError('Checkpoints were not written.')
+        random.seed(99)
+        resumed = run(
+            monte_carlo_state(), time_steps=20, silent=True, checkpoint_dir=tmp, checkpoint_every=5, resume=True
+        )
+
+    if len(resumed) != len(events):
+        raise AssertionError('Resumed run has the wrong number of events.')
+    for event, resumed_event in zip(events, resumed):
+        if event.time_step != resumed_event.time_step:
+            raise AssertionError('Resumed run has the wrong time steps.')
+        if event.external_market != resumed_event.external_market:
+            raise AssertionError('Random generator state was not restored.')
+        if (
+            event.pools['omnipool'].liquidity != resumed_event.pools['omnipool'].liquidity
+            or event.agents['trader'].holdings != resumed_event.agents['trader'].holdings
+        ):
+            raise AssertionError('Resumed run differs from uninterrupted run.')
+
+
+def test_resume_missing_events():
+    with tempfile.TemporaryDirectory() as tmp:
+        run(monte_carlo_state(), time_steps=10, silent=True, checkpoint_dir=tmp, checkpoint_every=5)
+        os.remove(os.path.join(tmp, 'events_0000000005.pkl'))
+        with pytest.raises(FileNotFoundError):
+            run(monte_carlo_state(), time_steps=20, silent=True, checkpoint_dir=tmp, checkpoint_every=5, resume=True)
+
+
+def test_resume_archive():
+    random.seed(12)
+    archive = run(monte_carlo_state(), time_steps=12, silent=True, archive=ColumnarArchive())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        random.seed(12)
+        run(
+            monte_carlo_state(), time_steps=8, silent=True, archive=ColumnarArchive(),
+            checkpoint_dir=tmp, checkpoint_every=4
+        )
+        resumed = run(
+            monte_carlo_state(), time_steps=12, silent=True, archive=ColumnarArchive(),
+            checkpoint_dir=tmp, checkpoint_every=4, resume=True
+        )
+
+    if len(resumed) != 12:
+        raise AssertionError('Resumed archive has the wrong number of steps.')
+    if list(resumed.columns('pools', 'omnipool', 'lrna')['DOT']) != list(
+            archive.columns('pools', 'omnipool', 'lrna')['DOT']
+    ):
+        raise AssertionError('Resumed archive differs from uninterrupted run.')
+
+
+@pytest.mark.parametrize('new_archive, read', [
+    (ColumnarArchive, lambda archive, i: archive[i].pools['omnipool'].lrna),
+    (
+        lambda: DatastreamArchive({'lrna': Datastream(pool='omnipool', prop='lrna', key='all')}),
+        lambda archive, i: archive[i]['lrna']
+    ),
+    (lambda: DeltaArchive(keyframe_interval=3), lambda archive, i: dict(archive[i].pools['omnipool'].lrna)),
+])
+def test_resume_archive_segments(new_archive, read):
+    random.seed(13)
+    archive = run(monte_carlo_state(), time_steps=12, silent=True, archive=new_archive())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        random.seed(13)
+        run(
+            monte_carlo_state(), time_steps=10, silent=True, archive=new_archive(),
+            checkpoint_dir=tmp, checkpoint_every=4
+        )
+        with open(os.path.join(tmp, 'events_0000000008.pkl'), 'rb') as f:
+            if len(dill.load(f)) != 4:
+                raise AssertionError('Checkpoint should only hold the steps since the previous one.')
+        resumed = run(
+            monte_carlo_state(), time_steps=12, silent=True, archive=new_archive(),
+            checkpoint_dir=tmp, checkpoint_every=4, resume=True
+        )
+
+    if len(resumed) != 12:
+        raise AssertionError('Resumed archive has the wrong number of steps.')
+    for i in range(12):
+        if read(resumed, i) != read(archive, i):
+            raise AssertionError('Resumed archive differs from uninterrupted run.')
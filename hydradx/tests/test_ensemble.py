@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from hydradx.model.amm.agents import Agent
+from hydradx.model.amm.global_state import GlobalState
+from hydradx.model.amm.omnipool_amm import OmnipoolState, slip_fee
+from hydradx.model.amm.price_paths import PricePaths
+from hydradx.model.amm.trade_strategies import omnipool_arbitrage
+from hydradx.model.ensemble import OmnipoolEnsemble, random_swaps, omnipool_arbitrage as ensemble_arbitrage
+from hydradx.model.run import run
+
+
+def ensemble_omnipool() -> OmnipoolState:
+    return OmnipoolState(
+        tokens={
+            'HDX': {'liquidity': 10000000, 'LRNA': 200000},
+            'USD': {'liquidity': 1000000, 'LRNA': 1000000},
+            'DOT': {'liquidity': 100000, 'LRNA': 500000},
+            'ETH': {'liquidity': 300, 'LRNA': 600000}
+        },
+        asset_fee=0.0025,
+        lrna_fee=0.0005,
+        preferred_stablecoin='USD'
+    )
+
+
+def rich_agent(omnipool: OmnipoolState) -> Agent:
+    return Agent(holdings={**{tkn: 1000000000 for tkn in omnipool.asset_list}, 'LRNA': 1000000000})
+
+
+def assert_same_path(ensemble: OmnipoolEnsemble, path: int, omnipool: OmnipoolState, agents: dict[str: Agent]):
+    copy = ensemble.omnipool(path)
+    for tkn in omnipool.asset_list:
+        if copy.liquidity[tkn] != pytest.approx(omnipool.liquidity[tkn], rel=1e-12):
+            raise AssertionError(f'{tkn} liquidity differs on path {path}.')
+        if copy.lrna[tkn] != pytest.approx(omnipool.lrna[tkn], rel=1e-12):
+            raise AssertionError(f'{tkn} LRNA differs on path {path}.')
+        for attr in ('price', 'volume_in', 'volume_out'):
+            expected = getattr(omnipool.oracles['price'], attr)[tkn]
+            if getattr(copy.oracles['price'], attr)[tkn] != pytest.approx(expected, rel=1e-12, abs=1e-9):
+                raise AssertionError(f'{tkn} oracle {attr} differs on path {path}.')
+    if copy.lrna_imbalance != pytest.approx(omnipool.lrna_imbalance, rel=1e-12, abs=1e-9):
+        raise AssertionError(f'LRNA imbalance differs on path {path}.')
+    for agent_id, agent in agents.items():
+        holdings = ensemble.agent(agent_id, path).holdings
+        for tkn in ensemble.index:
+            if holdings[tkn] != pytest.approx(agent.holdings[tkn], rel=1e-12):
+                raise AssertionError(f'{agent_id} holdings of {tkn} differ on path {path}.')
+
+
+def test_swaps_match_omnipool():
+    omnipool = ensemble_omnipool()
+    n_paths = 20
+    ensemble = OmnipoolEnsemble(omnipool, {'trader': rich_agent(omnipool)}, n_paths)
+    copies = [(ensemble_omnipool(), rich_agent(omnipool)) for _ in range(n_paths)]
+    rng = np.random.default_rng(1)
+    tkns = omnipool.asset_list
+    for step in range(12):
+        sell, buy = rng.integers(len(tkns), size=n_paths), rng.integers(len(tkns), size=n_paths)
+        quantity = rng.random(n_paths) * 10000
+        kind = step % 4
+        if kind == 0:
+            ensemble.swap('trader', sell, buy, sell_quantity=quantity, paths=sell != buy)
+        elif kind == 1:
+            ensemble.swap('trader', sell, buy, buy_quantity=quantity / 100, paths=sell != buy)
+        elif kind == 2:
+            ensemble.lrna_swap('trader', sell, delta_qa=-quantity)
+        else:
+            ensemble.lrna_swap('trader', sell, delta_qa=quantity / 10)
+        for k, (pool, agent) in enumerate(copies):
+            tkn_sell, tkn_buy = tkns[sell[k]], tkns[buy[k]]
+            if kind == 0 and tkn_sell != tkn_buy:
+                pool.swap(agent, tkn_buy=tkn_buy, tkn_sell=tkn_sell, sell_quantity=quantity[k])
+            elif kind == 1 and tkn_sell != tkn_buy:
+                pool.swap(agent, tkn_buy=tkn_buy, tkn_sell=tkn_sell, buy_quantity=quantity[k] / 100)
+            elif kind == 2:
+                pool.swap(agent, tkn_buy=tkn_sell, tkn_sell='LRNA', sell_quantity=quantity[k])
+            elif kind == 3:
+                pool.swap(agent, tkn_buy='LRNA', tkn_sell=tkn_sell, buy_quantity=quantity[k] / 10)
+            pool.update()
+        ensemble.update()
+    for k, (pool, agent) in enumerate(copies):
+        assert_same_path(ensemble, k, pool, {'trader': agent})
+
+
+@pytest.mark.parametrize('arb_precision', [1, 3])
+def test_arbitrage_matches_run(arb_precision):
+    omnipool = ensemble_omnipool()
+    initial_prices = {tkn: omnipool.usd_price(omnipool, tkn) for tkn in omnipool.asset_list}
+    paths = PricePaths.random_walk(initial_prices, 20, {'HDX': 3, 'DOT': 2, 'ETH': 2}, n_paths=3, seed=5)
+    ensemble = OmnipoolEnsemble(omnipool, {'arbitrageur': rich_agent(omnipool)}, 3, external_market=initial_prices)
+    history = ensemble.run(20, {'arbitrageur': ensemble_arbitrage(arb_precision=arb_precision)}, prices=paths)
+    if history['liquidity'].shape != (20, 3, 4) or history['holdings']['arbitrageur'].shape != (20, 3, 5):
+        raise AssertionError('History has the wrong shape.')
+    if not np.array_equal(history['external_market'][-1], paths.prices[:, 20]):
+        raise AssertionError('External prices should follow the price paths.')
+
+    for path in range(3):
+        state = GlobalState(
+            pools={'omnipool': ensemble_omnipool()},
+            agents={'arbitrageur': Agent(
+                holdings=rich_agent(omnipool).holdings,
+                trade_strategy=omnipool_arbitrage('omnipool', arb_precision=arb_precision)
+            )},
+            external_market=dict(initial_prices),
+            evolve_function=paths.evolve_function(path)
+        )
+        final_state = run(state, 20, silent=True)[-1]
+        assert_same_path(ensemble, path, final_state.pools['omnipool'], final_state.agents)
+
+
+def test_random_swaps():
+    omnipool = ensemble_omnipool()
+    agent = Agent(holdings={tkn: 10000 for tkn in omnipool.asset_list})
+    ensemble = OmnipoolEnsemble(omnipool, {'trader': agent}, 50, external_market={'HDX': 0.02, 'DOT': 5, 'ETH': 2000})
+    history = ensemble.run(10, {'trader': random_swaps({'HDX': 100, 'DOT': 100, 'ETH': 100})}, seed=3)
+    if np.array_equal(history['liquidity'][-1, 0], history['liquidity'][-1, 1]):
+        raise AssertionError('Paths should trade independently.')
+    if np.any(ensemble.holdings['trader'] < 0):
+        raise AssertionError('Agent sold more than it had.')
+    total = ensemble.liquidity + ensemble.holdings['trader'][:, :-1]
+    initial = np.array([omnipool.liquidity[tkn] + 10000 for tkn in omnipool.asset_list])
+    if not np.allclose(total, initial, rtol=1e-12):
+        raise AssertionError('Assets were created or destroyed.')
+    if not np.array_equal(
+        history['liquidity'],
+        OmnipoolEnsemble(omnipool, {'trader': agent}, 50, external_market={'HDX': 0.02, 'DOT': 5, 'ETH': 2000}).run(
+            10, {'trader': random_swaps({'HDX': 100, 'DOT': 100, 'ETH': 100})}, seed=3
+        )['liquidity']
+    ):
+        raise AssertionError('Runs with the same seed should be the same.')
+
+
+def test_unsupported_pools():
+    omnipool = ensemble_omnipool()
+    omnipool.asset_fee['DOT'] = slip_fee(0.5, minimum_fee=0.0025).assign(omnipool, 'DOT')
+    with pytest.raises(ValueError):
+        OmnipoolEnsemble(omnipool, {}, 2)
@@ -1,6 +1,17 @@
+import random
+
+import pytest
 from hypothesis import given
 
+from hydradx.model.amm import omnipool_amm as oamm
+from hydradx.model.amm.agents import Agent
+from hydradx.model.amm.basilisk_amm import ConstantProductPoolState
 from hydradx.model.amm.global_state import value_assets, GlobalState
+from hydradx.model.amm.omnipool_amm import OmnipoolState
+from hydradx.model.amm.stableswap_amm import StableSwapPoolState
+from hydradx.model.amm.trade_strategies import TradeStrategy, invest_all
+from hydradx.model.run import run
+from hydradx.tests.utils import monte_carlo_state
 from hydradx.tests.strategies_omnipool import reasonable_market_dict, reasonable_holdings
 
 
@@ -18,3 +29,135 @@ def test_adding_usd_to_external_market():
     state = GlobalState(agents={}, pools={}, external_market={'USD': 1, 'DOT': 10})
     state2 = GlobalState(agents={}, pools={}, external_market={'DOT': 10})
     assert state.external_market == state2.external_market
+
+
+def test_track_totals():
+    initial_state = monte_carlo_state()
+    initial_state.agents['lp'] = Agent(
+        holdings={'HDX': 10000, 'USD': 1000, 'DOT': 100}, trade_strategy=invest_all('omnipool', when=5)
+    )
+    initial_state.agents['whale'] = Agent(holdings={'USD': float('inf')})
+    initial_state = GlobalState(
+        agents=initial_state.agents, pools=initial_state.pools, external_market=initial_state.external_market
+    )
+    totals = []
+
+    def record_totals(state: GlobalState, agent_id: str) -> GlobalState:
+        totals.append((state.total_assets(), state.total_wealth()))
+        return state
+    initial_state.agents['auditor'] = Agent(holdings={}, trade_strategy=TradeStrategy(record_totals, 'audit'))
+    # check=True raises if the ledger disagrees with a full recount
+    initial_state.track_totals(check=True)
+    random.seed(4)
+    events = run(initial_state, time_steps=10, silent=True)
+
+    if len(totals) != 10:
+        raise AssertionError('Totals were not recorded.')
+    for event, (assets, wealth) in zip(events, totals):
+        event.ledger = None
+        if assets != pytest.approx(event.total_assets(), rel=1e-12) or wealth != event.total_wealth():
+            raise AssertionError('Tracked totals differ from a full recount.')
+    if totals[-1][0]['USD'] != float('inf'):
+        raise AssertionError('Infinite holdings were not counted.')
+
+
+def test_track_totals_new_agents_and_pools():
+    state = GlobalState(
+        pools={'HDX/USD': ConstantProductPoolState(tokens={'HDX': 1000000, 'USD': 80000}, trade_fee=0.003)},
+        agents={'trader': Agent(holdings={'HDX': 100})},
+        external_market={'HDX': 0.08}
+    )
+    state.track_totals(check=True)
+    state.total_asset('HDX')
+    # the ledger attaches itself again, so these are tracked too (check=True raises if they aren't)
+    state.agents['new trader'] = Agent(holdings={'HDX': 50, 'DOT': 0})
+    state.pools['HDX/DOT'] = ConstantProductPoolState(tokens={'HDX': 500000, 'DOT': 1000}, trade_fee=0.003)
+    if state.total_asset('HDX') != 1500150:
+        raise AssertionError('New agents and pools should be counted.')
+    state.pools['HDX/DOT'].swap(state.agents['new trader'], tkn_sell='HDX', tkn_buy='DOT', sell_quantity=50)
+    del state.agents['trader']
+    if state.total_asset('HDX') != pytest.approx(1500050, rel=1e-12):
+        raise AssertionError('Changes to new agents and pools should be tracked.')
+
+
+def test_cash_out_without_copy():
+    state = GlobalState(
+        pools={
+            'HDX/USD': ConstantProductPoolState(tokens={'HDX': 1000000, 'USD': 80000}, trade_fee=0.003),
+            'stablepool': StableSwapPoolState(tokens={'USDA': 1000000, 'USDB': 1100000}, amplification=100)
+        },
+        agents={'LP': Agent(holdings={'HDX': 100, 'USD': 0, 'USDA': 50, 'USDB': 20000})},
+        external_market={'HDX': 0.08, 'USDA': 1, 'USDB': 1}
+    )
+    lp = state.agents['LP']
+    state.pools['HDX/USD'].add_liquidity(lp, 1000, 'HDX')
+    state.pools['stablepool'].add_liquidity(lp, 20000, 'USDB')
+
+    withdrawn = state.copy()
+    withdrawn.pools['HDX/USD'].remove_liquidity(withdrawn.agents['LP'], lp.holdings['HDX/USD'])
+    withdrawn.pools['stablepool'].remove_uniform(withdrawn.agents['LP'], lp.holdings['stablepool'])
+    expected = value_assets(state.market_prices(lp.holdings), withdrawn.agents['LP'].holdings)
+
+    pools, holdings = {pool_id: pool.liquidity.copy() for pool_id, pool in state.pools.items()}, lp.holdings.copy()
+    GlobalState.copy, original_copy = None, GlobalState.copy
+    try:
+        cash = state.cash_out(lp)
+    finally:
+        GlobalState.copy = original_copy
+    if cash != pytest.approx(expected, rel=1e-12):
+        raise AssertionError(f'cash_out {cash} does not match the value after withdrawing {expected}.')
+    if lp.holdings != holdings or {pool_id: pool.liquidity for pool_id, pool in state.pools.items()} != pools:
+        raise AssertionError('cash_out should not change the pools or the agent.')
+
+
+def test_market_prices():
+    omnipool = OmnipoolState(
+        tokens={'HDX': {'liquidity': 1000000, 'LRNA': 50000}, 'USD': {'liquidity': 100000, 'LRNA': 100000}},
+        preferred_stablecoin='USD'
+    )
+    state = GlobalState(
+        pools={'omnipool': omnipool},
+        agents={'LP': Agent(holdings={'HDX': 1000, 'USD': 1000})},
+        external_market={'HDX': 0.05}
+    )
+    lp = state.agents['LP']
+    omnipool.add_liquidity(lp, 100, 'HDX')
+
+    prices = state.market_prices({})
+    prices['HDX'] = 1
+    if state.market_prices({})['HDX'] != 0.05:
+        raise AssertionError('Changing the returned prices changed the state.')
+    share_price = state.market_prices(lp.holdings)[('omnipool', 'HDX')]
+    if ('omnipool', 'HDX') in state.market_prices({}):
+        raise AssertionError('Share prices should only be included for the shares asked for.')
+    prices = state.market_prices({})
+    if state.market_prices(lp.holdings, prices) != state.market_prices(lp.holdings) or ('omnipool', 'HDX') in prices:
+        raise AssertionError('Prices passed in should be built on, not changed.')
+    if state.cash_out(lp, prices) != state.cash_out(lp):
+        raise AssertionError('cash_out should give the same value with prices passed in.')
+
+    state.external_market['HDX'] = 0.06
+    if state.market_prices({})['HDX'] != 0.06:
+        raise AssertionError('Prices should follow external_market.')
+    omnipool.swap(lp, tkn_buy='HDX', tkn_sell='USD', sell_quantity=500)
+    if state.market_prices(lp.holdings)[('omnipool', 'HDX')] == share_price:
+        raise AssertionError('Share prices should follow the pool.')
+
+    # share prices are only worked out again when the pool changes, whether or not a ledger is listening too
+    state.track_totals(check=True)
+    state.total_asset('HDX')
+    calls = []
+    omnipool.usd_price = lambda pool, tkn: calls.append(tkn) or oamm.usd_price(pool, tkn)
+    omnipool.swap(lp, tkn_buy='USD', tkn_sell='HDX', sell_quantity=100)
+    share_price = state.market_prices(lp.holdings)[('omnipool', 'HDX')]
+    state.cash_out(lp)
+    state.deposit_val(lp)
+    if len(calls) != 1:
+        raise AssertionError('Share prices should be cached while the pool stays the same.')
+    omnipool.swap(lp, tkn_buy='HDX', tkn_sell='USD', sell_quantity=500)
+    if state.market_prices(lp.holdings)[('omnipool', 'HDX')] == share_price or len(calls) != 2:
+        raise AssertionError('Share prices should be worked out again after a trade.')
+    state.total_asset('HDX')  # check=True recounts, so this fails if the ledger missed the trade
+    omnipool.liquidity = {**omnipool.liquidity, 'HDX': omnipool.liquidity['HDX'] * 2}
+    if state.market_prices(lp.holdings)[('omnipool', 'HDX')] != oamm.usd_price(omnipool, 'HDX'):
+        raise AssertionError('Share prices should follow a pool given new liquidity.')
@@ -0,0 +1,60 @@
+import copy
+import random
+import sys
+import types
+
+from hydradx.model.amm.omnipool_amm import OmnipoolState
+from hydradx.model.instrumentation import Instrumentation
+from hydradx.model.run import run
+from hydradx.tests.utils import monte_carlo_state
+
+
+def test_instrumentation():
+    initial_state = monte_carlo_state()
+    initial_state.archive_all = False
+    # the trader can only afford some of its trades, so some of them fail
+    initial_state.agents['trader'].holdings = {'HDX': 10000, 'USD': 10, 'DOT': 10}
+    swap = OmnipoolState.swap
+    instrumentation = Instrumentation()
+    random.seed(6)
+    events = run(initial_state, time_steps=30, silent=True, instrumentation=instrumentation)
+    report = instrumentation.report()
+
+    if OmnipoolState.swap is not swap:
+        raise AssertionError('Instrumentation was not removed after the run.')
+    if report['steps'] != 30 or report['counts']['oracle_updates'] != 30:
+        raise AssertionError('Steps or oracle updates were not counted correctly.')
+    failures = [event.pools['omnipool'].fail for event in events if event.pools['omnipool'].fail]
+    if not failures or sum(report['counts']['fail_transaction'].values()) != len(failures):
+        raise AssertionError('Failed transactions were not counted correctly.')
+    for message in failures:
+        if message not in report['counts']['fail_transaction']:
+            raise AssertionError('Failed transactions were not counted by message.')
+    if not 0 < report['counts']['swaps']['omnipool'] <= 30:
+        raise AssertionError('Swaps were not counted correctly.')
+    if report['counts']['copy'].get('GlobalState') != 1 or report['counts']['copy'].get('OmnipoolState') != 1:
+        raise AssertionError('Copies were not counted correctly.')
+    times = report['time']
+    if set(times['agents']) != {'trader'} or set(times['pool_update']) != {'omnipool'}:
+        raise AssertionError('Times were not recorded by agent and pool.')
+    if not times['total'] >= times['evolve'] >= times['evolve_function'] > 0:
+        raise AssertionError('Phase times are inconsistent.')
+    if times['pool_update']['omnipool'] < times['oracle_update']:
+        raise AssertionError('Oracle updates should be included in the pool update time.')
+
+
+def test_instrumentation_counts_imported_deepcopy():
+    # a module which did `from copy import deepcopy`
+    module = types.ModuleType('imports_deepcopy')
+    exec('from copy import deepcopy\ndef clone(obj):\n    return deepcopy(obj)', vars(module))
+    sys.modules[module.__name__] = module
+    try:
+        with Instrumentation() as instrumentation:
+            module.clone({'HDX': [1, 2]})
+            copy.deepcopy({'DOT': [3]})
+    finally:
+        del sys.modules[module.__name__]
+    if instrumentation.counts['deepcopy'] != 2:
+        raise AssertionError('deepcopy imported into a module was not counted.')
+    if module.deepcopy is not copy.deepcopy:
+        raise AssertionError('Instrumentation was not removed from the module.')
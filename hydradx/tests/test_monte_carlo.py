@@ -0,0 +1,97 @@
+import random
+
+import numpy as np
+import pytest
+
+from hydradx.model.amm.global_state import GlobalState
+from hydradx.model.monte_carlo import run_monte_carlo, path_seeds, run_branches
+from hydradx.model.run import run
+from hydradx.tests.utils import monte_carlo_state, final_dot_price
+
+
+def test_path_seeds():
+    if path_seeds(42, 10) != path_seeds(42, 10):
+        raise AssertionError('Seeds are not reproducible.')
+    if len(set(path_seeds(42, 10))) != 10:
+        raise AssertionError('Seeds are not independent.')
+    if path_seeds(42, 10)[:5] != path_seeds(42, 5):
+        raise AssertionError('Adding paths changed the seeds of existing paths.')
+
+
+def test_monte_carlo_reproducible():
+    initial_state = monte_carlo_state()
+    results = run_monte_carlo(
+        initial_state, time_steps=10, n_paths=4, seed=1, processes=1, summarize=final_dot_price, silent=True
+    )
+    repeat = run_monte_carlo(
+        initial_state, time_steps=10, n_paths=4, seed=1, processes=1, summarize=final_dot_price, silent=True
+    )
+    if results != repeat:
+        raise AssertionError('Monte Carlo results are not reproducible.')
+    if len(set(results)) != 4:
+        raise AssertionError('Paths are not independent.')
+    if initial_state.external_market['DOT'] != 5:
+        raise AssertionError('Initial state was modified.')
+
+
+def test_monte_carlo_keeps_global_rng():
+    random.seed(11)
+    np.random.seed(11)
+    expected = random.random(), np.random.random()
+    random.seed(11)
+    np.random.seed(11)
+    run_monte_carlo(monte_carlo_state(), time_steps=3, n_paths=2, seed=1, processes=1, silent=True)
+    if (random.random(), np.random.random()) != expected:
+        raise AssertionError("Running paths in this process changed the caller's random state.")
+
+
+def test_monte_carlo_process_pool():
+    initial_state = monte_carlo_state()
+    serial = run_monte_carlo(initial_state, time_steps=5, n_paths=3, seed=7, processes=1, silent=True)
+    parallel = run_monte_carlo(initial_state, time_steps=5, n_paths=3, seed=7, processes=2, silent=True)
+    for i in range(3):
+        if len(parallel[i]) != 5:
+            raise AssertionError('Wrong number of events returned.')
+        for tkn in serial[i][-1].pools['omnipool'].liquidity:
+            if parallel[i][-1].pools['omnipool'].liquidity[tkn] != pytest.approx(
+                    serial[i][-1].pools['omnipool'].liquidity[tkn], rel=1e-12
+            ):
+                raise AssertionError('Process pool results differ from serial results.')
+
+
+def stop_trading(state: GlobalState):
+    state.agents['trader'].trade_strategy = None
+
+
+def test_run_branches():
+    initial_state = monte_carlo_state()
+    random.seed(3)
+    straight = run(initial_state, time_steps=20, silent=True)
+    random.seed(3)
+    prefix, branches = run_branches(
+        initial_state, prefix_steps=12, suffix_steps=8, branches=[lambda state: None, stop_trading], processes=1
+    )
+    if [event.time_step for event in prefix] != list(range(1, 13)):
+        raise AssertionError('Wrong prefix returned.')
+    if [event.time_step for event in branches[0]] != list(range(13, 21)):
+        raise AssertionError('Branches should continue from the end of the prefix.')
+    for event, reference in zip(prefix + branches[0], straight):
+        if (
+            event.pools['omnipool'].liquidity != reference.pools['omnipool'].liquidity
+            or event.external_market != reference.external_market
+        ):
+            raise AssertionError(f'Unchanged branch differs from a straight run at step {reference.time_step}.')
+    if branches[1][-1].agents['trader'].holdings != prefix[-1].agents['trader'].holdings:
+        raise AssertionError('Branch was not applied.')
+
+    random.seed(4)
+    parallel = run_branches(
+        initial_state, prefix_steps=5, suffix_steps=5, branches=[{}, {}], seed=1, processes=2,
+        apply=lambda state, overrides: None, summarize=final_dot_price
+    )[1]
+    random.seed(4)
+    if parallel != run_branches(
+        initial_state, prefix_steps=5, suffix_steps=5, branches=[{}, {}], seed=1, processes=1,
+        apply=lambda state, overrides: None, summarize=final_dot_price
+    )[1] or parallel[0] == parallel[1]:
+        raise AssertionError('Seeded branches should be reproducible and independent.')
@@ -1,14 +1,18 @@
 import copy
 import math
+import random
 
 import pytest
 from hypothesis import given, strategies as st  # , settings
 
 # from hydradx.model import run
+from hydradx.model import processing
 from hydradx.model.amm import omnipool_amm as oamm
 from hydradx.model.amm.agents import Agent
-from hydradx.model.amm.global_state import GlobalState
-from hydradx.model.amm.trade_strategies import omnipool_arbitrage, back_and_forth, invest_all, dca_with_lping
+from hydradx.model.amm.global_state import GlobalState, fluctuate_prices
+from hydradx.model.amm.price_paths import PricePaths
+from hydradx.model.amm.trade_strategies import omnipool_arbitrage, back_and_forth, invest_all, dca_with_lping, \
+    withdraw_all, random_swaps, TradeStrategy
 from hydradx.tests.strategies_omnipool import omnipool_reasonable_config, reasonable_market
 from hydradx.model.run import run
 from hydradx.tests.utils import randomize_object
@@ -254,3 +258,155 @@ def test_dca_with_lping(
         raise AssertionError('Agent sell token changed.')
     if agent.holdings[buy_tkn] != pytest.approx(init_buy_tkn, rel=1e-20):
         raise AssertionError('Agent buy token changed.')
+
+
+def test_wake_up():
+    def scheduled_state(poll: bool) -> GlobalState:
+        agents = {
+            'trader': Agent(
+                holdings={'HDX': 100000, 'USD': 10000, 'DOT': 1000},
+                trade_strategy=random_swaps(pool_id='omnipool', amount={'HDX': 1000, 'USD': 100, 'DOT': 100})
+            ),
+            'arbitrageur': Agent(
+                holdings={'HDX': 10 ** 12, 'USD': 10 ** 12, 'DOT': 10 ** 12, 'LRNA': 10 ** 12},
+                trade_strategy=omnipool_arbitrage(pool_id='omnipool', frequency=4)
+            ),
+            'lp': Agent(
+                holdings={'HDX': 10000, 'USD': 1000, 'DOT': 100},
+                trade_strategy=invest_all(pool_id='omnipool', when=6) + withdraw_all(when=15)
+            ),
+            'withdrawer': Agent(holdings={'USD': 0}, trade_strategy=withdraw_all(when=10)),
+        }
+        calls = {agent_id: [] for agent_id in agents}
+        for agent_id, agent in agents.items():
+            strategy = agent.trade_strategy
+            if poll:
+                strategy.wake_up = None
+            execute = strategy.execute
+
+            def counted_execute(state, _agent_id, _execute=execute):
+                calls[_agent_id].append(state.time_step)
+                return _execute(state, _agent_id)
+            strategy.execute = counted_execute
+        state = GlobalState(
+            pools={
+                'omnipool': oamm.OmnipoolState(
+                    tokens={
+                        'HDX': {'liquidity': 1000000, 'LRNA': 20000},
+                        'USD': {'liquidity': 100000, 'LRNA': 100000},
+                        'DOT': {'liquidity': 10000, 'LRNA': 50000}
+                    },
+                    asset_fee=0.0025,
+                    lrna_fee=0.0005
+                )
+            },
+            agents=agents,
+            external_market={'HDX': 0.02, 'DOT': 5},
+            evolve_function=fluctuate_prices(volatility={'HDX': 1, 'DOT': 1})
+        )
+        state.calls = calls
+        return state
+
+    polled_state, scheduled = scheduled_state(poll=True), scheduled_state(poll=False)
+    random.seed(3)
+    polled_events = run(polled_state, time_steps=20, silent=True)
+    random.seed(3)
+    scheduled_events = run(scheduled, time_steps=20, silent=True)
+
+    calls = scheduled.calls
+    if calls['trader'] != list(range(1, 21)):
+        raise AssertionError('Strategies without a wake-up should run every time step.')
+    if calls['arbitrageur'] != [4, 8, 12, 16, 20]:
+        raise AssertionError('Arbitrageur should only be woken up every 4 steps.')
+    if calls['lp'] != list(range(6, 21)):
+        raise AssertionError('LP should be woken up from step 6 on.')
+    if calls['withdrawer'] != [10]:
+        raise AssertionError('Withdrawer should only be woken up once.')
+    for polled, event in zip(polled_events, scheduled_events):
+        if (
+            polled.pools['omnipool'].liquidity != event.pools['omnipool'].liquidity
+            or polled.agents['lp'].holdings != event.agents['lp'].holdings
+        ):
+            raise AssertionError('Scheduled run differs from polling every agent.')
+
+
+def test_agents_changed_mid_run():
+    calls = []
+
+    def record_call(state, agent_id):
+        calls.append((state.time_step, agent_id))
+        return state
+
+    def swap_agents(state, agent_id):
+        if state.time_step == 5:
+            # the same number of agents, so only the change itself shows that they need scheduling again
+            del state.agents['old']
+            state.agents['new'] = Agent(holdings={}, trade_strategy=TradeStrategy(record_call, 'record'))
+        return state
+
+    state = GlobalState(
+        pools={},
+        agents={
+            'manager': Agent(holdings={}, trade_strategy=TradeStrategy(swap_agents, 'swap', wake_up=lambda s, a: 5)),
+            'old': Agent(holdings={}, trade_strategy=TradeStrategy(record_call, 'record'))
+        },
+        external_market={}
+    )
+    run(state, time_steps=8, silent=True)
+    if calls != [(step, 'old') for step in range(1, 5)] + [(step, 'new') for step in range(6, 9)]:
+        raise AssertionError('Agents added or removed mid-run should be scheduled again.')
+
+
+def test_fast_forward_run():
+    omnipool = oamm.OmnipoolState(
+        tokens={
+            'HDX': {'liquidity': 1000000, 'LRNA': 20000},
+            'USD': {'liquidity': 100000, 'LRNA': 100000},
+            'DOT': {'liquidity': 10000, 'LRNA': 50000}
+        },
+        oracles={'short': 9},
+        asset_fee=oamm.dynamicadd_asset_fee(minimum=0.0025, amplification=2, decay=0.0001),
+        lrna_fee=oamm.dynamicadd_lrna_fee(minimum=0.0005, amplification=1, decay=0.0001),
+        preferred_stablecoin='USD'
+    )
+    paths = PricePaths.random_walk({'HDX': 0.02, 'USD': 1, 'DOT': 5}, 100, {'HDX': 1, 'DOT': 1}, seed=2)
+    state = GlobalState(
+        pools={'omnipool': omnipool},
+        agents={
+            'arbitrageur': Agent(
+                holdings={'HDX': 10 ** 12, 'USD': 10 ** 12, 'DOT': 10 ** 12, 'LRNA': 10 ** 12},
+                trade_strategy=omnipool_arbitrage(pool_id='omnipool', frequency=7)
+            ),
+            'lp': Agent(holdings={'HDX': 10000}, trade_strategy=withdraw_all(when=30))
+        },
+        external_market=paths.at(0),
+        evolve_function=paths.evolve_function()
+    )
+    omnipool.add_liquidity(state.agents['lp'], 10000, 'HDX')
+
+    events = {event.time_step: event for event in run(state, time_steps=100, silent=True)}
+    skipped_events = run(state, time_steps=100, silent=True, fast_forward=True)
+    if [event.time_step for event in skipped_events] != sorted({*range(7, 100, 7), 30, 100}):
+        raise AssertionError('Only the steps on which agents wake up, and the last step, should be recorded.')
+    for skipped in skipped_events:
+        event = events[skipped.time_step]
+        if skipped.external_market != event.external_market:
+            raise AssertionError('External prices should be the same.')
+        for tkn in omnipool.asset_list:
+            for values in ('liquidity', 'lrna', 'last_fee', 'last_lrna_fee'):
+                expected = getattr(event.pools['omnipool'], values)[tkn]
+                if getattr(skipped.pools['omnipool'], values)[tkn] != pytest.approx(expected, rel=1e-10):
+                    raise AssertionError(f'Omnipool {values} of {tkn} differs when fast-forwarding.')
+        if skipped.agents['lp'].holdings['HDX'] != pytest.approx(event.agents['lp'].holdings['HDX'], rel=1e-10):
+            raise AssertionError('LP holdings differ when fast-forwarding.')
+
+    # trade volume is measured from the previous recorded state, however many steps were skipped in between
+    processing.postprocessing(skipped_events, optional_params=['trade_volume'])
+    processing.postprocessing(list(events.values()), optional_params=['trade_volume'])
+    for skipped, previous in zip(skipped_events[1:], skipped_events):
+        steps = range(previous.time_step + 1, skipped.time_step + 1)
+        volume = sum([events[step].agents['lp'].trade_volume for step in steps])
+        if skipped.agents['lp'].trade_volume != pytest.approx(volume, rel=1e-10):
+            raise AssertionError('Trade volume differs when fast-forwarding.')
+    if not any(event.agents['arbitrageur'].trade_volume for event in skipped_events):
+        raise AssertionError('Trade volume should be recorded.')
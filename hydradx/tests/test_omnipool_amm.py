@@ -3252,3 +3252,105 @@ def test_cash_out_multiple_positions(trade_sizes: list[float]):
     reference_value = oamm.value_assets(spot_prices, cash_out_agent.holdings)
     if cash_out_value != pytest.approx(reference_value, 1e-20):
         raise AssertionError("Cash out not computed correctly.")
+
+
+@given(
+    omnipool_reasonable_config(token_count=4),
+    st.sampled_from([(2, 3), ('LRNA', 2), (3, 'LRNA'), (2, 0)]),
+    st.floats(min_value=0.0001, max_value=0.01)
+)
+def test_settle_batch_one_intent(initial_state: oamm.OmnipoolState, pair: tuple, trade_size: float):
+    initial_state.lrna_mint_pct = 1.0
+    tkn_sell, tkn_buy = (tkn if tkn == 'LRNA' else initial_state.asset_list[tkn] for tkn in pair)
+    sell_quantity = trade_size * (
+        initial_state.lrna[tkn_buy] if tkn_sell == 'LRNA' else initial_state.liquidity[tkn_sell]
+    )
+    swap_state, batch_state = initial_state.copy(), initial_state.copy()
+    swap_agent = Agent(holdings={tkn_sell: sell_quantity})
+    batch_agent = Agent(holdings={tkn_sell: sell_quantity})
+    swap_state.swap(swap_agent, tkn_sell=tkn_sell, tkn_buy=tkn_buy, sell_quantity=sell_quantity)
+    batch_state.settle_batch(
+        [{'agent': batch_agent, 'tkn_sell': tkn_sell, 'tkn_buy': tkn_buy, 'sell_quantity': sell_quantity}]
+    )
+    for tkn in initial_state.asset_list:
+        if batch_state.liquidity[tkn] != pytest.approx(swap_state.liquidity[tkn], rel=1e-12):
+            raise AssertionError(f'{tkn} liquidity should be the same as after swap().')
+        if batch_state.lrna[tkn] != pytest.approx(swap_state.lrna[tkn], rel=1e-12):
+            raise AssertionError(f'{tkn} LRNA should be the same as after swap().')
+    if batch_state.lrna_imbalance != pytest.approx(swap_state.lrna_imbalance, rel=1e-12):
+        raise AssertionError('LRNA imbalance should be the same as after swap().')
+    if batch_agent.holdings[tkn_buy] != pytest.approx(swap_agent.holdings[tkn_buy], rel=1e-12):
+        raise AssertionError('Agent should get the same as from swap().')
+
+
+def test_settle_batch_netting():
+    initial_state = OmnipoolState(
+        tokens={
+            'HDX': {'liquidity': 10000000, 'LRNA': 200000},
+            'USD': {'liquidity': 1000000, 'LRNA': 1000000},
+            'DOT': {'liquidity': 100000, 'LRNA': 500000},
+        },
+        asset_fee=0.0025,
+        lrna_fee=0.0005
+    )
+    batch_state = initial_state.copy()
+    dot_seller, usd_seller = Agent(holdings={'DOT': 10000}), Agent(holdings={'USD': 50000})
+    intents = [
+        {'agent': dot_seller, 'tkn_sell': 'DOT', 'tkn_buy': 'USD', 'sell_quantity': 5000},
+        {'agent': dot_seller, 'tkn_sell': 'DOT', 'tkn_buy': 'USD', 'sell_quantity': 5000},
+        {'agent': usd_seller, 'tkn_sell': 'USD', 'tkn_buy': 'DOT', 'sell_quantity': 50000},
+    ]
+    batch_state.settle_batch(intents)
+
+    # opposing orders fill each other, so both sides get close to the spot price less fees
+    spot = initial_state.price(initial_state, 'DOT', 'USD')
+    if dot_seller.holdings['USD'] / 10000 < spot * 0.99 or usd_seller.holdings['DOT'] * spot / 50000 < 0.99:
+        raise AssertionError('Opposing orders should be netted.')
+    if dot_seller.holdings['USD'] / 10000 >= spot or usd_seller.holdings['DOT'] * spot / 50000 >= 1:
+        raise AssertionError('Fees should still be charged.')
+    for tkn, agent in (('DOT', usd_seller), ('USD', dot_seller)):
+        if (
+                batch_state.liquidity[tkn] + agent.holdings[tkn]
+                != pytest.approx(initial_state.liquidity[tkn] + (10000 if tkn == 'DOT' else 50000), rel=1e-12)
+        ):
+            raise AssertionError(f'{tkn} should be conserved.')
+
+
+def test_settle_batch_limits():
+    initial_state = OmnipoolState(
+        tokens={
+            'HDX': {'liquidity': 10000000, 'LRNA': 200000},
+            'USD': {'liquidity': 1000000, 'LRNA': 1000000},
+            'DOT': {'liquidity': 100000, 'LRNA': 500000},
+        },
+        asset_fee=0.0025,
+        lrna_fee=0.0005,
+        trade_limit_per_block=0.05
+    )
+    batch_state = initial_state.copy()
+    small_seller, big_seller = Agent(holdings={'DOT': 1000}), Agent(holdings={'DOT': 10000})
+    buyer = Agent(holdings={'USD': 10000})
+    batch_state.settle_batch([
+        {'agent': small_seller, 'tkn_sell': 'DOT', 'tkn_buy': 'USD', 'sell_quantity': 1000},
+        {'agent': big_seller, 'tkn_sell': 'DOT', 'tkn_buy': 'USD', 'sell_quantity': 10000},
+        {'agent': buyer, 'tkn_sell': 'USD', 'tkn_buy': 'HDX', 'buy_quantity': 1000},
+    ])
+    # the intent over the trade limit fails on its own, and the rest of the batch still goes through
+    if small_seller.holdings['DOT'] != 0 or not small_seller.holdings['USD'] > 0:
+        raise AssertionError('Intents within the trade limit should be settled.')
+    if big_seller.holdings['DOT'] != 10000 or 'trade limit' not in batch_state.fail:
+        raise AssertionError('The intent over the trade limit should fail.')
+    if buyer.holdings['HDX'] != pytest.approx(1000, rel=1e-12):
+        raise AssertionError('Intents executed after the batch should still be executed.')
+
+    batch_state = initial_state.copy()
+    batch_state.settle_batch(
+        [{'agent': Agent(holdings={'DOT': 10}), 'tkn_sell': 'DOT', 'tkn_buy': 'USD', 'sell_quantity': 100}]
+    )
+    if not batch_state.fail or batch_state.liquidity != initial_state.liquidity:
+        raise AssertionError('An intent the agent can not pay for should fail.')
+
+    mpf_state = initial_state.copy()
+    mpf_state.liquidity['DOT'] = mpf(100000)
+    with pytest.raises(TypeError):
+        mpf_state.settle_batch([])
@@ -1,3 +1,4 @@
+import copy
 import math
 
 import pytest
@@ -7,7 +8,9 @@ from hypothesis import given, strategies as st
 from hydradx.model.amm import omnipool_amm as oamm
 from hydradx.model.amm.agents import Agent
 from hydradx.model.amm.omnipool_amm import OmnipoolState, value_assets, cash_out_omnipool, dynamicadd_asset_fee
+from hydradx.model.amm.omnipool_amm import dynamicadd_lrna_fee
 from hydradx.tests.strategies_omnipool import reasonable_market_dict, omnipool_reasonable_config, reasonable_holdings
+from hydradx.tests.strategies_omnipool import omnipool_config
 from hydradx.tests.strategies_omnipool import reasonable_pct, asset_number_strategy
 from hydradx.model.processing import get_omnipool, save_omnipool, load_omnipool
 
@@ -328,3 +331,134 @@ def test_save_load():
     omnipool2 = load_omnipool(path=path)
     if repr(omnipool2) != repr(omnipool):
         raise AssertionError('Save and load failed')
+
+
+@given(omnipool_config(token_count=4, sub_pools={'stableswap': {'token_count': 2}}))
+def test_copy(omnipool: OmnipoolState):
+    omnipool.asset_fee = dynamicadd_asset_fee(minimum=0.0025, raise_oracle_name='price')
+    omnipool.update()
+    copy_pool = omnipool.copy()
+    deep_copy = copy.deepcopy(omnipool)
+    for name, value in deep_copy.__dict__.items():
+        if name not in ('asset_fee', 'lrna_fee', 'oracles', 'current_block', 'sub_pools', 'fail'):
+            if getattr(copy_pool, name) != value:
+                raise AssertionError(f'{name} was not copied correctly.')
+    for tkn in omnipool.asset_list:
+        fee = copy_pool.asset_fee[tkn]
+        if fee is omnipool.asset_fee[tkn] or fee.exchange is not copy_pool or fee.fee_function.__self__ is not fee:
+            raise AssertionError('Fees should belong to the copy.')
+        if copy_pool.asset_fee[tkn].compute() != omnipool.asset_fee[tkn].compute():
+            raise AssertionError('Fees were not copied correctly.')
+    if copy_pool.oracles['price'].price != omnipool.oracles['price'].price:
+        raise AssertionError('Oracles were not copied correctly.')
+
+    tkn = omnipool.asset_list[2]
+    stable_tkn = omnipool.sub_pools['stableswap'].asset_list[0]
+    agent = Agent(holdings={tkn: 1000, stable_tkn: 1000})
+    copy_pool.swap(agent, tkn_sell=tkn, tkn_buy='HDX', sell_quantity=100)
+    copy_pool.swap(agent, tkn_sell=stable_tkn, tkn_buy='HDX', sell_quantity=100)
+    copy_pool.update()
+    if (
+        omnipool.liquidity != deep_copy.liquidity
+        or omnipool.sub_pools['stableswap'].liquidity != deep_copy.sub_pools['stableswap'].liquidity
+        or omnipool.oracles['price'].liquidity != deep_copy.oracles['price'].liquidity
+        or omnipool.current_block.volume_in != deep_copy.current_block.volume_in
+    ):
+        raise AssertionError('Changing the copy changed the original.')
+
+
+@given(st.integers(min_value=1, max_value=500))
+def test_fast_forward(blocks: int):
+    def dynamic_omnipool():
+        return OmnipoolState(
+            tokens={
+                'HDX': {'liquidity': 10000000, 'LRNA': 200000},
+                'USD': {'liquidity': 1000000, 'LRNA': 1000000},
+                'DOT': {'liquidity': 100000, 'LRNA': 500000},
+            },
+            oracles={'short': 9, 'price': 20},
+            asset_fee=dynamicadd_asset_fee(minimum=0.0025, amplification=2, decay=0.00001),
+            lrna_fee=dynamicadd_lrna_fee(minimum=0.0005, amplification=1, decay=0.00001),
+            preferred_stablecoin='USD'
+        )
+
+    stepped, skipped = dynamic_omnipool(), dynamic_omnipool()
+    for omnipool in (stepped, skipped):
+        omnipool.update()
+        omnipool.swap(Agent(holdings={'DOT': 10000}), tkn_buy='USD', tkn_sell='DOT', sell_quantity=5000)
+    for _ in range(blocks):
+        stepped.update()
+    skipped.fast_forward(blocks)
+
+    if skipped.time_step != stepped.time_step or skipped.oracles['short'].age != stepped.oracles['short'].age:
+        raise AssertionError('Fast-forward should move on the same number of blocks.')
+    for name, oracle in stepped.oracles.items():
+        for attr in ('liquidity', 'price', 'volume_in', 'volume_out'):
+            for tkn in stepped.asset_list:
+                if getattr(skipped.oracles[name], attr)[tkn] != pytest.approx(getattr(oracle, attr)[tkn], rel=1e-12):
+                    raise AssertionError(f'Oracle {name} {attr} of {tkn} differs after fast-forward.')
+    for tkn in stepped.asset_list:
+        if skipped.last_fee[tkn] != pytest.approx(stepped.last_fee[tkn], rel=1e-12):
+            raise AssertionError(f'Asset fee of {tkn} differs after fast-forward.')
+        if skipped.last_lrna_fee[tkn] != pytest.approx(stepped.last_lrna_fee[tkn], rel=1e-12):
+            raise AssertionError(f'LRNA fee of {tkn} differs after fast-forward.')
+        if skipped.asset_fee[tkn].compute() != skipped.last_fee[tkn]:
+            raise AssertionError('Fees should not be computed again in the same block.')
+
+
+@given(omnipool_config(token_count=4, sub_pools={'stableswap': {'token_count': 2}}))
+def test_savepoint(omnipool: OmnipoolState):
+    omnipool.update()
+    tkn = omnipool.asset_list[2]
+    stable_tkn = omnipool.sub_pools['stableswap'].asset_list[0]
+    agent = Agent(holdings={tkn: 1000, stable_tkn: 1000, 'LRNA': 1000})
+    before, agent_before = omnipool.copy(), agent.copy()
+
+    with omnipool.savepoint(agent):
+        omnipool.swap(agent, tkn_sell=tkn, tkn_buy='HDX', sell_quantity=100)
+        omnipool.swap(agent, tkn_sell=stable_tkn, tkn_buy='HDX', sell_quantity=100)
+        omnipool.swap(agent, tkn_sell='LRNA', tkn_buy=tkn, sell_quantity=100)
+        omnipool.add_liquidity(agent, quantity=100, tkn_add=tkn)
+        omnipool.remove_liquidity(agent, quantity=agent.holdings[('omnipool', tkn)], tkn_remove=tkn)
+        if omnipool.liquidity == before.liquidity:
+            raise AssertionError('Trades inside the savepoint should change the pool.')
+
+    for name in ('liquidity', 'lrna', 'shares', 'protocol_shares', 'lrna_imbalance', 'fail'):
+        if getattr(omnipool, name) != getattr(before, name):
+            raise AssertionError(f'{name} was not restored.')
+    if omnipool.sub_pools['stableswap'].liquidity != before.sub_pools['stableswap'].liquidity:
+        raise AssertionError('Sub-pool was not restored.')
+    for name in ('volume_in', 'volume_out', 'price', 'lps', 'withdrawals'):
+        if getattr(omnipool.current_block, name) != getattr(before.current_block, name):
+            raise AssertionError(f'current_block.{name} was not restored.')
+    if agent.holdings != agent_before.holdings or agent.share_prices != agent_before.share_prices:
+        raise AssertionError('Agent was not restored.')
+
+
+@given(omnipool_config(token_count=4))
+def test_block_fee_cache(omnipool: OmnipoolState):
+    omnipool.asset_fee = dynamicadd_asset_fee(minimum=0.001, amplification=2, raise_oracle_name='price')
+    omnipool.lrna_fee = 0.0005
+    omnipool.update()
+    tkn, other = omnipool.asset_list[2], omnipool.asset_list[3]
+    agent = Agent(holdings={tkn: 1000000, other: 1000000})
+    omnipool.swap(agent, tkn_sell=tkn, tkn_buy=other, sell_quantity=1000)
+    if omnipool.asset_fee[other].block_fee != omnipool.last_fee[other]:
+        raise AssertionError('Cached asset fee does not match the block fee.')
+    if omnipool.lrna_fee[tkn].block_fee != 0.0005:
+        raise AssertionError('Cached LRNA fee does not match the block fee.')
+
+    # changing the fees mid-block must not leave old ones cached
+    omnipool.lrna_fee = 0.002
+    if omnipool.lrna_fee[tkn].block_fee is not None:
+        raise AssertionError('Setting the LRNA fee did not clear the cache.')
+    omnipool.asset_fee[other] = oamm.slip_fee(0.5).assign(omnipool, other)
+    omnipool.swap(agent, tkn_sell=tkn, tkn_buy=other, sell_quantity=1000)
+    if omnipool.asset_fee[other].block_fee is not None:
+        raise AssertionError('Slip fees change with every trade, so they should not be cached.')
+    if omnipool.lrna_fee[tkn].block_fee != 0.002:
+        raise AssertionError('The new LRNA fee should be cached.')
+
+    omnipool.update()
+    if omnipool.asset_fee[tkn].block_fee is not None:
+        raise AssertionError('update() should clear the fee cache.')
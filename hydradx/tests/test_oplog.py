@@ -0,0 +1,64 @@
+import os
+import random
+import tempfile
+
+from hydradx.model.amm.agents import Agent
+from hydradx.model.amm.omnipool_amm import OmnipoolState
+from hydradx.model.amm.trade_strategies import TradeStrategy, constant_swaps
+from hydradx.model.oplog import OpLog, replay
+from hydradx.model.run import run
+from hydradx.tests.utils import monte_carlo_state
+
+
+def test_replay():
+    initial_state = monte_carlo_state()
+    swap = OmnipoolState.swap
+    random.seed(8)
+    with OpLog() as op_log:
+        events = run(initial_state, time_steps=30, silent=True)
+    if OmnipoolState.swap is not swap or op_log.time_steps != 30:
+        raise AssertionError('Operation log was not recorded correctly.')
+    if not 0 < len(op_log) <= 30 or set(op_log.ops['step']) - set(range(1, 31)):
+        raise AssertionError('Operations were not recorded by step.')
+
+    replayed = replay(initial_state, op_log)
+    for event, replayed_event in zip(events, replayed):
+        if (
+            event.pools['omnipool'].liquidity != replayed_event.pools['omnipool'].liquidity
+            or event.agents['trader'].holdings != replayed_event.agents['trader'].holdings
+        ):
+            raise AssertionError('Replay differs from the recorded run.')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ops.npz')
+        op_log.save(path)
+        loaded = OpLog.load(path)
+    if loaded.names != op_log.names or loaded.kinds != op_log.kinds or (loaded.ops != op_log.ops).any():
+        raise AssertionError('Operation log did not survive saving and loading.')
+
+    # the same trades against a pool with higher fees
+    high_fee_state = monte_carlo_state()
+    high_fee_state.pools['omnipool'].asset_fee = 0.01
+    high_fee_events = replay(high_fee_state, loaded)
+    if len(high_fee_events) != 30:
+        raise AssertionError('Replay has the wrong number of steps.')
+    if high_fee_events[-1].pools['omnipool'].liquidity == events[-1].pools['omnipool'].liquidity:
+        raise AssertionError('Fee change had no effect on the replay.')
+
+
+def test_agents_added_mid_run():
+    initial_state = monte_carlo_state()
+
+    def hire(state, agent_id):
+        state.agents['new trader'] = Agent(
+            holdings={'USD': 10000, 'DOT': 0},
+            trade_strategy=constant_swaps('omnipool', sell_quantity=10, sell_asset='USD', buy_asset='DOT')
+        )
+        return state
+    initial_state.agents['recruiter'] = Agent(holdings={}, trade_strategy=TradeStrategy(hire, 'hire', run_once=True))
+    with OpLog() as op_log:
+        run(initial_state, time_steps=10, silent=True)
+    if 'new trader' not in op_log.names:
+        raise AssertionError('Operations of agents added mid-run were not recorded.')
+    if (op_log.ops['agent'] == op_log.names.index('new trader')).sum() != 9:
+        raise AssertionError('Every operation of an agent added mid-run should be recorded.')
@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from hydradx.model.amm.global_state import oscillate_prices, historical_prices
+from hydradx.model.amm.price_paths import PricePaths
+from hydradx.model.monte_carlo import run_paths
+from hydradx.model.run import run
+from hydradx.tests.utils import monte_carlo_state, final_dot_price
+
+
+def test_random_walk():
+    paths = PricePaths.random_walk(
+        {'HDX': 0.02, 'DOT': 5, 'USD': 1}, time_steps=50, volatility={'HDX': 2, 'DOT': 1}, trend={'DOT': 0.1},
+        n_paths=4, seed=7
+    )
+    if paths.prices.shape != (4, 51, 3):
+        raise AssertionError('Wrong shape.')
+    if not np.array_equal(paths.prices[:2], PricePaths.random_walk(
+        {'HDX': 0.02, 'DOT': 5, 'USD': 1}, time_steps=50, volatility={'HDX': 2, 'DOT': 1}, trend={'DOT': 0.1},
+        n_paths=2, seed=7
+    ).prices):
+        raise AssertionError('Paths should depend only on the seed and their position.')
+    if np.array_equal(paths.path('HDX', 0), paths.path('HDX', 1)):
+        raise AssertionError('Paths should be independent.')
+    if not np.all(paths.path('USD', 3) == 1) or np.any(paths.prices <= 0):
+        raise AssertionError('Prices should stay positive, and not move without volatility or trend.')
+    if not np.shares_memory(paths[1:3].prices, paths.prices) or paths[2].at(10) != paths.at(10, path=2):
+        raise AssertionError('Slices should be views of the same paths.')
+
+
+def test_oscillating():
+    volatility, trend = {'HDX': 1, 'DOT': 3}, {'DOT': 0.5}
+    paths = PricePaths.oscillating(
+        {'HDX': 0.02, 'DOT': 5}, time_steps=20, volatility=volatility, trend=trend, period=3
+    )
+    state = monte_carlo_state()
+    state._evolve_function = oscillate_prices(volatility=volatility, trend=trend, period=3)
+    for step in range(1, 21):
+        state.evolve()
+        if paths.at(step) != {tkn: state.external_market[tkn] for tkn in paths.assets}:
+            raise AssertionError(f'Prices differ from oscillate_prices at step {step}.')
+
+
+def test_follow_paths():
+    initial_state = monte_carlo_state()
+    paths = PricePaths.random_walk(
+        initial_state.external_market, time_steps=10, volatility={'DOT': 5}, n_paths=3, seed=1
+    )
+    initial_state._evolve_function = paths.evolve_function(path=2)
+    events = run(initial_state, time_steps=10, silent=True)
+    for state in events:
+        if state.external_market != paths.at(state.time_step, path=2):
+            raise AssertionError('State did not follow the price path.')
+
+    results = run_paths(
+        initial_state, time_steps=10, tasks=[(1, {'path': i}) for i in range(3)],
+        summarize=final_dot_price, apply=paths.apply, processes=1
+    )
+    if results != pytest.approx(paths.prices[:, 10, paths.asset_index['DOT']].tolist(), rel=1e-15):
+        raise AssertionError('Each run should follow its own path.')
+
+
+def test_memory_mapped_prices():
+    price_list = [{'HDX': 0.02 + i / 1000, 'DOT': 5 - i / 100} for i in range(20)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'prices.npy')
+        paths = PricePaths.create(path, ['HDX', 'DOT'], time_steps=19, dtype=np.float32)
+        for tkn in paths.assets:
+            paths.prices[0, :, paths.asset_index[tkn]] = [prices[tkn] for prices in price_list]
+        paths.prices.flush()
+        del paths
+
+        loaded = PricePaths.load(path)
+        if not isinstance(loaded.prices, np.memmap) or loaded.prices.dtype != np.float32:
+            raise AssertionError('Prices should be memory-mapped as they were saved.')
+        state, reference = monte_carlo_state(), monte_carlo_state()
+        state._evolve_function = historical_prices(loaded)
+        reference._evolve_function = historical_prices(price_list)
+        for step in range(1, 20):
+            state.evolve()
+            reference.evolve()
+            for tkn in ['HDX', 'DOT']:
+                if state.external_market[tkn] != pytest.approx(reference.external_market[tkn], rel=1e-6):
+                    raise AssertionError('Memory-mapped prices differ from the price list.')
+        del state, loaded
+
+        PricePaths.from_price_list(price_list).save(path)
+        if PricePaths.load(path, mmap=False).at(7) != price_list[7]:
+            raise AssertionError('Prices did not survive saving and loading.')
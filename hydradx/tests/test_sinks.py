@@ -0,0 +1,62 @@
+import os
+import random
+import tempfile
+
+import pytest
+
+from hydradx.model.amm.global_state import GlobalState
+from hydradx.model.run import run, run_stream
+from hydradx.model.sinks import DiskSink, MetricsSink, DownsampleSink, stream_to_sinks, read_events
+from hydradx.tests.utils import monte_carlo_state
+
+
+class DotPrice:
+    # minimal save_data datastream
+    def assemble(self, state):
+        return lambda s: s.external_market['DOT']
+
+
+def test_run_stream():
+    random.seed(9)
+    events = run(monte_carlo_state(), time_steps=10, silent=True)
+    random.seed(9)
+    streamed = list(run_stream(monte_carlo_state(), time_steps=10))
+    if len(streamed) != len(events):
+        raise AssertionError('Wrong number of events streamed.')
+    for event, streamed_event in zip(events, streamed):
+        if event.pools['omnipool'].liquidity != streamed_event.pools['omnipool'].liquidity:
+            raise AssertionError('Streamed events differ from run().')
+
+
+def test_sinks():
+    base_state = monte_carlo_state()
+    initial_state = GlobalState(
+        pools=base_state.pools,
+        agents=base_state.agents,
+        external_market=base_state.external_market,
+        evolve_function=base_state._evolve_function,
+        save_data={'dot_price': DotPrice()}
+    )
+    random.seed(4)
+    prices = [event['dot_price'] for event in run(initial_state, time_steps=20, silent=True)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'events.pkl')
+        random.seed(4)
+        written, metrics, sampled = stream_to_sinks(
+            run_stream(initial_state, time_steps=20),
+            [DiskSink(path), MetricsSink(), DownsampleSink(every=5)]
+        )
+        if written != path or [event['dot_price'] for event in read_events(path)] != prices:
+            raise AssertionError('Events were not written to disk correctly.')
+
+    stats = metrics['dot_price']
+    if stats['count'] != 20 or stats['last'] != prices[-1] or stats['max'] != max(prices):
+        raise AssertionError('Metrics were not accumulated correctly.')
+    if stats['mean'] != pytest.approx(sum(prices) / 20, rel=1e-12):
+        raise AssertionError('Running mean is wrong.')
+    variance = sum((p - stats['mean']) ** 2 for p in prices) / 19
+    if stats['std'] ** 2 != pytest.approx(variance, rel=1e-9):
+        raise AssertionError('Running standard deviation is wrong.')
+    if [event['dot_price'] for event in sampled] != prices[::5]:
+        raise AssertionError('Downsampling kept the wrong events.')
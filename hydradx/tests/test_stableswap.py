@@ -654,3 +654,18 @@ def test_share_prices(assets, fee, amp):
     withdraw_asset_price = pool.withdraw_asset_spot('USDT')
     if withdraw_asset_price >= spot:
         raise AssertionError('Withdraw asset price should be lower than spot price.')
+
+
+def test_fast_forward_amplification():
+    stepped = StableSwapPoolState(tokens={'USDA': 1000000, 'USDB': 1000000}, amplification=100)
+    stepped.update()
+    stepped.set_amplification(200, 10.5)
+    skipped = stepped.copy()
+    for blocks in (7, 1, 20):
+        for _ in range(blocks):
+            stepped.update()
+        skipped.fast_forward(blocks)
+        if skipped.time_step != stepped.time_step:
+            raise AssertionError('Fast-forward should move on the same number of blocks.')
+        if skipped.amplification != pytest.approx(stepped.amplification, rel=1e-12):
+            raise AssertionError('Amplification should ramp the same way when fast-forwarding.')
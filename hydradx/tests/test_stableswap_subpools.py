@@ -468,6 +468,50 @@ def test_buy_stableswap_for_stableswap(initial_state: oamm.OmnipoolState):
         raise AssertionError('Execution price out of bounds.')
 
 
+@given(omnipool_config(token_count=3, sub_pools={'stableswap1': {}, 'stableswap2': {}}))
+@settings(deadline=500)
+def test_calculate_stable_buy(initial_state: oamm.OmnipoolState):
+    pool_buy: oamm.StableSwapPoolState = initial_state.sub_pools['stableswap1']
+    pool_sell: oamm.StableSwapPoolState = initial_state.sub_pools['stableswap2']
+    omnipool_tkn = initial_state.asset_list[2]
+    buy_quantity = 10
+    routes = [
+        (pool_buy.asset_list[0], 'LRNA', pool_buy, None),
+        (pool_buy.asset_list[0], omnipool_tkn, pool_buy, None),
+        (omnipool_tkn, pool_sell.asset_list[1], None, pool_sell),
+        (pool_buy.asset_list[0], pool_sell.asset_list[1], pool_buy, pool_sell),
+    ]
+    for tkn_buy, tkn_sell, sub_pool_buy, sub_pool_sell in routes:
+        sell_quantity, shares_sold, shares_bought = initial_state.calculate_stable_buy(
+            tkn_buy, tkn_sell, buy_quantity, pool_buy=sub_pool_buy, pool_sell=sub_pool_sell
+        )
+        initial_agent = Agent(holdings={tkn_sell: 10000000000})
+        new_state, new_agent = oamm.simulate_swap(
+            old_state=initial_state,
+            old_agent=initial_agent,
+            tkn_buy=tkn_buy,
+            tkn_sell=tkn_sell,
+            buy_quantity=buy_quantity
+        )
+        if new_state.fail:
+            # transaction failed, doesn't mean there is anything wrong with the mechanism
+            continue
+        if initial_agent.holdings[tkn_sell] - new_agent.holdings[tkn_sell] != pytest.approx(sell_quantity, rel=1e-12):
+            raise AssertionError(f'Quoted sell quantity of {tkn_sell} for {tkn_buy} not matched by swap.')
+        if new_agent.holdings[tkn_buy] != pytest.approx(buy_quantity, rel=1e-12):
+            raise AssertionError(f'Agent did not receive {buy_quantity} {tkn_buy}.')
+        if sub_pool_buy is not None and (
+            sub_pool_buy.shares - new_state.sub_pools[sub_pool_buy.unique_id].shares
+            != pytest.approx(shares_bought, rel=1e-12)
+        ):
+            raise AssertionError(f'Quoted shares withdrawn from {sub_pool_buy.unique_id} not matched by swap.')
+        if sub_pool_sell is not None and (
+            new_state.sub_pools[sub_pool_sell.unique_id].shares - sub_pool_sell.shares
+            != pytest.approx(shares_sold, rel=1e-12)
+        ):
+            raise AssertionError(f'Quoted shares bought in {sub_pool_sell.unique_id} not matched by swap.')
+
+
 @settings(deadline=500)
 @given(omnipool_config(
     token_count=3,
@@ -0,0 +1,132 @@
+import dill
+import pytest
+
+from hydradx.model.amm.global_state import GlobalState
+from hydradx.model.amm.trade_strategies import constant_swaps
+from hydradx.model.sweep import (
+    parameter_grid, latin_hypercube, apply_omnipool_overrides, run_sweep, state_digest, sweep_key
+)
+from hydradx.tests.utils import omnipool_trader_state
+
+
+def sweep_state() -> GlobalState:
+    return omnipool_trader_state(
+        trade_strategy=constant_swaps(pool_id='omnipool', sell_quantity=100, sell_asset='USD', buy_asset='DOT'),
+        holdings={'USD': 100000, 'DOT': 0},
+        oracles={'short': 9}
+    )
+
+
+def dot_bought(events: list) -> float:
+    return events[-1].agents['trader'].holdings['DOT']
+
+
+def test_parameter_grid():
+    grid = parameter_grid(asset_fee=[0.001, 0.002, 0.003], trade_limit_per_block=[0.05, 0.1])
+    if len(grid) != 6:
+        raise AssertionError('Wrong number of grid points.')
+    if {'asset_fee': 0.003, 'trade_limit_per_block': 0.1} not in grid:
+        raise AssertionError('Grid point missing.')
+
+
+def test_latin_hypercube():
+    sample = latin_hypercube(10, {'asset_fee': (0, 0.01), 'lrna_fee': (0.001, 0.002)}, seed=3)
+    if sample != latin_hypercube(10, {'asset_fee': (0, 0.01), 'lrna_fee': (0.001, 0.002)}, seed=3):
+        raise AssertionError('Sample is not reproducible.')
+    # exactly one point in each stratum
+    strata = sorted([int(point['asset_fee'] / 0.001) for point in sample])
+    if strata != list(range(10)):
+        raise AssertionError('Sample is not a latin hypercube.')
+    for point in sample:
+        if not 0.001 <= point['lrna_fee'] <= 0.002:
+            raise AssertionError('Sample out of bounds.')
+
+
+def test_apply_omnipool_overrides():
+    state = sweep_state()
+    apply_omnipool_overrides(state, {
+        'lrna_fee': 0.001,
+        'trade_limit_per_block': 0.1,
+        'asset_fee.amplification': 2,
+        'asset_fee.decay': 0.0005,
+        'asset_fee.raise_oracle_name': 'short'
+    })
+    omnipool = state.pools['omnipool']
+    if omnipool.lrna_fee['DOT'].compute() != 0.001:
+        raise AssertionError('LRNA fee not applied.')
+    if omnipool.trade_limit_per_block != 0.1:
+        raise AssertionError('Trade limit not applied.')
+    if omnipool.asset_fee['DOT'].amplification != 2 or omnipool.asset_fee['DOT'].decay != 0.0005:
+        raise AssertionError('Dynamic fee not applied.')
+    with pytest.raises(ValueError):
+        apply_omnipool_overrides(state, {'tokens': {}})
+    with pytest.raises(ValueError):
+        apply_omnipool_overrides(state, {'not_a_parameter': 1})
+
+
+def test_state_digest():
+    if state_digest(sweep_state()) != state_digest(sweep_state()):
+        raise AssertionError('Digest is not deterministic.')
+    state = sweep_state()
+    state.agents['trader'].trade_strategy = constant_swaps(
+        pool_id='omnipool', sell_quantity=200, sell_asset='USD', buy_asset='DOT'
+    )
+    if state_digest(state) == state_digest(sweep_state()):
+        raise AssertionError('Digest ignores trade strategy parameters.')
+
+
+def test_sweep_cache(tmp_path):
+    initial_state = sweep_state()
+    points = parameter_grid(asset_fee=[0.001, 0.01])
+    results = run_sweep(
+        initial_state, time_steps=3, points=points, summarize=dot_bought, cache_dir=str(tmp_path), seed=1,
+        silent=True
+    )
+    if not results[0] > results[1]:
+        raise AssertionError('Higher fee should result in less DOT bought.')
+    if len(list(tmp_path.iterdir())) != 2:
+        raise AssertionError('Results were not cached.')
+
+    # cached points are loaded, not recomputed
+    for file in tmp_path.iterdir():
+        file.write_bytes(dill.dumps(-1))
+    more_points = points + parameter_grid(asset_fee=[0.005])
+    more_results = run_sweep(
+        initial_state, time_steps=3, points=more_points, summarize=dot_bought, cache_dir=str(tmp_path), seed=1,
+        silent=True
+    )
+    if more_results[:2] != [-1, -1]:
+        raise AssertionError('Cached points were recomputed.')
+    if not results[0] > more_results[2] > results[1]:
+        raise AssertionError('New point computed incorrectly.')
+    if len(list(tmp_path.iterdir())) != 3:
+        raise AssertionError('New point was not cached.')
+
+    # an unseeded run can't be reproduced, so it can't be cached either
+    with pytest.raises(ValueError):
+        run_sweep(initial_state, 3, points, summarize=dot_bought, cache_dir=str(tmp_path), silent=True)
+    run_sweep(
+        initial_state, time_steps=3, points=[{'seed': 2, **point} for point in points], summarize=dot_bought,
+        cache_dir=str(tmp_path), silent=True
+    )
+    if len(list(tmp_path.iterdir())) != 5:
+        raise AssertionError('Points with their own seeds were not cached.')
+
+
+def test_sweep_cache_summarize_constants(tmp_path):
+    # these differ only in a constant, so they compile to the same bytecode
+    summarize_dot = lambda events: events[-1].external_market['DOT']
+    summarize_hdx = lambda events: events[-1].external_market['HDX']
+    if sweep_key('digest', 3, {}, summarize_dot) == sweep_key('digest', 3, {}, summarize_hdx):
+        raise AssertionError('Sweep key ignores constants.')
+    holdings = lambda events: events[-1].agents['trader'].holdings
+    initial_holdings = lambda events: events[-1].agents['trader'].initial_holdings
+    if sweep_key('digest', 3, {}, holdings) == sweep_key('digest', 3, {}, initial_holdings):
+        raise AssertionError('Sweep key ignores attribute names.')
+
+    initial_state = sweep_state()
+    points = parameter_grid(asset_fee=[0.001])
+    dot = run_sweep(initial_state, 3, points, summarize=summarize_dot, cache_dir=str(tmp_path), seed=1, silent=True)
+    hdx = run_sweep(initial_state, 3, points, summarize=summarize_hdx, cache_dir=str(tmp_path), seed=1, silent=True)
+    if dot != [5] or hdx != [0.02]:
+        raise AssertionError('Cached results of one summarize function were used for another.')
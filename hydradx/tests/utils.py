@@ -1,5 +1,11 @@
 import random
 
+from hydradx.model.amm.agents import Agent
+from hydradx.model.amm.global_state import GlobalState, fluctuate_prices
+from hydradx.model.amm.omnipool_amm import OmnipoolState
+from hydradx.model.amm.trade_strategies import random_swaps
+
+
 def randomize_object(obj):
     if type(obj) == dict:
         return {key: randomize_object(obj[key]) for key in obj}
@@ -19,3 +25,37 @@ def randomize_object(obj):
         for prop in obj.__dict__:
             setattr(obj, prop, randomize_object(getattr(obj, prop)))
         return obj
+
+
+def omnipool_trader_state(trade_strategy, holdings: dict, oracles: dict = None, evolve_function=None) -> GlobalState:
+    """ a small HDX/USD/DOT Omnipool with one agent, 'trader', who trades in it with trade_strategy """
+    return GlobalState(
+        pools={
+            'omnipool': OmnipoolState(
+                tokens={
+                    'HDX': {'liquidity': 1000000, 'LRNA': 20000},
+                    'USD': {'liquidity': 100000, 'LRNA': 100000},
+                    'DOT': {'liquidity': 10000, 'LRNA': 50000}
+                },
+                oracles=oracles,
+                asset_fee=0.0025,
+                lrna_fee=0.0005
+            )
+        },
+        agents={'trader': Agent(holdings=holdings, trade_strategy=trade_strategy)},
+        external_market={'HDX': 0.02, 'DOT': 5},
+        evolve_function=evolve_function
+    )
+
+
+def monte_carlo_state() -> GlobalState:
+    """ omnipool_trader_state with random swaps and fluctuating prices, so that every path is different """
+    return omnipool_trader_state(
+        trade_strategy=random_swaps(pool_id='omnipool', amount={'HDX': 1000, 'USD': 100, 'DOT': 100}),
+        holdings={'HDX': 100000, 'USD': 10000, 'DOT': 1000},
+        evolve_function=fluctuate_prices(volatility={'HDX': 1, 'DOT': 1})
+    )
+
+
+def final_dot_price(events: list) -> float:
+    return events[-1].external_market['DOT']